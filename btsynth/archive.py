@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+"""
+Indexed archives of many gridworlds.
+
+An archive is a sequence of records, each holding a world (with
+occupancy bit-packed), its goal, init and env lists, and a vector of
+floats for whatever the caller keeps with it (e.g., timings of a
+trial).  Records are appended by WorldArchiveWriter without rewriting
+earlier ones, and the index of record offsets written on closing lets
+WorldArchiveReader load any record without parsing the others.
+
+Layout (all integers are little-endian int64, floats are float64):
+the magic string ARCHIVE_MAGIC and version number; then records, each
+being the number of rows and columns, lengths of the goal, init and
+env lists and of the data vector, the packed occupancy (row-major,
+padded to a multiple of 8 bytes), the (row, column) pairs of the
+lists, and the data; then INDEX_MAGIC, the record offsets, their
+number, the offset of the index, and INDEX_MAGIC again.  If the
+index is missing (e.g., the writer was interrupted), then it is
+rebuilt by scanning the records.
+
+SCL; 2012.
+"""
+
+import os
+import numpy as np
+
+from gridworld import world_matrix
+
+
+ARCHIVE_MAGIC = "BTWARCH\0"
+INDEX_MAGIC = "BTWINDEX"
+ARCHIVE_VERSION = 1
+
+_START = len(ARCHIVE_MAGIC)+8
+_RECORD_HEADER = 6*8
+_FOOTER = 2*8+len(INDEX_MAGIC)
+
+
+def _record_size(header):
+    """Size in bytes of a record, given its header."""
+    (num_rows, num_cols) = (int(header[0]), int(header[1]))
+    num_packed = (num_rows*num_cols+7)/8
+    return (_RECORD_HEADER+num_packed+(-num_packed % 8)
+            +16*int(header[2]+header[3]+header[4])+8*int(header[5]))
+
+
+class WorldArchiveWriter:
+    """Append worlds to an archive file.
+
+    If append is True and fname exists, then records are added to
+    those already in it; otherwise, the file is created (or
+    truncated).  Each record is flushed to the file as it is
+    appended, and the index is written by close.
+    """
+    def __init__(self, fname, append=False):
+        if append and os.path.exists(fname):
+            reader = WorldArchiveReader(fname)
+            self.offsets = list(reader.offsets)
+            data_end = reader.data_end
+            reader.close()
+            self.f = open(fname, "r+b")
+            self.f.seek(data_end)
+            self.f.truncate()
+        else:
+            self.offsets = []
+            self.f = open(fname, "wb")
+            self.f.write(ARCHIVE_MAGIC)
+            self.f.write(np.array([ARCHIVE_VERSION], dtype="<i8").tostring())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def append(self, W, goal_list=[], init_list=[], env_list=[], data=[]):
+        """Append record; W may be an instance of World.
+
+        Only occupancy is kept, i.e., nonzero entries of W are read
+        back as 1.  data is a sequence of floats.
+        """
+        W = world_matrix(W)
+        data = np.array(data, dtype="<f8").flatten()
+        lists = [goal_list, init_list, env_list]
+        header = np.array([W.shape[0], W.shape[1]]+[len(l) for l in lists]
+                          +[len(data)], dtype="<i8")
+        packed = np.packbits(np.asarray(W).flatten() != 0)
+        coords = np.array([loc for l in lists for loc in l], dtype="<i8")
+        self.offsets.append(self.f.tell())
+        self.f.write(header.tostring())
+        self.f.write(packed.tostring())
+        self.f.write("\0"*(-len(packed) % 8))
+        self.f.write(coords.tostring())
+        self.f.write(data.tostring())
+        self.f.flush()
+
+    def close(self):
+        """Write the index and close the file."""
+        if self.f is None:
+            return
+        index_offset = self.f.tell()
+        self.f.write(INDEX_MAGIC)
+        self.f.write(np.array(self.offsets, dtype="<i8").tostring())
+        self.f.write(np.array([len(self.offsets), index_offset], dtype="<i8").tostring())
+        self.f.write(INDEX_MAGIC)
+        self.f.close()
+        self.f = None
+
+
+class WorldArchiveReader:
+    """Random access to the records of an archive file.
+
+    len gives the number of records, and indexing (or iteration)
+    gives records as tuples (W, goal_list, init_list, env_list, data),
+    where W is a uint8 array and data is a float array.  Only the
+    requested record is read.
+    """
+    def __init__(self, fname):
+        self.f = open(fname, "rb")
+        if self.f.read(len(ARCHIVE_MAGIC)) != ARCHIVE_MAGIC:
+            raise ValueError("not a world archive: "+str(fname))
+        version = np.fromstring(self.f.read(8), dtype="<i8")[0]
+        if version != ARCHIVE_VERSION:
+            raise ValueError("unsupported world archive version "+str(version))
+        self.f.seek(0, os.SEEK_END)
+        file_size = self.f.tell()
+        self.offsets = None
+        if file_size >= _START+_FOOTER:
+            self.f.seek(file_size-_FOOTER)
+            footer = self.f.read(_FOOTER)
+            if footer[16:] == INDEX_MAGIC:
+                (count, index_offset) = np.fromstring(footer[:16], dtype="<i8")
+                self.f.seek(index_offset+len(INDEX_MAGIC))
+                self.offsets = np.fromstring(self.f.read(8*count), dtype="<i8")
+                self.data_end = int(index_offset)
+        if self.offsets is None:
+            self._scan(file_size)
+
+    def _scan(self, file_size):
+        """Build index by reading record headers, through the last
+        complete record."""
+        offsets = []
+        offset = _START
+        while offset+_RECORD_HEADER <= file_size:
+            self.f.seek(offset)
+            head = self.f.read(_RECORD_HEADER)
+            if head.startswith(INDEX_MAGIC):
+                break
+            size = _record_size(np.fromstring(head, dtype="<i8"))
+            if offset+size > file_size:
+                break
+            offsets.append(offset)
+            offset += size
+        self.offsets = np.array(offsets, dtype="<i8")
+        self.data_end = offset
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def _header(self, k):
+        if k < 0:
+            k += len(self.offsets)
+        if k < 0 or k >= len(self.offsets):
+            raise IndexError("world archive record index out of range")
+        self.f.seek(self.offsets[k])
+        return np.fromstring(self.f.read(_RECORD_HEADER), dtype="<i8")
+
+    def data(self, k):
+        """Return only the data vector of record k."""
+        header = self._header(k)
+        self.f.seek(self.offsets[k]+_record_size(header)-8*int(header[5]))
+        return np.fromstring(self.f.read(8*int(header[5])), dtype="<f8")
+
+    def __getitem__(self, k):
+        header = self._header(k)
+        (num_rows, num_cols) = (int(header[0]), int(header[1]))
+        lengths = [int(n) for n in header[2:5]]
+        num_packed = (num_rows*num_cols+7)/8
+        packed = np.fromstring(self.f.read(num_packed+(-num_packed % 8)), dtype=np.uint8)
+        W = np.unpackbits(packed)[:num_rows*num_cols].reshape((num_rows, num_cols))
+        coords = np.fromstring(self.f.read(16*sum(lengths)), dtype="<i8").reshape((-1, 2))
+        coords = [(int(i), int(j)) for (i, j) in coords]
+        data = np.fromstring(self.f.read(8*int(header[5])), dtype="<f8")
+        return (W, coords[:lengths[0]], coords[lengths[0]:lengths[0]+lengths[1]],
+                coords[lengths[0]+lengths[1]:], data)
+
+    def __iter__(self):
+        for k in range(len(self.offsets)):
+            yield self[k]
+
+    def close(self):
+        self.f.close()
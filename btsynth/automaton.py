@@ -8,9 +8,32 @@ Scott C. Livingston,
 
 from gridworld import extract_autcoord, extract_coord
 
+import os
+import re
+import sys
+import ast
+import pickle
 import random
 import copy
+import numpy as np
 import tulip.automaton
+import xml.etree.cElementTree as ET
+from xml.sax.saxutils import quoteattr
+
+
+def _coord_label(varname, nil=True):
+    """Label of position variable for drawing, e.g., "Y (2, 3)" for
+    Y_2_3, or None if varname is not of that form (cf. extract_coord).
+    If nil is True, then the nowhere position is labeled "(nil)".
+    """
+    coord = extract_coord(varname)
+    if coord is None:
+        return None
+    # Be aggressive about prefix spacing
+    label_str = "".join(coord[0].split("_"))
+    if nil and coord[1:] == (-1, -1):
+        return label_str+" (nil)"
+    return label_str+" ("+str(coord[1])+", "+str(coord[2])+")"
 
 
 class BTAutomatonNode(tulip.automaton.AutomatonState):
@@ -142,7 +165,20 @@ class BTAutomaton(tulip.automaton.Automaton):
     particular w.r.t. my draft paper.
 
     Note that nodes in this class are BTAutomatonNode objects.
+
+    Changes made by methods of this class can be undone using
+    snapshot and rollback.  Code that changes nodes in place
+    (e.g., assigning to transition) should obtain them with editNode,
+    rather than getAutState, so that such changes are undone too.
+    For the same reason, such changes are recorded in the journal
+    (cf. openJournal), if there is one.
     """
+    # Undo log, and positions in it of snapshots; cf. snapshot
+    _undo_log = None
+    _undo_marks = None
+    _undo_saved = None  # Nodes (by id) already saved since last snapshot
+    _journal = None  # PatchJournal, cf. openJournal
+
     def __init__(self, states_or_file=[], varnames=[], verbose=0,
                  tulip_aut=None):
         if tulip_aut is not None:
@@ -156,6 +192,167 @@ class BTAutomaton(tulip.automaton.Automaton):
         # None indicates memory uninitialized; thus behaviorally
         # equivalent to automaton without memory.
 
+    def snapshot(self):
+        """Begin recording changes, so that they can be undone.
+
+        Return snapshot handle, for use with rollback or release.
+        Snapshots may be nested.  Taking a snapshot is O(1); nodes are
+        copied (into an undo log) only when they are first changed
+        afterward, and only the changed parts of self.states are
+        recorded, so rollback takes time proportional to the number of
+        changes.
+        """
+        if self._undo_log is None:
+            self._undo_log = []
+            self._undo_marks = []
+        self._undo_marks.append(len(self._undo_log))
+        self._undo_saved = set()
+        if self._journal is not None:
+            self._journal.marks.append(self._journal.position())
+        return len(self._undo_marks)-1
+
+    def rollback(self, snap=None):
+        """Undo all changes since snapshot snap (default is the last one).
+
+        The snapshot, and any taken after it, are released.  Node
+        objects are restored in place, so references to them (e.g.,
+        as in S0 of removeFalseInits) remain valid.
+
+        Journal records of the undone changes are dropped; if some
+        were already written (by flushJournal), then the journal is
+        compacted instead.
+        """
+        if self._undo_log is None:
+            raise ValueError("no snapshot to roll back to.")
+        if snap is None:
+            snap = len(self._undo_marks)-1
+        mark = self._undo_marks[snap]
+        while len(self._undo_log) > mark:
+            entry = self._undo_log.pop()
+            if entry[0] == "node":
+                (node, (node.id, node.state, node.transition, node.cond,
+                        node.rule, node.tags)) = entry[1:]
+            elif entry[0] == "truncate":
+                del self.states[entry[1]:]
+            elif entry[0] == "insert":
+                self.states.insert(entry[1], entry[2])
+            elif entry[0] == "states":
+                self.states = entry[1]
+            elif entry[0] == "memory":
+                self.memory = entry[1]
+        if (self._journal is not None) and not self._journal.rewind(snap):
+            self.compactJournal()
+        self.release(snap)
+
+    def release(self, snap=None):
+        """Keep changes, and discard snapshot snap (default is the last one)
+        and any taken after it."""
+        if self._undo_log is None:
+            raise ValueError("no snapshot to release.")
+        if snap is None:
+            snap = len(self._undo_marks)-1
+        del self._undo_marks[snap:]
+        self._undo_saved = set()
+        if self._journal is not None:
+            del self._journal.marks[snap:]
+        if len(self._undo_marks) == 0:
+            self._undo_log = None
+            self._undo_marks = None
+            self._undo_saved = None
+
+    def _log(self, entry):
+        if self._undo_log is not None:
+            self._undo_log.append(entry)
+
+    def _saveNode(self, node):
+        """Record node in undo log, if not already since last snapshot."""
+        if (self._undo_log is not None) and (id(node) not in self._undo_saved):
+            self._undo_saved.add(id(node))
+            self._undo_log.append(("node", node,
+                                   (node.id, copy.copy(node.state), node.transition[:],
+                                    node.cond[:], node.rule, copy.copy(node.tags))))
+
+    def editNode(self, node_id):
+        """Return node with given ID, to be changed in place.
+
+        Same as getAutState, except that the node is first recorded
+        for rollback (if a snapshot is active), and its contents are
+        journaled (if there is a journal) when the next change is
+        recorded or the journal is flushed.  Thus editNode should be
+        called again to change the node after any other change to the
+        automaton.
+        """
+        node = self.getAutState(node_id)
+        if node != -1:
+            self._saveNode(node)
+            if self._journal is not None:
+                self._journal.touch(node)
+        return node
+
+    def _journalOp(self, *record):
+        if self._journal is not None:
+            self._journal.append(record)
+
+    def openJournal(self, dirname, append=False, compact_ratio=1.0):
+        """Record changes to this automaton in a journal in directory dirname.
+
+        Unless append is True, the automaton is first saved to dirname
+        by write_autb, as the base for an empty journal.  If append is
+        True, then the automaton should be that read from dirname by
+        read_autb (i.e., the base with the journal replayed), and
+        records are added to the existing journal.
+
+        Recorded are: adding nodes (including by importChildAut and
+        spliceGridPath), removing them (removeNode,
+        trimUnconnectedStates, etc.), packIDs, cleanDuplicateTrans,
+        minimize, fleshOutGridState, allRule, allTag, memInit, memSet,
+        and changes to nodes obtained by editNode (e.g., rewiring
+        edges or assigning transition-conditionals).  Changes of
+        memory contents by executing the automaton (triggerRule) are
+        not recorded.
+
+        Records are kept in memory until flushJournal is called, which
+        compacts the journal (cf. compactJournal) if it has become
+        larger than compact_ratio times the base; compact_ratio=None
+        disables this.  As with write_autb, conditionals and rules
+        must be module-level functions.
+        """
+        if self._undo_log is not None:
+            raise ValueError("cannot open journal while a snapshot is active.")
+        if self._journal is not None:
+            self.closeJournal()
+        if not append:
+            write_autb(self, dirname)
+        self._journal = PatchJournal(dirname, append=append)
+        self._journal.compact_ratio = compact_ratio
+
+    def flushJournal(self):
+        """Write journal records, and compact the journal if it is large.
+
+        Does nothing if there is no journal.
+        """
+        if self._journal is None:
+            return
+        self._journal.flush()
+        if ((self._journal.compact_ratio is not None)
+            and (self._journal.size() > self._journal.compact_ratio*self._journal.base_size)):
+            self.compactJournal()
+
+    def compactJournal(self):
+        """Fold journal into its base, i.e., save this automaton as the
+        base of an empty journal."""
+        if self._journal is None:
+            raise ValueError("no journal to compact.")
+        self._journal.reset(self)
+
+    def closeJournal(self):
+        """Flush and close journal; changes are no longer recorded."""
+        if self._journal is None:
+            return
+        self.flushJournal()
+        self._journal.close()
+        self._journal = None
+
     def recastBTAutNodes(self):
         """Cast any nodes of class tulip.AutomatonState into BTAutomatonNode.
         
@@ -173,9 +370,25 @@ class BTAutomaton(tulip.automaton.Automaton):
 
     def allTag(self, tags):
         """Apply a copy of given tags to all member nodes."""
+        self._journalOp("tag_all", tags)
         for k in range(len(self.states)):
+            self._saveNode(self.states[k])
             self.states[k].tags = copy.copy(tags)
 
+    def allRule(self, rule):
+        """Set node rules to "rule" for all member nodes.
+
+        Return True on success, False if rule is not valid (cf.
+        BTAutomatonNode.addNodeRule).
+        """
+        if not (callable(rule) or (rule is None)):
+            return False
+        self._journalOp("rule_all", rule)
+        for node in self.states:
+            self._saveNode(node)
+            node.addNodeRule(rule)
+        return True
+
     def trimDeadStates(self):
         """Replace corresponding method from TuLiP Automaton."""
         while True:
@@ -189,21 +402,61 @@ class BTAutomaton(tulip.automaton.Automaton):
                 self.removeNode(k_ID)
         self.packIDs()
 
-    def trimUnconnectedStates(self):
-        """Wrap method from TuLiP Automaton to get BTAutomatonNode nodes.
+    def trimUnconnectedStates(self, S0=None):
+        """Remove all nodes that are not reachable from S0.
+
+        S0 should be a list of nodes (not IDs!), as in
+        removeFalseInits; nodes of S0 that are no longer in the
+        automaton are ignored.  If S0 is None (default), then
+        getAutInit() is used.  If no node of S0 remains (e.g., S0 is
+        from getAutInit and every node is on a cycle), then nothing
+        is removed, rather than everything.  Transitions are followed
+        regardless of cond, i.e., as if enabled under some memory
+        contents.
+
+        Reachable nodes are found by breadth-first search, and the
+        others are then dropped in a single pass over self.states, so
+        time is linear in the size of the automaton.  Cf. the
+        (repeated) removeNode calls of removeFalseInits.
+
+        Does *not* re-map IDs.  Return number of nodes removed.
         """
-        raise Exception("METHOD NOT SUPPORTED")
-        tulip.automaton.Automaton.trimUnconnectedStates(self)
-        self.recastBTAutNodes()
+        if S0 is None:
+            S0 = self.getAutInit()
+        nodes = dict([(node.id, node) for node in self.states])
+        reached = set([node.id for node in S0 if nodes.get(node.id) is node])
+        if len(reached) == 0:
+            return 0
+        frontier = list(reached)
+        while len(frontier) > 0:
+            next_frontier = []
+            for node_id in frontier:
+                for k in nodes[node_id].transition:
+                    if (k not in reached) and nodes.has_key(k):
+                        reached.add(k)
+                        next_frontier.append(k)
+            frontier = next_frontier
+        num_removed = len(self.states)-len(reached)
+        if num_removed > 0:
+            if self._journal is not None:
+                self._journalOp("drop", [node.id for node in self.states
+                                         if node.id not in reached])
+            self._log(("states", self.states))
+            self.states = [node for node in self.states if node.id in reached]
+        return num_removed
 
     def addAutState(self, aut_state):
         """Replace corresponding method from TuLiP Automaton class."""
         if isinstance(aut_state, BTAutomatonNode):
+            self._log(("truncate", len(self.states)))
             self.states.append(aut_state)
         elif isinstance(aut_state, tulip.automaton.AutomatonState):
+            self._log(("truncate", len(self.states)))
             self.states.append(BTAutomatonNode(tulip_autnode=aut_state))
         else:
             raise TypeError("given object should be instance of tulip.automaton.AutomatonState or btsynth.automaton.BTAutomatonNode")
+        if self._journal is not None:
+            self._journalOp("add", _node_record(self.states[-1]))
 
     def addAutNode(self, node):
         """Alias addAutState, to make up for confusing tulip.automaton naming.
@@ -224,11 +477,14 @@ class BTAutomaton(tulip.automaton.Automaton):
                 break
         if not match_flag:
             raise TypeError("given node ID not found in automaton.")
+        self._journalOp("remove", node_id)
         for prev_node in self.getAutInSet(node_id):
+            self._saveNode(prev_node)
             while node_id in prev_node.transition:
                 prev_ind = prev_node.transition.index(node_id)
                 prev_node.transition.remove(node_id)
                 del prev_node.cond[prev_ind]
+        self._log(("insert", ind, self.states[ind]))
         del self.states[ind]
 
     def packIDs(self):
@@ -237,9 +493,11 @@ class BTAutomaton(tulip.automaton.Automaton):
         ...this is stupid and almost enough motivation to overhaul
         TuLiP Automaton directly.
         """
+        self._journalOp("pack")
         # Build ID map, old to new
         ID_map = dict()
         for ind in range(len(self.states)):
+            self._saveNode(self.states[ind])
             ID_map[self.states[ind].id] = ind
             self.states[ind].id = ind
         # Now update transition lists
@@ -254,10 +512,12 @@ class BTAutomaton(tulip.automaton.Automaton):
         appear during the merging process.  Code could be added there
         to deal with it, but I find this post-process nicer.
         """
+        self._journalOp("dedup")
         for node in self.states:
             ref_transition = list(set(node.transition))
             if len(ref_transition) == len(node.transition):
                 continue
+            self._saveNode(node)
             for next_ID in ref_transition:
                 if node.transition.count(next_ID) > 1:
                     indices = []
@@ -273,6 +533,109 @@ class BTAutomaton(tulip.automaton.Automaton):
                         del node.cond[k]
 
 
+    def minimize(self):
+        """Merge behaviorally equivalent nodes, in place.
+
+        Two nodes are equivalent if they have the same valuation
+        (state), rule, and transition-conditionals (cond), are both
+        or neither initial (i.e., without incoming transitions; cf.
+        getAutInit), and for each k their k-th transitions lead to
+        equivalent nodes.  Transitions are compared by position
+        because execNextAutState takes the first enabled one among
+        several matching transitions.  Thus executions from
+        equivalent nodes, including the contents of memory, are the
+        same.
+
+        The coarsest such partition is found by refinement as in
+        Hopcroft's algorithm, regarding the k-th transition as
+        labeled k, in O(E log N) time for N nodes and E transitions.
+        From each class, the first node in self.states is kept (with
+        its ID and tags), and transitions into the class are
+        redirected to it.
+
+        Does *not* re-map IDs.  Return the ID map, giving for each
+        original node ID the ID of the node it was merged into.
+        Raise exception if a transition is to a missing node.
+        """
+        num_nodes = len(self.states)
+        index = dict([(self.states[u].id, u) for u in range(num_nodes)])
+        pred = [[] for u in range(num_nodes)]  # Pairs (position, source)
+        for u in range(num_nodes):
+            node = self.states[u]
+            for pos in range(len(node.transition)):
+                if not index.has_key(node.transition[pos]):
+                    raise ValueError("transition from node "+str(node.id)
+                                     +" to missing node "+str(node.transition[pos]))
+                pred[index[node.transition[pos]]].append((pos, u))
+
+        # Initial partition, by everything except successors
+        block_of = [None for u in range(num_nodes)]
+        blocks = []
+        block_keys = dict()
+        for u in range(num_nodes):
+            node = self.states[u]
+            key = (tuple(sorted(node.state.items())), node.rule, len(pred[u]) == 0,
+                   tuple(node.cond[:len(node.transition)]))
+            if not block_keys.has_key(key):
+                block_keys[key] = len(blocks)
+                blocks.append(set())
+            block_of[u] = block_keys[key]
+            blocks[block_of[u]].add(u)
+
+        # Refine, splitting by predecessors of each block in turn
+        pending = range(len(blocks))
+        is_pending = set(pending)
+        while len(pending) > 0:
+            splitter = pending.pop()
+            is_pending.remove(splitter)
+            sources = dict()  # Keyed by transition position
+            for v in list(blocks[splitter]):
+                for (pos, u) in pred[v]:
+                    if not sources.has_key(pos):
+                        sources[pos] = []
+                    sources[pos].append(u)
+            for pos_sources in sources.values():
+                touched = dict()
+                for u in pos_sources:
+                    if not touched.has_key(block_of[u]):
+                        touched[block_of[u]] = []
+                    touched[block_of[u]].append(u)
+                for (b, members) in touched.items():
+                    if len(members) == len(blocks[b]):
+                        continue
+                    new_b = len(blocks)
+                    blocks.append(set(members))
+                    blocks[b].difference_update(members)
+                    for u in members:
+                        block_of[u] = new_b
+                    # It suffices to refine by the smaller part, unless
+                    # the block was still to be used.
+                    if (b in is_pending) or (len(members) <= len(blocks[b])):
+                        pending.append(new_b)
+                        is_pending.add(new_b)
+                    else:
+                        pending.append(b)
+                        is_pending.add(b)
+
+        rep = dict()  # Node kept from each block
+        for u in range(num_nodes):
+            if not rep.has_key(block_of[u]):
+                rep[block_of[u]] = u
+        id_map = dict([(self.states[u].id, self.states[rep[block_of[u]]].id)
+                       for u in range(num_nodes)])
+        self._journalOp("minimize")
+        states = []
+        for u in range(num_nodes):
+            if rep[block_of[u]] == u:
+                node = self.states[u]
+                self._saveNode(node)
+                node.transition = [id_map[k] for k in node.transition]
+                node.cond = node.cond[:len(node.transition)]
+                states.append(node)
+        self._log(("states", self.states))
+        self.states = states
+        return id_map
+
     def fleshOutGridState(self, nominal_vars, special_var):
         """for each node in which special_var is set, expand valuation
         to include all missing variables from nominal_vars, and have
@@ -294,6 +657,15 @@ class BTAutomaton(tulip.automaton.Automaton):
 
         N.B., original IDs will be lost! (obviously).
         """
+        self._journalOp("flesh", nominal_vars, special_var)
+        journal = self._journal
+        self._journal = None  # Replaying the above covers the steps below
+        try:
+            self._fleshOutGridState(nominal_vars, special_var)
+        finally:
+            self._journal = journal
+
+    def _fleshOutGridState(self, nominal_vars, special_var):
         self.packIDs()
         new_ID = -1
         for node in self.states:
@@ -304,6 +676,7 @@ class BTAutomaton(tulip.automaton.Automaton):
         for k in range(num_orig):
             if not self.states[k].state.has_key(special_var):
                 raise Exception("FATAL: node "+str(self.states[k].id)+" is missing special_var, \""+special_var+"\"")
+            self._saveNode(self.states[k])
             if self.states[k].state[special_var] == 0:
                 # Just expand any missing nominal vars
                 for nom_var in nominal_vars:
@@ -327,9 +700,11 @@ class BTAutomaton(tulip.automaton.Automaton):
                     new_ID += 1
                     new_nodes[-1].state[miss_var] = 1
                     new_nodes[-1].state[special_var] = 0
+                self._log(("truncate", len(self.states)))
                 self.states.extend(new_nodes)
                 for node in self.states:
                     if self.states[k].id in node.transition:
+                        self._saveNode(node)
                         trans_ind = node.transition.index(self.states[k].id)
                         node.transition.extend(range(start_ID, new_ID))
                         node.cond.extend([node.cond[trans_ind] for j in range(start_ID, new_ID)])
@@ -382,29 +757,87 @@ class BTAutomaton(tulip.automaton.Automaton):
         for node in self.states:
             if node.id > max_id:
                 max_id = node.id
-        new_node_id = max_id
         id_map = dict()  # Key is original ID, value is corresponding new ID
+        for aut_node in aut.states:
+            if not id_map.has_key(aut_node.id):
+                max_id += 1
+                id_map[aut_node.id] = max_id
 
-        # Generate copies of nodes from aut and add them.
+        # Generate copies of nodes from aut, with transitions adjusted
+        # to use new IDs, and add them.
+        new_nodes = []
         for aut_node in aut.states:
-            new_node_id += 1
             node = aut_node.copy()
             node.tags = copy.copy(tags)
-            node.id = new_node_id
-            id_map[aut_node.id] = new_node_id
-            self.addAutNode(node)
-        
-        # Adjust all transitions to use new IDs
-        for (k,v) in id_map.items():
-            node = self.getAutState(v)
+            node.id = id_map[aut_node.id]
             node.transition = [id_map[i] for i in node.transition]
+            new_nodes.append(node)
+        if self._journal is not None:
+            self._journalOp("import", *_import_record(new_nodes))
+        self._log(("truncate", len(self.states)))
+        self.states.extend(new_nodes)
         return id_map
 
+    def spliceGridPath(self, src_id, old_dest_id, new_dest_id, path,
+                       var_prefix="Y"):
+        """Replace an edge by a chain of new nodes following a grid path.
+
+        The transition from node src_id to node old_dest_id is
+        redirected through new nodes, one for each (row, column) in
+        path, and the last of these has a single transition to node
+        new_dest_id.  If path is empty, the transition is redirected
+        straight to new_dest_id.  The condition of the original
+        transition (in cond) is kept.
+
+        Each new node has the valuation of the source node, but with
+        position variables of the form var_prefix_R_C set according to
+        path.  Its rule is that of the destination node.
+
+        Return list of IDs of the new nodes; raise exception on error.
+        """
+        src_node = self.getAutState(src_id)
+        dest_node = self.getAutState(new_dest_id)
+        if src_node == -1 or dest_node == -1:
+            raise ValueError("given node ID not found in automaton.")
+        if old_dest_id not in src_node.transition:
+            raise ValueError("no transition from node "+str(src_id)
+                             +" to node "+str(old_dest_id))
+        new_id = -1
+        for node in self.states:
+            if node.id > new_id:
+                new_id = node.id
+        new_IDs = range(new_id+1, new_id+1+len(path))
+        base_state = dict([(k, v) for (k, v) in src_node.state.items()
+                           if not k.startswith(var_prefix+"_")])
+        for ind in range(len(path)):
+            (i, j) = path[ind]
+            state = base_state.copy()
+            for k in src_node.state.keys():
+                if k.startswith(var_prefix+"_"):
+                    state[k] = 0
+            state[var_prefix+"_"+str(i)+"_"+str(j)] = 1
+            if ind < len(path)-1:
+                next_id = new_IDs[ind+1]
+            else:
+                next_id = new_dest_id
+            self.addAutNode(BTAutomatonNode(id=new_IDs[ind], state=state,
+                                            transition=[next_id],
+                                            rule=dest_node.rule))
+        trans_ind = src_node.transition.index(old_dest_id)
+        src_node = self.editNode(src_id)
+        if len(path) > 0:
+            src_node.transition[trans_ind] = new_IDs[0]
+        else:
+            src_node.transition[trans_ind] = new_dest_id
+        return new_IDs
+
     def memInit(self, name_list):
         """Initialize memory, with variable names in the given list.
 
         Contents are set to 0.
         """
+        self._journalOp("meminit", list(name_list))
+        self._log(("memory", self.memory))
         self.memory = dict([(k, 0) for k in name_list])
 
     def memSet(self, name, new_value):
@@ -416,6 +849,8 @@ class BTAutomaton(tulip.automaton.Automaton):
                 or (self.memory is None) or not self.memory.has_key(name):
             return None
         prev_val = self.memory[name]
+        self._journalOp("memset", name, new_value)
+        self._log(("memory", copy.copy(self.memory)))
         self.memory[name] = new_value
         return prev_val
     
@@ -448,6 +883,7 @@ class BTAutomaton(tulip.automaton.Automaton):
             except:
                 print "ERROR: rule of node "+str(node_id)+" failed."
                 raise
+            self._log(("memory", self.memory))
             self.memory = new_memory
         return True
 
@@ -457,7 +893,7 @@ class BTAutomaton(tulip.automaton.Automaton):
         ...similar behavior to addGroupCondition.
         """
         for k in ID_list:
-            autnode = self.getAutState(k)
+            autnode = self.editNode(k)
             if (autnode is None) or (not autnode.addNodeRule(rule)):
                 return k
         return -1
@@ -636,6 +1072,78 @@ class BTAutomaton(tulip.automaton.Automaton):
             else:
                 prev_set = this_set.copy()
 
+    def _clusters(self):
+        """Return cluster ID (from tags) of each node, keyed by node ID,
+        and the number of nodes in each cluster."""
+        cluster_of = dict()
+        counts = dict()
+        for node in self.states:
+            if isinstance(node.tags, dict) and node.tags.has_key("cluster_id"):
+                cluster_id = node.tags["cluster_id"]
+                cluster_of[node.id] = cluster_id
+                counts[cluster_id] = counts.get(cluster_id, 0)+1
+        return cluster_of, counts
+
+    def _coordLabels(self, var_prefix="Y", env_prefix="X",
+                     hideZeros=True, hideAgentNames=True):
+        """Build node labels as used by writeDotFileCoord.
+
+        Return dictionary with keys being node IDs and values being
+        pairs of (sys, env) labels, or None if some variable does not
+        belong to either agent.
+        """
+        env_vars = []
+        for k in self.states[0].state.keys():
+            if k.startswith(env_prefix):
+                env_vars.append(k)
+        sys_vars = []
+        for k in self.states[0].state.keys():
+            if k.startswith(var_prefix):
+                sys_vars.append(k)
+
+        # Make looping possible
+        agents = {"env" : env_vars,
+                  "sys" : sys_vars}
+
+        # Agent and position label of each variable, as encountered
+        var_index = dict()
+        for agent_name in agents.keys():
+            for k in agents[agent_name]:
+                if not var_index.has_key(k):
+                    var_index[k] = (agent_name, _coord_label(k))
+
+        state_labels = dict()
+        for state in self.states:
+            parts = {"env": [], "sys": []}
+            for (k,v) in state.state.items():
+                if hideZeros and (v == 0):
+                    continue
+                if not var_index.has_key(k):
+                    print "WARNING: variable \""+k+"\" does not belong to an agent in distinguishedTurns"
+                    return None
+                (agent_name, coord_label) = var_index[k]
+                if (v != 0) and (coord_label is not None):
+                    parts[agent_name].append(coord_label)
+                else:
+                    parts[agent_name].append(k+": "+str(v))
+
+            labels = []
+            for agent_name in ["sys", "env"]:
+                if (agent_name == "env") and (len(env_vars) == 0):
+                    # Special case: deterministic problem
+                    labels.append("")
+                elif len(parts[agent_name]) == 0:
+                    if not hideAgentNames:
+                        labels.append(str(state.id)+"::"+agent_name+";\\n {}")
+                    else:
+                        labels.append(str(state.id)+";\\n {}")
+                elif not hideAgentNames:
+                    labels.append(str(state.id)+"::"+agent_name+";\\n"+", ".join(parts[agent_name]))
+                else:
+                    labels.append(str(state.id)+";\\n"+", ".join(parts[agent_name]))
+            state_labels[state.id] = tuple(labels)
+        return state_labels
+
     def writeDotFileCoordNodes(self, fname, hideZeros=False,
                      distinguishTurns=None, turnOrder=None):
         """Use btsynth.extract_coord to infer position data.
@@ -646,25 +1154,26 @@ class BTAutomaton(tulip.automaton.Automaton):
         if (distinguishTurns is not None) and (len(distinguishTurns) <= 1):
             # This is a fringe case and seemingly ok to ignore.
             distinguishTurns = None
-
-        output = "digraph A {\n"
+        if distinguishTurns is None:
+            agent_names = [""]
+        else:
+            agent_names = distinguishTurns.keys()
 
         # Prebuild sane state names
+        var_index = dict()  # Agent and position label of each variable
         state_labels = dict()
         for state in self.states:
-            if distinguishTurns is None:
-                state_labels[str(state.id)] = ''
-            else:
-                # If distinguishTurns is not a dictionary with
-                # items of the form string -> list, it should
-                # simulate that behavior.
-                for agent_name in distinguishTurns.keys():
-                    state_labels[str(state.id)+agent_name] = ''
+            parts = dict([(agent_name, []) for agent_name in agent_names])
             for (k,v) in state.state.items():
-                if (not hideZeros) or (v != 0):
+                if hideZeros and (v == 0):
+                    continue
+                if not var_index.has_key(k):
                     if distinguishTurns is None:
                         agent_name = ''
                     else:
+                        # If distinguishTurns is not a dictionary with
+                        # items of the form string -> list, it should
+                        # simulate that behavior.
                         agent_name = None
                         for agent_candidate in distinguishTurns.keys():
                             if k in distinguishTurns[agent_candidate]:
@@ -673,136 +1182,754 @@ class BTAutomaton(tulip.automaton.Automaton):
                         if agent_name is None:
                             print "WARNING: variable \""+k+"\" does not belong to an agent in distinguishedTurns"
                             return False
-
-                    if (v != 0) and (extract_coord(k) is not None):
-                        coord = extract_coord(k)
-                        # Be aggressive about prefix spacing
-                        label_str = "".join(coord[0].split("_"))
-                        label_str += " ("+str(coord[1])+", "+str(coord[2])+")"
-                    else:
-                        label_str = k+": "+str(v)
-                    if len(state_labels[str(state.id)+agent_name]) == 0:
-                        if len(agent_name) > 0:
-                            state_labels[str(state.id)+agent_name] += str(state.id)+"::"+agent_name+";\\n" + label_str
-                        else:
-                            state_labels[str(state.id)+agent_name] += str(state.id)+";\\n" + label_str
-                    else:
-                        state_labels[str(state.id)+agent_name] += ", "+label_str
-            if distinguishTurns is None:
-                if len(state_labels[str(state.id)]) == 0:
-                    state_labels[str(state.id)] = str(state.id)+";\\n {}"
-            else:
-                for agent_name in distinguishTurns.keys():
-                    if len(state_labels[str(state.id)+agent_name]) == 0:
-                        state_labels[str(state.id)+agent_name] = str(state.id)+"::"+agent_name+";\\n {}"
+                    var_index[k] = (agent_name, _coord_label(k, nil=False))
+                (agent_name, coord_label) = var_index[k]
+                if (v != 0) and (coord_label is not None):
+                    parts[agent_name].append(coord_label)
+                else:
+                    parts[agent_name].append(k+": "+str(v))
+            for agent_name in agent_names:
+                if len(agent_name) > 0:
+                    prefix = str(state.id)+"::"+agent_name+";\\n"
+                else:
+                    prefix = str(state.id)+";\\n"
+                if len(parts[agent_name]) == 0:
+                    state_labels[(state.id, agent_name)] = prefix+" {}"
+                else:
+                    state_labels[(state.id, agent_name)] = prefix+", ".join(parts[agent_name])
 
         if (distinguishTurns is not None) and (turnOrder is None):
-            if distinguishTurns is not None:
-                turnOrder = distinguishTurns.keys()
-        for state in self.states:
-            if distinguishTurns is not None:
-                output += "    \""+ state_labels[str(state.id)+turnOrder[0]] +"\" -> \"" \
-                    + state_labels[str(state.id)+turnOrder[1]] +"\";\n"
-                for agent_ind in range(1, len(turnOrder)-1):
-                    output += "    \""+ state_labels[str(state.id)+turnOrder[agent_ind]] +"\" -> \"" \
-                        + state_labels[str(state.id)+turnOrder[agent_ind+1]] +"\";\n"
-            for trans in state.transition:
-                if distinguishTurns is None:
-                    output += "    \""+ state_labels[str(state.id)] +"\" -> \"" \
-                        + state_labels[str(self.states[trans].id)] +"\";\n"
+            turnOrder = distinguishTurns.keys()
+        with open(fname, "w", 1 << 16) as f:
+            f.write("digraph A {\n")
+            for state in self.states:
+                if distinguishTurns is not None:
+                    for agent_ind in range(len(turnOrder)-1):
+                        f.write("    \""+ state_labels[(state.id, turnOrder[agent_ind])] +"\" -> \""
+                                + state_labels[(state.id, turnOrder[agent_ind+1])] +"\";\n")
+                    src_label = state_labels[(state.id, turnOrder[-1])]
+                    dest_agent = turnOrder[0]
                 else:
-                    output += "    \""+ state_labels[str(state.id)+turnOrder[-1]] +"\" -> \"" \
-                        + state_labels[str(self.states[trans].id)+turnOrder[0]] +"\";\n"
-
-        output += "\n}\n"
-        with open(fname, "w") as f:
-            f.write(output)
+                    src_label = state_labels[(state.id, "")]
+                    dest_agent = ""
+                for trans in state.transition:
+                    f.write("    \""+ src_label +"\" -> \""
+                            + state_labels[(trans, dest_agent)] +"\";\n")
+            f.write("\n}\n")
         return True
 
     def writeDotFileCoord(self, fname, var_prefix="Y", env_prefix="X",
-                          hideZeros=True, hideAgentNames=True):
+                          hideZeros=True, hideAgentNames=True,
+                          collapseClusters=False):
         """Use btsynth.extract_coord to infer position data.
 
         Otherwise, output and return behavior is similar to
         writeDotFileEdged method.
+
+        The file is written as edges are visited, rather than built
+        as one string.  If collapseClusters is True, then all nodes
+        having the same "cluster_id" tag (e.g., those of one patch;
+        cf. btsim_navobs) are drawn as a single node, labeled by the
+        cluster ID and number of nodes in it.
         """
-        env_vars = []
-        for k in self.states[0].state.keys():
-            if k.startswith(env_prefix):
-                env_vars.append(k)
-        sys_vars = []
-        for k in self.states[0].state.keys():
-            if k.startswith(var_prefix):
-                sys_vars.append(k)
-        if len(sys_vars) == 0:
+        if not any([k.startswith(var_prefix) for k in self.states[0].state.keys()]):
             return False
+        state_labels = self._coordLabels(var_prefix=var_prefix, env_prefix=env_prefix,
+                                         hideZeros=hideZeros, hideAgentNames=hideAgentNames)
+        if state_labels is None:
+            return False
+        if collapseClusters:
+            (cluster_of, counts) = self._clusters()
+            for (node_id, cluster_id) in cluster_of.items():
+                state_labels[node_id] = ("cluster "+str(cluster_id)+";\\n "
+                                         +str(counts[cluster_id])+" nodes", "")
+            written = set()
+
+        has_in = set()
+        for state in self.states:
+            has_in.update(state.transition)
+        with open(fname, "w", 1 << 16) as f:
+            f.write("digraph A {\n")
+            # Initialization point
+            f.write("    \"\" [shape=circle,style=filled,color=black];\n")
+
+            # All nodes and edges
+            for state in self.states:
+                (src_label, src_env_label) = state_labels[state.id]
+                if state.id not in has_in:
+                    # Treat init nodes specially
+                    edges = [("", src_label, src_env_label)]
+                else:
+                    edges = []
+                edges.extend([(src_label,)+state_labels[trans] for trans in state.transition])
+                for edge in edges:
+                    if collapseClusters:
+                        if ((edge[0] == edge[1] and cluster_of.has_key(state.id))
+                            or (edge in written)):
+                            continue  # Within a cluster, or already drawn
+                        written.add(edge)
+                    f.write("    \""+ edge[0] +"\" -> \""+ edge[1] +"\" [label=\""
+                            + edge[2] + "\"];\n")
+            f.write("\n}\n")
+        return True
 
-        # Make looping possible
-        agents = {"env" : env_vars,
-                  "sys" : sys_vars}
-        
-        output = "digraph A {\n"
+    def writeGexf(self, fname, var_prefix="Y", env_prefix="X",
+                  use_viz=True, use_clusters=True, collapseClusters=False):
+        """Write automaton as GEXF (version 1.2) document, incrementally.
 
-        # Prebuild sane state names
-        state_labels = dict()
-        for state in self.states:
-            for agent_name in agents.keys():
-                state_labels[str(state.id)+agent_name] = ''
-            for (k,v) in state.state.items():
-                if (not hideZeros) or (v != 0):
-                    agent_name = None
-                    for agent_candidate in agents.keys():
-                        if k in agents[agent_candidate]:
-                            agent_name = agent_candidate
-                            break
-                    if agent_name is None:
-                        print "WARNING: variable \""+k+"\" does not belong to an agent in distinguishedTurns"
-                        return False
-
-                    if (v != 0) and (extract_coord(k) is not None):
-                        coord = extract_coord(k)
-                        # Be aggressive about prefix spacing
-                        label_str = "".join(coord[0].split("_"))
-                        if coord[1:] == (-1, -1):
-                            label_str += " (nil)"
-                        else:
-                            label_str += " ("+str(coord[1])+", "+str(coord[2])+")"
-                    else:
-                        label_str = k+": "+str(v)
-                    if len(state_labels[str(state.id)+agent_name]) == 0:
-                        if len(agent_name) > 0 and not hideAgentNames:
-                            state_labels[str(state.id)+agent_name] += str(state.id)+"::"+agent_name+";\\n" + label_str
-                        else:
-                            state_labels[str(state.id)+agent_name] += str(state.id)+";\\n" + label_str
-                    else:
-                        state_labels[str(state.id)+agent_name] += ", "+label_str
-            
-            for agent_name in agents.keys():
-                if (agent_name == "env") and (len(env_vars) == 0):
-                    # Special case: deterministic problem
-                    state_labels[str(state.id)+agent_name] = ""
-                elif len(state_labels[str(state.id)+agent_name]) == 0:
-                    if not hideAgentNames:
-                        state_labels[str(state.id)+agent_name] = str(state.id)+"::"+agent_name+";\\n {}"
+        Intended to replace tulip.congexf.dumpGexf, which builds the
+        document as one string.  Node labels are as the (sys) labels
+        of writeDotFileCoord, and edge labels are the env labels of
+        the destination.  Each variable is a node attribute with
+        default value 0, so only nonzero values are written.
+
+        If use_viz is True, then "color" tags (tuples (r, g, b, a))
+        are given as viz:color.  If use_clusters is True, then
+        "cluster_id" tags are given as a node attribute.
+        collapseClusters is as in writeDotFileCoord; cluster nodes
+        have IDs of the form "cN", where N is the cluster ID, and a
+        viz:size of the number of nodes in the cluster.
+
+        Return True on success, False otherwise.
+        """
+        state_labels = self._coordLabels(var_prefix=var_prefix, env_prefix=env_prefix)
+        if state_labels is None:
+            return False
+        if collapseClusters:
+            (cluster_of, counts) = self._clusters()
+        else:
+            cluster_of = dict()
+        varnames = sorted(self.states[0].state.keys())
+        var_index = dict([(varnames[k], k+1) for k in range(len(varnames))])
+
+        with open(fname, "w", 1 << 16) as f:
+            f.write("<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n")
+            f.write("<gexf xmlns=\"http://www.gexf.net/1.2draft\""
+                    +" xmlns:viz=\"http://www.gexf.net/1.2draft/viz\" version=\"1.2\">\n")
+            f.write("<graph defaultedgetype=\"directed\" mode=\"static\">\n")
+            f.write("<attributes class=\"node\">\n")
+            if use_clusters:
+                f.write("<attribute id=\"0\" title=\"cluster_id\" type=\"string\"/>\n")
+            for k in varnames:
+                f.write("<attribute id=\""+str(var_index[k])+"\" title="+quoteattr(k)
+                        +" type=\"integer\"><default>0</default></attribute>\n")
+            f.write("</attributes>\n<nodes>\n")
+
+            node_names = dict()  # GEXF node ID of each automaton node
+            drawn_clusters = set()
+            for node in self.states:
+                if cluster_of.has_key(node.id):
+                    cluster_id = cluster_of[node.id]
+                    node_names[node.id] = "c"+str(cluster_id)
+                    if cluster_id in drawn_clusters:
+                        continue
+                    drawn_clusters.add(cluster_id)
+                    label = "cluster "+str(cluster_id)+"; "+str(counts[cluster_id])+" nodes"
+                    values = []
+                else:
+                    node_names[node.id] = str(node.id)
+                    label = state_labels[node.id][0].replace("\\n", " ")
+                    values = [(var_index[k], v) for (k, v) in node.state.items()
+                              if v != 0 and var_index.has_key(k)]
+                f.write("<node id=\""+node_names[node.id]+"\" label="+quoteattr(label)+">\n")
+                tags = node.tags
+                if not isinstance(tags, dict):
+                    tags = dict()
+                if (use_clusters and tags.has_key("cluster_id")) or len(values) > 0:
+                    f.write("<attvalues>")
+                    if use_clusters and tags.has_key("cluster_id"):
+                        f.write("<attvalue for=\"0\" value="+quoteattr(str(tags["cluster_id"]))+"/>")
+                    for (attr_id, v) in sorted(values):
+                        f.write("<attvalue for=\""+str(attr_id)+"\" value=\""+str(v)+"\"/>")
+                    f.write("</attvalues>\n")
+                if use_viz and tags.has_key("color"):
+                    color = tags["color"]
+                    f.write("<viz:color r=\""+str(color[0])+"\" g=\""+str(color[1])
+                            +"\" b=\""+str(color[2])+"\"")
+                    if len(color) > 3:
+                        f.write(" a=\""+str(color[3])+"\"")
+                    f.write("/>\n")
+                if use_viz and cluster_of.has_key(node.id):
+                    f.write("<viz:size value=\""+str(counts[cluster_of[node.id]])+"\"/>\n")
+                f.write("</node>\n")
+            f.write("</nodes>\n<edges>\n")
+
+            edge_count = 0
+            written = set()
+            for node in self.states:
+                for trans in node.transition:
+                    edge = (node_names[node.id], node_names[trans])
+                    if collapseClusters:
+                        if ((edge[0] == edge[1] and cluster_of.has_key(node.id))
+                            or (edge in written)):
+                            continue
+                        written.add(edge)
+                    f.write("<edge id=\""+str(edge_count)+"\" source=\""+edge[0]
+                            +"\" target=\""+edge[1]+"\"")
+                    if cluster_of.has_key(trans) or len(state_labels[trans][1]) == 0:
+                        f.write("/>\n")
                     else:
-                        state_labels[str(state.id)+agent_name] = str(state.id)+";\\n {}"
+                        f.write(" label="+quoteattr(state_labels[trans][1].replace("\\n", " "))+"/>\n")
+                    edge_count += 1
+            f.write("</edges>\n</graph>\n</gexf>\n")
+        return True
 
-        # Initialization point
-        output += "    \"\" [shape=circle,style=filled,color=black];\n"
-        
-        # All nodes and edges
-        for state in self.states:
-            if len(self.getAutInSet(state.id)) == 0:
-                # Treat init nodes specially
-                output += "    \"\" -> \"" \
-                    + state_labels[str(state.id)+"sys"] +"\" [label=\""
-                output += state_labels[str(state.id)+"env"] + "\"];\n"
-            for trans in state.transition:
-                output += "    \""+ state_labels[str(state.id)+"sys"] +"\" -> \"" \
-                    + state_labels[str(self.states[trans].id)+"sys"] +"\" [label=\""
-                output += state_labels[str(self.states[trans].id)+"env"] + "\"];\n"
-
-        output += "\n}\n"
-        with open(fname, "w") as f:
-            f.write(output)
+AUTB_MAGIC = 0x42544155  # "BTAU"
+AUTB_VERSION = 1
+AUTB_MISSING = np.iinfo(np.int64).min  # Variable absent from valuation
+
+def _func_name(func):
+    """Return "module:name" for a module-level function, or None for None."""
+    if func is None:
+        return None
+    name = getattr(func, "__name__", None)
+    module = sys.modules.get(getattr(func, "__module__", None))
+    if (module is None) or (getattr(module, name, None) is not func):
+        raise ValueError("cannot save "+repr(func)+"; conditionals and rules must be module-level functions.")
+    return func.__module__+":"+name
+
+def _func_lookup(func_name):
+    (module_name, name) = func_name.split(":")
+    return getattr(__import__(module_name, fromlist=[name]), name)
+
+def write_autb(aut, dirname):
+    """Save automaton in binary form, as .npy files in directory dirname.
+
+    Everything about aut is kept: node IDs, valuations, transitions,
+    transition-conditionals (cond), node rules, tags and memory.
+    Conditionals and rules are saved by name, so they must be
+    module-level functions (e.g., cond_all and rule_setmatch of
+    btsynth.btsynth).  Tags must be dictionaries (or None) whose repr
+    can be read back by ast.literal_eval.
+
+    The files are
+      meta: AUTB_MAGIC, AUTB_VERSION, number of nodes, variables and
+            edges, and 1 if memory is initialized (else 0);
+      varnames, funcs, tagtable: tables of strings, indexed by the
+            arrays below (functions as "module:name", tags as repr);
+      ids: node IDs;
+      state: (nodes x variables) int64 valuations, with AUTB_MISSING
+             where a node lacks a variable;
+      trans_ptr, trans, cond: transitions in CSR form, i.e., the
+             destination IDs of node k are trans[trans_ptr[k]:trans_ptr[k+1]],
+             and cond gives indices into funcs (-1 for None, which is
+             also saved for transitions beyond the end of a node's cond);
+      rule, tags: per node, indices into funcs and tagtable (-1 for None);
+      mem_names, mem_values: automaton memory.
+
+    Each can be opened with numpy.load(..., mmap_mode="r"); cf. class
+    AutomatonArrays.
+    """
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    meta_fname = os.path.join(dirname, "meta.npy")
+    if os.path.exists(meta_fname):
+        os.remove(meta_fname)  # Do not leave valid-looking partial save
+
+    tables = {"varnames": ([], dict()), "funcs": ([], dict()), "tagtable": ([], dict())}
+    def lookup(table_name, key):
+        (names, index) = tables[table_name]
+        if key is None:
+            return -1
+        if not index.has_key(key):
+            index[key] = len(names)
+            names.append(key)
+        return index[key]
+
+    num_nodes = len(aut.states)
+    ids = np.empty(num_nodes, dtype=np.int64)
+    trans_ptr = np.zeros(num_nodes+1, dtype=np.int64)
+    rule = np.empty(num_nodes, dtype=np.int32)
+    tags = np.empty(num_nodes, dtype=np.int32)
+    rows = dict()  # Node indices and valuations, grouped by key tuple
+    trans = []
+    cond = []
+    for ind in range(num_nodes):
+        node = aut.states[ind]
+        ids[ind] = node.id
+        keys = tuple(node.state.keys())
+        if not rows.has_key(keys):
+            rows[keys] = ([], [])
+        rows[keys][0].append(ind)
+        rows[keys][1].append(node.state.values())
+        trans.extend(node.transition)
+        node_cond = [lookup("funcs", _func_name(c)) for c in node.cond[:len(node.transition)]]
+        # Keep cond aligned with trans (cf. recastBTAutNodes)
+        node_cond.extend([-1]*(len(node.transition)-len(node_cond)))
+        cond.extend(node_cond)
+        trans_ptr[ind+1] = len(trans)
+        rule[ind] = lookup("funcs", _func_name(node.rule))
+        if node.tags is None:
+            tags[ind] = -1
+        else:
+            tag_repr = repr(node.tags)
+            if not tables["tagtable"][1].has_key(tag_repr):
+                try:
+                    readable = (ast.literal_eval(tag_repr) == node.tags)
+                except (ValueError, SyntaxError):
+                    readable = False
+                if not readable:
+                    raise ValueError("cannot save tags of node "+str(node.id)+": "+tag_repr)
+            tags[ind] = lookup("tagtable", tag_repr)
+    columns = dict([(keys, [lookup("varnames", k) for k in keys]) for keys in rows.keys()])
+    state = np.empty((num_nodes, len(tables["varnames"][0])), dtype=np.int64)
+    state.fill(AUTB_MISSING)
+    for (keys, (inds, values)) in rows.items():
+        if len(keys) > 0:
+            state[np.ix_(inds, columns[keys])] = values
+
+    if aut.memory is None:
+        mem_names = []
+    else:
+        mem_names = sorted(aut.memory.keys())
+    arrays = {"ids": ids, "state": state, "trans_ptr": trans_ptr,
+              "trans": np.array(trans, dtype=np.int64),
+              "cond": np.array(cond, dtype=np.int32),
+              "rule": rule, "tags": tags,
+              "mem_names": np.array(mem_names, dtype=str),
+              "mem_values": np.array([aut.memory[k] for k in mem_names], dtype=np.int64)}
+    for (table_name, (names, index)) in tables.items():
+        arrays[table_name] = np.array(names, dtype=str)
+    for (name, a) in arrays.items():
+        np.save(os.path.join(dirname, name+".npy"), a)
+    np.save(meta_fname, np.array([AUTB_MAGIC, AUTB_VERSION, num_nodes, state.shape[1],
+                                  len(trans), int(aut.memory is not None)], dtype=np.int64))
+
+
+class AutomatonArrays:
+    """Automaton saved by write_autb, with nodes built on demand.
+
+    If mmap is True, then the arrays are memory-mapped, so opening
+    is fast regardless of size, and only pages touched by node or
+    getAutState are read.  The ids, state, trans_ptr, trans, cond,
+    rule and tags attributes are the arrays described in write_autb.
+
+    Use the automaton method to obtain a (full) BTAutomaton.
+    """
+    def __init__(self, dirname, mmap=True):
+        if mmap:
+            mmap_mode = "r"
+        else:
+            mmap_mode = None
+        load = lambda name: np.load(os.path.join(dirname, name+".npy"), mmap_mode=mmap_mode)
+        meta = load("meta")
+        if meta[0] != AUTB_MAGIC:
+            raise ValueError("not a binary automaton: "+str(dirname))
+        if meta[1] != AUTB_VERSION:
+            raise ValueError("unsupported binary automaton version "+str(meta[1]))
+        self.varnames = [str(k) for k in load("varnames")]
+        self.funcs = [_func_lookup(str(k)) for k in load("funcs")]
+        self.tagtable = [ast.literal_eval(str(k)) for k in load("tagtable")]
+        (self.ids, self.state, self.trans_ptr, self.trans, self.cond, self.rule,
+         self.tags) = [load(name) for name in ["ids", "state", "trans_ptr", "trans",
+                                               "cond", "rule", "tags"]]
+        if meta[5]:
+            self.memory = dict(zip([str(k) for k in load("mem_names")],
+                                   [int(v) for v in load("mem_values")]))
+        else:
+            self.memory = None
+        self._id_index = None
+
+    def size(self):
+        return len(self.ids)
+
+    def node(self, ind):
+        """Return node at position ind (not ID!) as a BTAutomatonNode."""
+        row = self.state[ind].tolist()
+        if AUTB_MISSING in row:
+            state = dict([(self.varnames[j], v) for (j, v) in enumerate(row)
+                          if v != AUTB_MISSING])
+        else:
+            state = dict(zip(self.varnames, row))
+        (start, end) = (self.trans_ptr[ind], self.trans_ptr[ind+1])
+        cond = [(self.funcs[k] if k >= 0 else None) for k in self.cond[start:end].tolist()]
+        if self.rule[ind] >= 0:
+            rule = self.funcs[self.rule[ind]]
+        else:
+            rule = None
+        if self.tags[ind] >= 0:
+            tags = self.tagtable[self.tags[ind]]
+        else:
+            tags = None
+        return BTAutomatonNode(id=int(self.ids[ind]), state=state,
+                               transition=self.trans[start:end].tolist(),
+                               rule=rule, cond=cond, tags=tags)
+
+    def index(self, node_id):
+        """Return position of node with given ID, or -1 if not found."""
+        if self._id_index is None:
+            if np.all(np.diff(self.ids) > 0):
+                self._id_index = "sorted"
+            else:
+                self._id_index = dict([(v, k) for (k, v) in enumerate(self.ids.tolist())])
+        if self._id_index == "sorted":
+            ind = np.searchsorted(self.ids, node_id)
+            if ind < len(self.ids) and self.ids[ind] == node_id:
+                return int(ind)
+            return -1
+        return self._id_index.get(node_id, -1)
+
+    def getAutState(self, node_id):
+        """As in TuLiP Automaton, return node with given ID, or -1."""
+        ind = self.index(node_id)
+        if ind < 0:
+            return -1
+        return self.node(ind)
+
+    def automaton(self):
+        """Build BTAutomaton containing all nodes."""
+        aut = BTAutomaton()
+        aut.states = [self.node(k) for k in range(self.size())]
+        aut.memory = copy.copy(self.memory)
+        return aut
+
+def read_autb(dirname, mmap=True, journal=True, num_records=None):
+    """Load automaton saved by write_autb; return BTAutomaton.
+
+    If journal is True and dirname has a journal (cf.
+    BTAutomaton.openJournal), then it is replayed on the automaton;
+    num_records is as in read_journal.
+    """
+    aut = AutomatonArrays(dirname, mmap=mmap).automaton()
+    if journal:
+        for record in read_journal(dirname, num_records=num_records):
+            _replay(aut, record)
+    return aut
+
+
+JOURNAL_FNAME = "journal"
+
+def _node_record(node):
+    return (node.id, node.state, node.transition, node.cond, node.rule, node.tags)
+
+def _import_record(nodes):
+    """Return (key table, node records) for journaling import of nodes.
+
+    Valuations are given as tuples of values, with keys in the table
+    (by index), so that variable names are not repeated per node.
+    """
+    keys = []
+    key_index = dict()
+    node_records = []
+    for node in nodes:
+        node_keys = tuple(sorted(node.state.keys()))
+        if not key_index.has_key(node_keys):
+            key_index[node_keys] = len(keys)
+            keys.append(node_keys)
+        node_records.append((node.id, key_index[node_keys],
+                             tuple([node.state[k] for k in node_keys]),
+                             node.transition, node.cond, node.rule, node.tags))
+    return (keys, node_records)
+
+def _journal_split(data):
+    """Return list of (pickled) records in journal file contents data,
+    through the last complete one."""
+    records = []
+    offset = 0
+    while offset+8 <= len(data):
+        length = int(np.fromstring(data[offset:offset+8], dtype="<i8")[0])
+        if offset+8+length > len(data):
+            break
+        records.append(data[offset+8:offset+8+length])
+        offset += 8+length
+    return records
+
+def read_journal(dirname, num_records=None):
+    """Return list of records in journal of directory dirname.
+
+    If num_records is not None, then only the first num_records are
+    read.  A record cut short (e.g., by a crash while writing it) at
+    the end of the journal is ignored.  If there is no journal,
+    return [].
+    """
+    fname = os.path.join(dirname, JOURNAL_FNAME)
+    if not os.path.exists(fname):
+        return []
+    with open(fname, "rb") as f:
+        records = _journal_split(f.read())
+    if num_records is not None:
+        records = records[:num_records]
+    return [pickle.loads(record) for record in records]
+
+def _replay(aut, record):
+    """Apply journal record to automaton aut."""
+    op = record[0]
+    if op == "add":
+        (node_id, state, transition, cond, rule, tags) = record[1]
+        aut.addAutNode(BTAutomatonNode(id=node_id, state=state, transition=transition,
+                                       cond=cond, rule=rule, tags=tags))
+    elif op == "import":
+        keys = record[1]
+        for (node_id, key_ind, values, transition, cond, rule, tags) in record[2]:
+            aut.addAutNode(BTAutomatonNode(id=node_id, state=dict(zip(keys[key_ind], values)),
+                                           transition=transition, cond=cond,
+                                           rule=rule, tags=tags))
+    elif op == "set":
+        node = aut.editNode(record[1][0])
+        if node == -1:
+            raise ValueError("journal changes missing node "+str(record[1][0]))
+        (node.id, node.state, node.transition, node.cond, node.rule, node.tags) = record[1]
+    elif op == "remove":
+        aut.removeNode(record[1])
+    elif op == "drop":
+        drop_IDs = set(record[1])
+        aut.states = [node for node in aut.states if node.id not in drop_IDs]
+    elif op == "pack":
+        aut.packIDs()
+    elif op == "dedup":
+        aut.cleanDuplicateTrans()
+    elif op == "minimize":
+        aut.minimize()
+    elif op == "flesh":
+        aut.fleshOutGridState(record[1], record[2])
+    elif op == "rule_all":
+        aut.allRule(record[1])
+    elif op == "tag_all":
+        aut.allTag(record[1])
+    elif op == "meminit":
+        aut.memInit(record[1])
+    elif op == "memset":
+        aut.memSet(record[1], record[2])
+    else:
+        raise ValueError("unrecognized journal record \""+str(op)+"\"")
+
+
+class PatchJournal:
+    """Append-only journal of changes to a BTAutomaton.
+
+    The journal is the file JOURNAL_FNAME in a directory that holds
+    its base, as saved by write_autb.  Records are pickled tuples,
+    each preceded by its length (as little-endian int64).  They are
+    kept in memory until flush, so that those of changes undone by
+    BTAutomaton.rollback can be dropped without touching the file.
+
+    Use BTAutomaton.openJournal rather than this class directly.
+
+    If append is True, then records after the first num_records (if
+    not None) are dropped from the existing journal.  If writer is
+    not None, then flush calls writer(f, data) to write data to the
+    journal file f, rather than writing it directly (e.g., so that it
+    is done by another thread).
+    """
+    def __init__(self, dirname, append=False, num_records=None, writer=None):
+        self.dirname = dirname
+        self.fname = os.path.join(dirname, JOURNAL_FNAME)
+        self.writer = writer
+        self.written = 0  # Number of records in the file
+        self.num_bytes = 0  # Size of the file
+        self.pending = []  # Records (pickled and framed) not yet written
+        self.dirty = []  # Nodes changed in place (cf. editNode), not yet recorded
+        self.dirty_ids = set()
+        self.marks = []  # Position at each snapshot of the automaton
+        self.compact_ratio = None
+        if append and os.path.exists(self.fname):
+            with open(self.fname, "rb") as f:
+                records = _journal_split(f.read())
+            if num_records is not None:
+                records = records[:num_records]
+            self.written = len(records)
+            self.num_bytes = sum([8+len(record) for record in records])
+            self.f = open(self.fname, "r+b")
+            self.f.seek(self.num_bytes)
+            self.f.truncate()  # Drop any partial (or unwanted) record
+        else:
+            self.f = open(self.fname, "wb")
+        self.base_size = self._base_size()
+
+    def _base_size(self):
+        return sum([os.path.getsize(os.path.join(self.dirname, fname))
+                    for fname in os.listdir(self.dirname) if fname.endswith(".npy")])
+
+    def append(self, record):
+        self.sync()
+        data = pickle.dumps(record, pickle.HIGHEST_PROTOCOL)
+        self.pending.append(np.array([len(data)], dtype="<i8").tostring()+data)
+
+    def touch(self, node):
+        """Record contents of node at the next sync."""
+        if id(node) not in self.dirty_ids:
+            self.dirty_ids.add(id(node))
+            self.dirty.append(node)
+
+    def sync(self):
+        """Record contents of changed nodes; cf. touch."""
+        dirty = self.dirty
+        self.dirty = []
+        self.dirty_ids = set()
+        for node in dirty:
+            self.append(("set", _node_record(node)))
+
+    def position(self):
+        """Return number of records so far, written or not."""
+        self.sync()
+        return self.written+len(self.pending)
+
+    def rewind(self, snap):
+        """Drop records made since mark number snap.
+
+        Return False if some of these were already written.
+        """
+        self.dirty = []
+        self.dirty_ids = set()
+        if self.marks[snap] < self.written:
+            return False
+        del self.pending[self.marks[snap]-self.written:]
         return True
+
+    def flush(self):
+        self.sync()
+        data = "".join(self.pending)
+        self.written += len(self.pending)
+        self.num_bytes += len(data)
+        self.pending = []
+        if self.writer is None:
+            self.f.write(data)
+            self.f.flush()
+        else:
+            self.writer(self.f, data)
+
+    def size(self):
+        """Size in bytes of the journal file (including data passed to
+        writer but perhaps not yet written)."""
+        return self.num_bytes
+
+    def reset(self, aut):
+        """Save aut as the base, and empty the journal."""
+        self.f.close()
+        # Remove meta first, so that a crash before write_autb is
+        # done leaves an unreadable base rather than a wrong one.
+        meta_fname = os.path.join(self.dirname, "meta.npy")
+        if os.path.exists(meta_fname):
+            os.remove(meta_fname)
+        os.remove(self.fname)
+        write_autb(aut, self.dirname)
+        self.f = open(self.fname, "wb")
+        self.written = 0
+        self.num_bytes = 0
+        self.pending = []
+        self.dirty = []
+        self.dirty_ids = set()
+        self.marks = [-1 for k in self.marks]  # Before the new base
+        self.base_size = self._base_size()
+
+    def close(self):
+        self.f.close()
+
+
+_JTLV_STATE = re.compile(r"State (\d+)\b.*?<(.*)>")
+_JTLV_VALUES = {"0": 0, "1": 1, "false": 0, "true": 1, "FALSE": 0, "TRUE": 1}
+
+def _open_lines(f):
+    """Return (iterable of lines, whether it should be closed by caller)."""
+    if isinstance(f, str):
+        return open(f, "r"), True
+    return f, False
+
+def read_jtlv_aut(f, decode=None):
+    """Parse automaton in the format of JTLV .aut files (cf. TuLiP).
+
+    f is a file name or an iterable of lines (e.g., a file object),
+    which is read once, line by line.  Nodes are built directly as
+    BTAutomatonNode objects.  Variable names have any module
+    qualification removed, e.g., s.Y_2_3 becomes Y_2_3, and values
+    are integers (with true and false as 1 and 0).
+
+    If decode is not None, then it is applied to each valuation,
+    e.g., decode=spec.decode_state for an instance spec of
+    btsynth.gridspec.GridSpec.
+
+    Return BTAutomaton.
+    """
+    (lines, close) = _open_lines(f)
+    names = dict()  # Shared name strings, by qualified name
+    states = []
+    node = None
+    try:
+        for line in lines:
+            if line.startswith("State "):
+                match = _JTLV_STATE.match(line)
+                if match is None:
+                    raise ValueError("malformed state line: "+line.strip())
+                state = dict()
+                for item in match.group(2).split(","):
+                    if len(item.strip()) == 0:
+                        continue
+                    (name, value) = item.rsplit(":", 1)
+                    if not names.has_key(name):
+                        names[name] = name.strip().rsplit(".", 1)[-1]
+                    value = value.strip()
+                    if _JTLV_VALUES.has_key(value):
+                        state[names[name]] = _JTLV_VALUES[value]
+                    else:
+                        state[names[name]] = int(value)
+                if decode is not None:
+                    state = decode(state)
+                node = BTAutomatonNode(id=int(match.group(1)))
+                node.state = state
+            elif "successors" in line:
+                if node is None:
+                    raise ValueError("successors given before state: "+line.strip())
+                if ":" in line:
+                    node.transition = [int(k) for k in line.split(":", 1)[1].split(",")]
+                node.cond = [None]*len(node.transition)
+                states.append(node)
+                node = None
+    finally:
+        if close:
+            lines.close()
+    aut = BTAutomaton()
+    aut.states = states
+    return aut
+
+def read_gr1c_aut(f, decode=None):
+    """Parse automaton in tulipcon XML, as produced by "gr1c -t tulip".
+
+    f is a file name or file object (e.g., the stdout pipe of a gr1c
+    process), which is parsed incrementally, and each node element is
+    discarded once the corresponding BTAutomatonNode is built.  Node
+    valuations are in order of the env_vars and then sys_vars items
+    in the document.  decode is as in read_jtlv_aut.
+
+    Return BTAutomaton; raise SyntaxError if f is not well-formed.
+    """
+    (source, close) = _open_lines(f)
+    varnames = []
+    states = []
+    in_vars = False  # Whether within env_vars or sys_vars
+    aut_elem = None
+    try:
+        for (event, elem) in ET.iterparse(source, events=("start", "end")):
+            tag = elem.tag.rsplit("}", 1)[-1]
+            if tag in ["env_vars", "sys_vars"]:
+                in_vars = (event == "start")
+            if event == "start":
+                if tag == "aut":
+                    aut_elem = elem
+                continue
+            if tag == "item" and in_vars:
+                varnames.append(elem.get("key"))
+            elif tag == "node":
+                values = {}
+                for child in elem:
+                    values[child.tag.rsplit("}", 1)[-1]] = child.text or ""
+                state = values["state"].split()
+                if len(state) == 1 and len(varnames) > 1:
+                    state = list(state[0])  # Digits without separators
+                if len(state) != len(varnames):
+                    raise ValueError("valuation of node "+values["id"].strip()
+                                     +" does not match declared variables.")
+                state = dict(zip(varnames, [int(v) for v in state]))
+                if decode is not None:
+                    state = decode(state)
+                node = BTAutomatonNode(id=int(values["id"]))
+                node.state = state
+                node.transition = [int(k) for k in values.get("child_list", "").split()]
+                node.cond = [None]*len(node.transition)
+                states.append(node)
+                aut_elem.clear()  # Drop parsed nodes
+    finally:
+        if close:
+            source.close()
+    aut = BTAutomaton()
+    aut.states = states
+    return aut
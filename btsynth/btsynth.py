@@ -6,15 +6,20 @@ Scott C. Livingston,
 2011, 2012.
 """
 
-from automaton import BTAutomaton, BTAutomatonNode
+from automaton import BTAutomaton, BTAutomatonNode, write_autb, read_autb, AutomatonArrays, \
+    read_journal, read_jtlv_aut, read_gr1c_aut
 from gridworld import *
+import explicit
+import gridspec
+from dstar import DStarLite
+from checkpoint import SimCheckpoint
 
 import itertools
 import copy
+import time
+import multiprocessing
 import numpy as np
-import tulip.gr1cint
 import tulip.jtlvint
-from tulip.spec import GRSpec
 
 
 def create_nominal(W, env_init_list, soln_str, restrict_radius=1,
@@ -64,24 +69,9 @@ def create_nominal(W, env_init_list, soln_str, restrict_radius=1,
         print "ERROR: no loop closure marker found in nominal path data."
         exit(-1)  # Be aggressive; force quit
 
-    # Build list of system variables
-    pos_indices = [k for k in itertools.product(range(W.shape[0]), range(W.shape[1]))]
-    sys_vars = []
-    for k in pos_indices:
-        sys_vars.append(var_prefix+"_"+str(k[0])+"_"+str(k[1]))
-    sys_vars_nowhere = dict([(var, 0) for var in sys_vars])
-
     # Build node without environment
     aut = BTAutomaton()
-    last_id = 0
-    for step in nom_path:
-        node = BTAutomatonNode(id=last_id,
-                               state=sys_vars_nowhere.copy(),
-                               transition=[last_id+1])
-        node.state[var_prefix+"_"+str(step[0])+"_"+str(step[1])] = 1
-        aut.states.append(node)
-        last_id += 1
-    aut.states[-1].transition = [loop_marker]
+    append_path(aut, W, nom_path, loop_marker, var_prefix=var_prefix)
 
     # Augment for all environment variables
     for env_ind in range(len(env_init_list)):
@@ -109,15 +99,57 @@ def create_nominal(W, env_init_list, soln_str, restrict_radius=1,
     return aut
 
 
+def append_path(aut, W, path, loop_marker, var_prefix="Y"):
+    """Append a lasso-shaped path to the given automaton.
+
+    path is a list of (row, col) pairs, each of which becomes a node
+    with a transition to the next, and the last node has a transition
+    back to the node at index loop_marker of path.  Node valuations
+    include a system variable for every cell of W, with precisely the
+    one for the node position being true.
+
+    Return the ID of the first node of the path.
+    """
+    sys_vars = [var_prefix+"_"+str(i)+"_"+str(j)
+                for (i, j) in itertools.product(range(W.shape[0]), range(W.shape[1]))]
+    sys_vars_nowhere = dict([(var, 0) for var in sys_vars])
+    first_id = 0
+    for node in aut.states:
+        if node.id >= first_id:
+            first_id = node.id+1
+    last_id = first_id
+    for step in path:
+        node = BTAutomatonNode(id=last_id,
+                               state=sys_vars_nowhere.copy(),
+                               transition=[last_id+1])
+        node.state[var_prefix+"_"+str(step[0])+"_"+str(step[1])] = 1
+        aut.states.append(node)
+        last_id += 1
+    aut.states[-1].transition = [first_id+loop_marker]
+    return first_id
+
+
 def gen_navobs_soln(init_list, goal_list, W, num_obs,
                     env_init_list, env_goal_list=None,
                     goals_disjunct=None,
                     restrict_radius=1,
                     var_prefix="Y", env_prefix="X",
-                    only_realizability=False):
+                    only_realizability=False, backend="gr1c",
+                    encoding="onehot", session=None):
     """Generate solution as in gen_dsoln but now with dynamic obstacles.
 
-    Use gr1c (as interfaced through TuLiP) for synthesis.
+    Use gr1c for synthesis; the specification is built as an
+    instance of btsynth.gridspec.GridSpec and streamed to gr1c.  If
+    backend is "explicit", then instead solve the game in-process
+    using btsynth.explicit (no formula is written in that case).
+    encoding is as in btsynth.gridspec.navobs_spec, and only affects
+    the formula given to the solver; the returned automaton has the
+    usual prefix_R_C variables in any case.
+
+    If session is not None, then it should be an instance of
+    btsynth.gridspec.WorldSession for W (with the same radius,
+    prefixes and encoding; else ValueError is raised), and is used to
+    build the specification, reusing parts from earlier calls.
 
     This is a limited extension to the problem considered in
     gen_dsoln. Here we introduce a finite number (num_obs) of
@@ -132,7 +164,9 @@ def gen_navobs_soln(init_list, goal_list, W, num_obs,
     initial positions as their goal positions.
 
     N.B., we do not verify that env_goals are within restrict_radius
-    of initial env obstacle positions.
+    of initial env obstacle positions.  Obstacles are initialized
+    jointly, i.e., each starts at its entry of env_init_list, or
+    "nowhere" if that is outside its restricted region.
 
     restrict_radius determines the domains of obstacles; cf. notes in
     function LTL_world.
@@ -143,6 +177,9 @@ def gen_navobs_soln(init_list, goal_list, W, num_obs,
     If only_realizability is True, then do *not* perform
     synthesis. Instead, only check realizability of the specification,
     and return True if realizable, False if not.
+
+    Problems found unrealizable by precheck (cf. btsynth.gridworld)
+    are rejected before building a specification.
     """
     # Argument error checking
     if (len(init_list) == 0) or (num_obs < 0):
@@ -152,144 +189,55 @@ def gen_navobs_soln(init_list, goal_list, W, num_obs,
     if env_goal_list is None:
         env_goal_list = env_init_list
 
+    if num_obs >= 1 and precheck(W, init_list, goal_list,
+                                 env_init_list=env_init_list[:num_obs],
+                                 env_goal_list=env_goal_list[:num_obs],
+                                 goals_disjunct=goals_disjunct,
+                                 restrict_radius=restrict_radius) is not None:
+        if only_realizability:
+            return False
+        return None
+
     # Handle degenerate case of no obstacles (thus, deterministic problem).
     if num_obs < 1:
         return gen_dsoln(init_list=init_list, goal_list=goal_list, W=W,
                          goals_disjunct=goals_disjunct,
                          var_prefix=var_prefix,
-                         only_realizability=only_realizability)
-
-    ########################################
-    # Environment prep
-    obs_bounds = []
-    env_trans = []
-    for k in range(num_obs):
-        center_loc = env_goal_list[k]
-        row_low = center_loc[0]-restrict_radius
-        nowhere = [False,  # corresponds to row_low
-                   False,  # row_high
-                   False,  # col_low
-                   False]  # col_high
-        row_low = center_loc[0]-restrict_radius
-        if row_low < 0:
-            row_low = 0
-            nowhere[0] = True
-        row_high = center_loc[0]+restrict_radius
-        if row_high > W.shape[0]-1:
-            row_high = W.shape[0]-1
-            nowhere[1] = True
-        col_low = center_loc[1]-restrict_radius
-        if col_low < 0:
-            col_low = 0
-            nowhere[2] = True
-        col_high = center_loc[1]+restrict_radius
-        if col_high > W.shape[1]-1:
-            col_high = W.shape[1]-1
-            nowhere[3] = True
-        obs_bounds.append((row_low, row_high, col_low, col_high, nowhere))
-        env_trans.extend(LTL_world(W, var_prefix=env_prefix+"_"+str(k),
-                                   center_loc=center_loc,
-                                   restrict_radius=restrict_radius))
-
-    env_vars = []
-    for k in range(num_obs):
-        if (obs_bounds[k][4][0] or obs_bounds[k][4][1]
-            or obs_bounds[k][4][2] or obs_bounds[k][4][3]):
-            env_vars.append(env_prefix+"_"+str(k)+"_n_n")
-        for i in range(obs_bounds[k][0], obs_bounds[k][1]+1):
-            for j in range(obs_bounds[k][2], obs_bounds[k][3]+1):
-                env_vars.append(env_prefix+"_"+str(k)+"_"+str(i)+"_"+str(j))
-
-    # Environment progress: always eventually obstacle returns to
-    # initial position.
-    env_goal = []
-    for k in range(num_obs):
-        center_loc = env_goal_list[k]
-        if (center_loc[0] >= 0 and center_loc[0] <= W.shape[0]-1
-            and center_loc[1] >= 0 and center_loc[1] <= W.shape[1]-1):
-            env_goal.append(env_prefix+"_"+str(k)+"_"+str(center_loc[0])+"_"+str(center_loc[1]))
-        else:
-            env_goal.append(env_prefix+"_"+str(k)+"_n_n")
-
-    env_init = ""
-    if (env_init_list is not None) and len(env_init_list) > 0:
-        for obs_ind in range(num_obs):
-            loc = env_init_list[obs_ind]
-            if len(env_init) > 0:
-                env_init += " | "
-            if (loc[0] < row_low or loc[0] > row_high
-                or loc[1] < col_low or loc[1] > col_high):
-                env_init += "(" + env_prefix+"_"+str(obs_ind)+"_n_n"
-                env_init_mutex = " & ".join(["!"+ovar for ovar in env_vars if ovar.startswith(env_prefix+"_"+str(obs_ind)) and ovar != env_prefix+"_"+str(obs_ind)+"_n_n"])
-                if len(env_init_mutex) > 0:
-                    env_init += " & " + env_init_mutex
-                env_init += ")"
-            else:
-                env_init += "(" + env_prefix+"_"+str(obs_ind)+"_"+str(loc[0])+"_"+str(loc[1])
-                env_init_mutex = " & ".join(["!"+ovar for ovar in env_vars if ovar.startswith(env_prefix+"_"+str(obs_ind)) and ovar != env_prefix+"_"+str(obs_ind)+"_"+str(loc[0])+"_"+str(loc[1])])
-                if len(env_init_mutex) > 0:
-                    env_init += " & " + env_init_mutex
-                env_init += ")"
-    
-    ########################################
-    # Sys prep
-    sys_vars = []
-    for i in range(W.shape[0]):
-        for j in range(W.shape[1]):
-            sys_vars.append(var_prefix+"_"+str(i)+"_"+str(j))
-
-    sys_trans = LTL_world(W, var_prefix=var_prefix)
-
-    init_str = ""
-    for loc in init_list:
-        if len(init_str) > 0:
-            init_str += " | "
-        init_str += "(" + var_prefix+"_"+str(loc[0])+"_"+str(loc[1])
-        init_str_mutex = " & ".join(["!"+ovar for ovar in sys_vars if ovar != var_prefix+"_"+str(loc[0])+"_"+str(loc[1])])
-        if len(init_str_mutex) > 0:
-            init_str += " & " + init_str_mutex
-        init_str += ")"
-
-    sys_goal = []
-    for loc in goal_list:
-        sys_goal.append(var_prefix+"_"+str(loc[0])+"_"+str(loc[1]))
-    
-    if (goals_disjunct is not None) and len(goals_disjunct) > 0:
-        goal_dstr = ""
-        for loc in goals_disjunct:
-            if len(goal_dstr) == 0:
-                goal_dstr += var_prefix+"_"+str(loc[0])+"_"+str(loc[1])
-            else:
-                goal_dstr += " | "+var_prefix+"_"+str(loc[0])+"_"+str(loc[1])
-        sys_goal.append(goal_dstr)
-
-    ########################################
-    # Interaction: avoid collisions
-    coll_str = ""
-    for k in range(num_obs):
-        for i in range(obs_bounds[k][0], obs_bounds[k][1]+1):
-            for j in range(obs_bounds[k][2], obs_bounds[k][3]+1):
-                if len(coll_str) > 0:
-                    coll_str += " & "
-                coll_str += "!(" + var_prefix+"_"+str(i)+"_"+str(j)+"'"
-                coll_str += " & " + env_prefix+"_"+str(k)+"_"+str(i)+"_"+str(j)+"'"
-                coll_str += ")"
-    if len(coll_str) > 0:
-        sys_trans.append(coll_str)
-
-    spec = GRSpec(sys_vars=sys_vars, sys_init=init_str,
-                  sys_safety=sys_trans, sys_prog=sys_goal,
-                  env_vars=env_vars, env_init=env_init,
-                  env_safety=env_trans, env_prog=env_goal)
+                         only_realizability=only_realizability,
+                         backend=backend, encoding=encoding, session=session)
+
+    if backend == "explicit":
+        return explicit.synthesize(init_list=init_list, goal_list=goal_list,
+                                   W=W, env_init_list=env_init_list[:num_obs],
+                                   env_goal_list=env_goal_list[:num_obs],
+                                   goals_disjunct=goals_disjunct,
+                                   restrict_radius=restrict_radius,
+                                   var_prefix=var_prefix, env_prefix=env_prefix,
+                                   only_realizability=only_realizability)
+    elif backend != "gr1c":
+        raise ValueError("unrecognized synthesis backend \""+str(backend)+"\"")
+
+    if session is not None:
+        session.check(W, restrict_radius=restrict_radius, var_prefix=var_prefix,
+                      env_prefix=env_prefix, encoding=encoding)
+        spec = session.spec(init_list=init_list, goal_list=goal_list,
+                            env_init_list=env_init_list[:num_obs],
+                            env_goal_list=env_goal_list[:num_obs],
+                            goals_disjunct=goals_disjunct)
+    else:
+        spec = gridspec.navobs_spec(init_list=init_list, goal_list=goal_list, W=W,
+                                    env_init_list=env_init_list[:num_obs],
+                                    env_goal_list=env_goal_list[:num_obs],
+                                    goals_disjunct=goals_disjunct,
+                                    restrict_radius=restrict_radius,
+                                    var_prefix=var_prefix, env_prefix=env_prefix,
+                                    encoding=encoding)
 
     if only_realizability:
-        return tulip.gr1cint.check_realizable(spec, verbose=1)
+        return gridspec.check_realizable(spec, verbose=1)
     
-    aut = tulip.gr1cint.synthesize(spec, verbose=1)
-    if aut is not None:
-        return BTAutomaton(tulip_aut=aut)
-    else:
-        return None  # Attempt at synthesis failed
+    # None if attempt at synthesis failed
+    return gridspec.synthesize(spec, verbose=1)
 
 
 def gen_navobs_soln_JTLV(init_list, goal_list, W, num_obs,
@@ -297,7 +245,7 @@ def gen_navobs_soln_JTLV(init_list, goal_list, W, num_obs,
                          goals_disjunct=None,
                          restrict_radius=1,
                          var_prefix="Y", env_prefix="X",
-                         fname_prefix="tempsyn"):
+                         fname_prefix="tempsyn", encoding="onehot"):
     """Generate solution as in gen_dsoln but now with dynamic obstacles.
 
     Use JTLV (as interfaced through TuLiP) for synthesis.
@@ -320,6 +268,8 @@ def gen_navobs_soln_JTLV(init_list, goal_list, W, num_obs,
     restrict_radius determines the domains of obstacles; cf. notes in
     function LTL_world.
 
+    encoding is as in gen_navobs_soln.
+
     Return instance of btsynth.BTAutomaton on success;
     None if not realizable, or an error occurs.
     """
@@ -335,153 +285,17 @@ def gen_navobs_soln_JTLV(init_list, goal_list, W, num_obs,
     if num_obs < 1:
         return gen_dsoln_JTLV(init_list=init_list, goal_list=goal_list, W=W,
                               goals_disjunct=goals_disjunct,
-                              var_prefix=var_prefix, fname_prefix=fname_prefix)
-
-    ########################################
-    # Environment prep
-    obs_bounds = []
-    env_str = []
-    for k in range(num_obs):
-        center_loc = env_goal_list[k]
-        row_low = center_loc[0]-restrict_radius
-        nowhere = [False,  # corresponds to row_low
-                   False,  # row_high
-                   False,  # col_low
-                   False]  # col_high
-        row_low = center_loc[0]-restrict_radius
-        if row_low < 0:
-            row_low = 0
-            nowhere[0] = True
-        row_high = center_loc[0]+restrict_radius
-        if row_high > W.shape[0]-1:
-            row_high = W.shape[0]-1
-            nowhere[1] = True
-        col_low = center_loc[1]-restrict_radius
-        if col_low < 0:
-            col_low = 0
-            nowhere[2] = True
-        col_high = center_loc[1]+restrict_radius
-        if col_high > W.shape[1]-1:
-            col_high = W.shape[1]-1
-            nowhere[3] = True
-        obs_bounds.append((row_low, row_high, col_low, col_high, nowhere))
-        env_str.append(LTL_world_JTLV(W, var_prefix="e."+env_prefix+"_"+str(k),
-                                      center_loc=center_loc,
-                                      restrict_radius=restrict_radius))
-
-    # Environment progress: always eventually obstacle returns to
-    # initial position.
-    env_goal_str = []
-    for k in range(num_obs):
-        center_loc = env_goal_list[k]
-        if (center_loc[0] >= 0 and center_loc[0] <= W.shape[0]-1
-            and center_loc[1] >= 0 and center_loc[1] <= W.shape[1]-1):
-            env_goal_str.append("[]<>(e."+env_prefix+"_"+str(k)+"_"+str(center_loc[0])+"_"+str(center_loc[1])+")")
-        else:
-            env_goal_str.append("[]<>(e."+env_prefix+"_"+str(k)+"_n_n)")
-    if len(env_goal_str) == 0:
-        env_goal_str = ""
-    else:
-        env_goal_str = " & ".join(env_goal_str) + " &\n"
-
-    env_init_str = ""
-    if (env_init_list is not None) and len(env_init_list) > 0:
-        for obs_ind in range(num_obs):
-            loc = env_init_list[obs_ind]
-            if len(env_init_str) > 0:
-                env_init_str += " | "
-            if (loc[0] < row_low or loc[0] > row_high
-                or loc[1] < col_low or loc[1] > col_high):
-                env_init_str += "(" + "e."+env_prefix+"_"+str(obs_ind)+"_n_n)"
-            else:
-                env_init_str += "(" + "e."+env_prefix+"_"+str(obs_ind)+"_"+str(loc[0])+"_"+str(loc[1]) + ")"
-    
-    ########################################
-    # Sys prep
-    safety_str = LTL_world_JTLV(W, var_prefix="s."+var_prefix)
-
-    init_str = ""
-    for loc in init_list:
-        if len(init_str) > 0:
-            init_str += " | "
-        init_str += "(" + "s."+var_prefix+"_"+str(loc[0])+"_"+str(loc[1]) + ")"
-
-    goal_str = ""
-    for loc in goal_list:
-        if len(goal_str) > 0:
-            goal_str += " & "
-        goal_str += "[]<>(" + "s."+var_prefix+"_"+str(loc[0])+"_"+str(loc[1]) + ")"
-    
-    if (goals_disjunct is not None) and len(goals_disjunct) > 0:
-        goal_dstr = ""
-        for loc in goals_disjunct:
-            if len(goal_dstr) == 0:
-                if len(goal_str) == 0:
-                    goal_dstr += "[]<>( s."+var_prefix+"_"+str(loc[0])+"_"+str(loc[1])
-                else:
-                    goal_dstr += " & []<>( s."+var_prefix+"_"+str(loc[0])+"_"+str(loc[1])
-            goal_dstr += " | s."+var_prefix+"_"+str(loc[0])+"_"+str(loc[1])
-        goal_dstr += " )"
-        goal_str += goal_dstr
-
-    ########################################
-    # Interaction: avoid collisions
-    coll_str = ""
-    for k in range(num_obs):
-        for i in range(obs_bounds[k][0], obs_bounds[k][1]+1):
-            for j in range(obs_bounds[k][2], obs_bounds[k][3]+1):
-                if len(coll_str) == 0:
-                    coll_str += "[]( "
-                else:
-                    coll_str += " & "
-                coll_str += "!(" + "s."+var_prefix+"_"+str(i)+"_"+str(j)
-                coll_str += " & e."+env_prefix+"_"+str(k)+"_"+str(i)+"_"+str(j)
-                coll_str += ")"
-    if len(coll_str) > 0:
-        coll_str += ")"
-
-
-    ########################################
-    # Create SMV file
-    with open(fname_prefix+".smv", "w") as f:
-        # Some parts of this code are copied from tulip/rhtlp.py
-        f.write("MODULE main \n")
-        f.write("\tVAR\n")
-        f.write("\t\te : env();\n")
-        f.write("\t\ts : sys();\n\n")
-        f.write("MODULE sys \n")
-        f.write("\tVAR\n")
-        for i in range(W.shape[0]):
-            for j in range(W.shape[1]):
-                f.write("\t\t" + var_prefix+"_"+str(i)+"_"+str(j) + " : boolean;\n")
-        f.write("MODULE env \n")
-        f.write("\tVAR\n")
-        for k in range(num_obs):
-            if (obs_bounds[k][4][0] or obs_bounds[k][4][1]
-                or obs_bounds[k][4][2] or obs_bounds[k][4][3]):
-                f.write("\t\t" + env_prefix+"_"+str(k)+"_n_n" + " : boolean;\n")
-            for i in range(obs_bounds[k][0], obs_bounds[k][1]+1):
-                for j in range(obs_bounds[k][2], obs_bounds[k][3]+1):
-                    f.write("\t\t" + env_prefix+"_"+str(k)+"_"+str(i)+"_"+str(j) + " : boolean;\n")
-
-    # Create SPC file
-    with open(fname_prefix+".spc", "w") as f:
-        f.write("LTLSPEC\n")
-        if len(env_init_str) > 0:
-            f.write("("+env_init_str+") & \n")
-        f.write(env_goal_str)
-        first_obs_flag = True
-        for k in range(num_obs):
-            if first_obs_flag:
-                f.write(env_str[k])
-                first_obs_flag = False
-            else:
-                f.write(" &\n" + env_str[k])
-        f.write("\n;\n\nLTLSPEC\n")
-        f.write("("+init_str+") & \n" + goal_str + " & \n" + safety_str)
-        if len(coll_str) > 0:
-            f.write(" & \n" + coll_str)
-        f.write("\n;")
+                              var_prefix=var_prefix, fname_prefix=fname_prefix,
+                              encoding=encoding)
+
+    spec = gridspec.navobs_spec(init_list=init_list, goal_list=goal_list, W=W,
+                                env_init_list=env_init_list[:num_obs],
+                                env_goal_list=env_goal_list[:num_obs],
+                                goals_disjunct=goals_disjunct,
+                                restrict_radius=restrict_radius,
+                                var_prefix=var_prefix, env_prefix=env_prefix,
+                                encoding=encoding)
+    spec.dump_jtlv(fname_prefix)
 
     # Try JTLV synthesis
     realizable = tulip.jtlvint.solveGame(smv_file=fname_prefix+".smv",
@@ -492,7 +306,64 @@ def gen_navobs_soln_JTLV(init_list, goal_list, W, num_obs,
     if not realizable:
         return None
     else:
-        return BTAutomaton(fname_prefix+".aut")
+        return read_jtlv_aut(fname_prefix+".aut", decode=spec.decode_state)
+
+
+def _screen_world(job):
+    """Worker for screen_realizability; job is (world, kwargs)."""
+    (world, kwargs) = job
+    if isinstance(world, str):
+        world = read_worldb(world)
+    if isinstance(world, World):
+        (W, goal_list, init_list, env_init_list) = (world.W, world.goal_list,
+                                                   world.init_list,
+                                                   world.env_init_list)
+    else:
+        (W, goal_list, init_list, env_init_list) = world
+    start = time.time()
+    result = gen_navobs_soln(init_list=init_list, goal_list=goal_list, W=W,
+                             num_obs=len(env_init_list),
+                             env_init_list=env_init_list,
+                             only_realizability=True, **kwargs)
+    return (result is True, time.time()-start)
+
+def screen_realizability(worlds, num_workers=None, pool=None, chunksize=1,
+                         **kwargs):
+    """Check realizability of many problems on a pool of processes.
+
+    worlds is an iterable (possibly a generator) of problems, each an
+    instance of World, a tuple (W, goal_list, init_list,
+    env_init_list) as returned by random_world, with one obstacle per
+    entry of env_init_list, or the name of a file from write_worldb.
+    Workers memory-map the latter (cf. read_worldb) rather than
+    receiving a copy of the world.  Each is checked by gen_navobs_soln with
+    only_realizability=True; remaining keyword arguments (e.g.,
+    restrict_radius and backend) are passed to it.
+
+    If pool is None, then a multiprocessing.Pool of num_workers
+    processes (default is number of CPUs) is created for this call,
+    unless num_workers is 1, in which case problems are checked in
+    this process.  Otherwise, the given pool is used (and not closed).
+
+    Return (mask, times), where mask is a bool array with entry True
+    for each realizable problem, and times is a float array of the
+    wall time (in seconds) of each check, both in the order of worlds.
+    """
+    jobs = ((world, kwargs) for world in worlds)
+    if pool is None and num_workers == 1:
+        results = [_screen_world(job) for job in jobs]
+    elif pool is None:
+        pool = multiprocessing.Pool(num_workers)
+        try:
+            results = list(pool.imap(_screen_world, jobs, chunksize))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = list(pool.imap(_screen_world, jobs, chunksize))
+    mask = np.array([r[0] for r in results], dtype=bool)
+    times = np.array([r[1] for r in results], dtype=float)
+    return mask, times
 
 
 def navobs_sim(init, aut, W_actual, num_obs, var_prefix="Y", env_prefix="X",
@@ -512,6 +383,7 @@ def navobs_sim(init, aut, W_actual, num_obs, var_prefix="Y", env_prefix="X",
     Same return values as in dsim, but also list of obstacle positions
     at time of failure.
     """
+    W_actual = world_matrix(W_actual)
     # Handle initialization as a special case.
     if W_actual[init[0]][init[1]] == 1:
         import pdb; pdb.set_trace()
@@ -563,10 +435,14 @@ def navobs_sim(init, aut, W_actual, num_obs, var_prefix="Y", env_prefix="X",
 
 
 def gen_dsoln(init_list, goal_list, W, goals_disjunct=None,
-              var_prefix="Y", only_realizability=False):
+              var_prefix="Y", only_realizability=False, backend="gr1c",
+              encoding="onehot", session=None):
     """Generate deterministic solution, given initial and goal states.
 
-    Use gr1c (as interfaced through TuLiP) for synthesis.
+    Use gr1c for synthesis (cf. gen_navobs_soln), or if backend is
+    "explicit", the in-process solver of btsynth.explicit.
+    If backend is "graph", then use gen_dsoln_graph.  encoding and
+    session are as in gen_navobs_soln.
 
     init_list is a list of pairs (row, col), signifying locations in
     the world matrix W from which the system can be initialized.
@@ -582,58 +458,119 @@ def gen_dsoln(init_list, goal_list, W, goals_disjunct=None,
     If only_realizability is True, then do *not* perform
     synthesis. Instead, only check realizability of the specification,
     and return True if realizable, False if not.
+
+    As in gen_navobs_soln, problems found unrealizable by precheck are
+    rejected without calling the solver.
     """
     if len(init_list) == 0:
         return None
+    if precheck(W, init_list, goal_list, goals_disjunct=goals_disjunct) is not None:
+        if only_realizability:
+            return False
+        return None
 
-    spec_trans = LTL_world(W, var_prefix=var_prefix)
+    if backend == "explicit":
+        return explicit.synthesize(init_list=init_list, goal_list=goal_list,
+                                   W=W, goals_disjunct=goals_disjunct,
+                                   var_prefix=var_prefix,
+                                   only_realizability=only_realizability)
+    elif backend == "graph":
+        return gen_dsoln_graph(init_list=init_list, goal_list=goal_list,
+                               W=W, goals_disjunct=goals_disjunct,
+                               var_prefix=var_prefix,
+                               only_realizability=only_realizability)
+    elif backend != "gr1c":
+        raise ValueError("unrecognized synthesis backend \""+str(backend)+"\"")
+
+    if session is not None:
+        session.check(W, var_prefix=var_prefix, encoding=encoding)
+        spec = session.spec(init_list=init_list, goal_list=goal_list,
+                            goals_disjunct=goals_disjunct)
+    else:
+        spec = gridspec.navobs_spec(init_list=init_list, goal_list=goal_list, W=W,
+                                    goals_disjunct=goals_disjunct,
+                                    var_prefix=var_prefix, encoding=encoding)
 
-    sys_vars = []
-    for i in range(W.shape[0]):
-        for j in range(W.shape[1]):
-            sys_vars.append(var_prefix+"_"+str(i)+"_"+str(j))
+    if only_realizability:
+        return gridspec.check_realizable(spec, verbose=1)
 
-    init_str = ""
-    for loc in init_list:
-        if len(init_str) > 0:
-            init_str += " | "
-        init_str += "(" + var_prefix+"_"+str(loc[0])+"_"+str(loc[1])
-        init_str_mutex = " & ".join(["!"+ovar for ovar in sys_vars if ovar != var_prefix+"_"+str(loc[0])+"_"+str(loc[1])])
-        if len(init_str_mutex) > 0:
-            init_str += " & " + init_str_mutex
-        init_str += ")"
+    # None if attempt at synthesis failed
+    return gridspec.synthesize(spec, verbose=1)
 
-    spec_goal = []
-    for loc in goal_list:
-        spec_goal.append(var_prefix+"_"+str(loc[0])+"_"+str(loc[1]))
 
-    if (goals_disjunct is not None) and len(goals_disjunct) > 0:
-        goal_dstr = ""
-        for loc in goals_disjunct:
-            if len(goal_dstr) == 0:
-                goal_dstr += var_prefix+"_"+str(loc[0])+"_"+str(loc[1])
-            else:
-                goal_dstr += " | "+var_prefix+"_"+str(loc[0])+"_"+str(loc[1])
-        spec_goal.append(goal_dstr)
+def gen_dsoln_graph(init_list, goal_list, W, goals_disjunct=None,
+                    var_prefix="Y", only_realizability=False):
+    """Generate deterministic solution using graph search only.
 
-    spec = GRSpec(sys_vars=sys_vars, sys_init=init_str,
-                  sys_safety=spec_trans, sys_prog=spec_goal)
+    Without an environment, visiting every goal infinitely often
+    amounts to finding a cycle through the goals within the open
+    region reachable from an initial location, together with a path
+    from that initial location to the cycle.  Both are built here
+    from shortest paths (breadth-first search) over open cells of W.
 
-    if only_realizability:
-        return tulip.gr1cint.check_realizable(spec, verbose=1)
+    Arguments and return values are as in gen_dsoln.  The automaton
+    has the same shape as one from create_nominal (without env): a
+    lasso for each initial location from which all goals (and at
+    least one location of goals_disjunct, if given) are reachable.
+    """
+    if len(init_list) == 0:
+        return None
 
-    aut = tulip.gr1cint.synthesize(spec, verbose=1)
-    if aut is not None:
-        return BTAutomaton(tulip_aut=aut)
+    goal_dists = [dist_field(W, [loc]) for loc in goal_list]
+    if (goals_disjunct is not None) and len(goals_disjunct) > 0:
+        disjunct_dist = dist_field(W, goals_disjunct)
     else:
-        return None  # Attempt at synthesis failed
+        disjunct_dist = None
+    world = W
+    W = world_matrix(W)
+
+    aut = BTAutomaton()
+    for init in init_list:
+        if (init[0] < 0 or init[0] >= W.shape[0]
+            or init[1] < 0 or init[1] >= W.shape[1]
+            or W[init[0]][init[1]] != 0):
+            continue
+        if not all([dist[init[0]][init[1]] >= 0 for dist in goal_dists]):
+            continue
+        stops = [tuple(loc) for loc in goal_list]
+        dists = goal_dists[:]
+        if disjunct_dist is not None:
+            if disjunct_dist[init[0]][init[1]] < 0:
+                continue
+            # Visit the disjunctive goal nearest the last stop
+            last = stops[-1] if len(stops) > 0 else init
+            d = grid_path(W, last, None, dist=disjunct_dist)[-1]
+            stops.append(d)
+            dists.append(dist_field(world, [d]))
+        if only_realizability:
+            return True
+
+        if len(stops) == 0:
+            path = [tuple(init)]
+            loop_marker = 0
+        else:
+            path = grid_path(W, init, stops[0], dist=dists[0])
+            loop_marker = len(path)-1
+            for k in range(1, len(stops)):
+                path.extend(grid_path(W, stops[k-1], stops[k], dist=dists[k])[1:])
+            # Close the loop, without repeating the first stop
+            path.extend(grid_path(W, stops[-1], stops[0], dist=dists[0])[1:-1])
+        append_path(aut, W, path, loop_marker, var_prefix=var_prefix)
+
+    if only_realizability:
+        return False
+    if aut.size() == 0:
+        return None
+    aut.recastBTAutNodes()
+    return aut
 
 
 def gen_dsoln_JTLV(init_list, goal_list, W, goals_disjunct=None,
-                   var_prefix="Y", fname_prefix="tempsyn"):
+                   var_prefix="Y", fname_prefix="tempsyn", encoding="onehot"):
     """Generate deterministic solution, given initial and goal states.
 
-    Use JTLV (as interfaced through TuLiP) for synthesis.
+    Use JTLV (as interfaced through TuLiP) for synthesis.  encoding is
+    as in gen_navobs_soln.
 
     init_list is a list of pairs (row, col), signifying locations in
     the world matrix W from which the system can be initialized.
@@ -649,52 +586,10 @@ def gen_dsoln_JTLV(init_list, goal_list, W, goals_disjunct=None,
     if len(init_list) == 0:
         return None
 
-    safety_str = LTL_world_JTLV(W, var_prefix="s."+var_prefix)
-
-    init_str = ""
-    for loc in init_list:
-        if len(init_str) > 0:
-            init_str += " | "
-        init_str += "(" + "s."+var_prefix+"_"+str(loc[0])+"_"+str(loc[1]) + ")"
-
-    goal_str = ""
-    for loc in goal_list:
-        if len(goal_str) > 0:
-            goal_str += " & "
-        goal_str += "[]<>(" + "s."+var_prefix+"_"+str(loc[0])+"_"+str(loc[1]) + ")"
-
-    if goals_disjunct is not None:
-        goal_dstr = ""
-        for loc in goals_disjunct:
-            if len(goal_dstr) == 0:
-                if len(goal_str) == 0:
-                    goal_dstr += "[]<>( s."+var_prefix+"_"+str(loc[0])+"_"+str(loc[1])
-                else:
-                    goal_dstr += " & []<>( s."+var_prefix+"_"+str(loc[0])+"_"+str(loc[1])
-            goal_dstr += " | s."+var_prefix+"_"+str(loc[0])+"_"+str(loc[1])
-        goal_dstr += " )"
-        goal_str += goal_dstr
-
-    # Create SMV file
-    with open(fname_prefix+".smv", "w") as f:
-        # Some parts of this code are copied from tulip/rhtlp.py
-        f.write("MODULE main \n")
-        f.write("\tVAR\n")
-        f.write("\t\te : env();\n")
-        f.write("\t\ts : sys();\n\n")
-        f.write("MODULE sys \n")
-        f.write("\tVAR\n")
-        for i in range(W.shape[0]):
-            for j in range(W.shape[1]):
-                f.write("\t\t" + var_prefix+"_"+str(i)+"_"+str(j) + " : boolean;\n")
-        f.write("MODULE env \n")
-        f.write("\tVAR\n")
-
-    # Create SPC file
-    with open(fname_prefix+".spc", "w") as f:
-        f.write("LTLSPEC\n;\n\nLTLSPEC\n")
-        f.write("("+init_str+") & \n" + goal_str + " & \n" + safety_str)
-        f.write("\n;")
+    spec = gridspec.navobs_spec(init_list=init_list, goal_list=goal_list, W=W,
+                                goals_disjunct=goals_disjunct,
+                                var_prefix=var_prefix, encoding=encoding)
+    spec.dump_jtlv(fname_prefix)
     
     # Try JTLV synthesis
     realizable = tulip.jtlvint.solveGame(smv_file=fname_prefix+".smv",
@@ -704,7 +599,7 @@ def gen_dsoln_JTLV(init_list, goal_list, W, goals_disjunct=None,
     if not realizable:
         return None
     else:
-        return BTAutomaton(fname_prefix+".aut")
+        return read_jtlv_aut(fname_prefix+".aut", decode=spec.decode_state)
 
 
 def dsim(init, aut, W_actual, var_prefix="Y", num_it=100):
@@ -731,6 +626,7 @@ def dsim(init, aut, W_actual, var_prefix="Y", num_it=100):
     If quit because max number of iterations reached, history is
     returned and True (rather than an intended location).
     """
+    W_actual = world_matrix(W_actual)
     # Handle initialization as a special case.
     if W_actual[init[0]][init[1]] == 1:
         return init, None
@@ -808,7 +704,173 @@ def rule_setmatch(aut, memory, prev_node_id, node_id, this_input):
     return memory
 
 
-def btsim_d(init, goal_list, aut, W_actual, num_steps=100, var_prefix="Y"):
+def initial_patch_radius(aut, W_actual, entry_loc, intent, var_prefix="Y"):
+    """Radius at which to begin patching around a newly blocked cell.
+
+    The blocked route arrives at intent from entry_loc (the position
+    at time of failure) and continues to the positions of successors
+    of nodes labeled with intent.  Return patch_radius for these,
+    i.e., the smallest neighborhood in which the route can be
+    rerouted, or 1 if intent has no other successors.  Return None
+    if the route cannot be rerouted anywhere in W_actual.
+    """
+    nodes = dict([(node.id, node) for node in aut.states])
+    exit_locs = set()
+    for node in aut.states:
+        if extract_autcoord(node, var_prefix=var_prefix)[0] != intent:
+            continue
+        for next_id in node.transition:
+            loc = extract_autcoord(nodes[next_id], var_prefix=var_prefix)[0]
+            if loc != intent:
+                exit_locs.add(loc)
+    if len(exit_locs) == 0:
+        return 1
+    return patch_radius(W_actual, intent, entry_loc, exit_locs)
+
+
+def _broken_route(aut, history, intent, radius, var_prefix="Y"):
+    """Cells of the route broken at intent, within the square of radius.
+
+    The route is the suffix of history inside the square, intent, and
+    positions of nodes reachable in aut from nodes labeled intent
+    without leaving the square.
+    """
+    inside = lambda loc: (abs(loc[0]-intent[0]) <= radius
+                          and abs(loc[1]-intent[1]) <= radius)
+    route = [intent]
+    for loc in reversed(history):
+        if not inside(loc):
+            break
+        route.append(loc)
+    nodes = dict([(node.id, node) for node in aut.states])
+    frontier = [node.id for node in aut.states
+                if extract_autcoord(node, var_prefix=var_prefix)[0] == intent]
+    visited = set(frontier)
+    while len(frontier) > 0:
+        node_id = frontier.pop()
+        for next_id in nodes[node_id].transition:
+            if next_id in visited:
+                continue
+            visited.add(next_id)
+            loc = extract_autcoord(nodes[next_id], var_prefix=var_prefix)[0]
+            if inside(loc):
+                route.append(loc)
+                frontier.append(next_id)
+    return route
+
+
+def _patch_connected(W_patch, local_problems, patch_goal_list):
+    """Can every local problem of a patch possibly be solved?
+
+    local_problems is a list of (init_loc, local_goals) pairs in
+    coordinates of W_patch.  Each requires that all of
+    patch_goal_list and, if local_goals is nonempty, at least one of
+    local_goals be reachable from init_loc through open cells of
+    W_patch.  If not, then synthesis must fail for that problem.
+    """
+    for (init_loc, local_goals) in local_problems:
+        reached = dist_field(W_patch, [init_loc]) >= 0
+        if not all([reached[i][j] for (i, j) in patch_goal_list]):
+            return False
+        if (len(local_goals) > 0
+            and not any([reached[i][j] for (i, j) in local_goals])):
+            return False
+    return True
+
+
+def dstar_patch(aut, intent, W_known, planners, var_prefix="Y"):
+    """Repair deterministic controller around a newly blocked cell.
+
+    Mark intent as occupied in W_known (modified in place) and in
+    every planner of the dictionary planners, which maps goal cells to
+    instances of btsynth.dstar.DStarLite and is kept by the caller
+    between faults.  Then, for each edge into a node at intent, find
+    the first unblocked node along the original plan, and splice into
+    aut a detour from the edge source to that node, as planned by
+    D* Lite on W_known.  Finally, nodes at intent are removed.
+
+    Only the affected part of the plan is changed.  Return True on
+    success, False if some detour is impossible (in which case aut is
+    left in an undefined state).
+    """
+    W_known[intent[0]][intent[1]] = 1
+    for planner in planners.values():
+        planner.block(intent)
+
+    blocked = []
+    for node in aut.states:
+        coord = extract_autcoord(node, var_prefix=var_prefix)
+        if (coord is not None) and coord[0] == intent:
+            blocked.append(node.id)
+    S0 = aut.getAutInit()
+
+    for blocked_id in blocked:
+        for prev_node in aut.getAutInSet(blocked_id):
+            if prev_node.id in blocked:
+                continue
+            # Rejoin original plan at first unblocked node
+            next_id = blocked_id
+            visited = set()
+            while next_id in blocked:
+                next_node = aut.getAutState(next_id)
+                if (next_id in visited) or len(next_node.transition) == 0:
+                    return False
+                visited.add(next_id)
+                next_id = next_node.transition[0]
+            src_loc = extract_autcoord(prev_node, var_prefix=var_prefix)[0]
+            dest_loc = extract_autcoord(aut.getAutState(next_id), var_prefix=var_prefix)[0]
+            if not planners.has_key(dest_loc):
+                planners[dest_loc] = DStarLite(W_known, dest_loc)
+            path = planners[dest_loc].plan(src_loc)
+            if path is None:
+                return False
+            while blocked_id in prev_node.transition:
+                aut.spliceGridPath(prev_node.id, blocked_id, next_id, path[1:-1],
+                                   var_prefix=var_prefix)
+
+    for blocked_id in blocked:
+        aut.removeNode(blocked_id)
+    aut.trimUnconnectedStates([node for node in S0 if node.id not in blocked])
+    aut.packIDs()
+    return True
+
+
+def _open_checkpoint(checkpoint, sim_name, args):
+    """Return SimCheckpoint for the checkpoint argument of btsim_d or
+    btsim_navobs, given the arguments (locals()) of the call, or None.
+    """
+    if checkpoint is None:
+        return None
+    if isinstance(checkpoint, SimCheckpoint):
+        return checkpoint  # Resuming; cf. resume_btsim
+    args = dict(args)
+    del args["aut"]
+    del args["checkpoint"]
+    return SimCheckpoint(checkpoint, sim_name, args)
+
+
+def resume_btsim(dirname):
+    """Continue the run of btsim_d or btsim_navobs checkpointed in dirname.
+
+    The automaton, its memory, the step count and the states of the
+    random number generators are restored as of the last checkpoint,
+    and the run is continued from there (and checkpointed as before).
+    Return values are those of the run.
+    """
+    ckpt = SimCheckpoint(dirname)
+    ckpt.restore_random()
+    if ckpt.sim_name == "btsim_d":
+        sim = btsim_d
+    elif ckpt.sim_name == "btsim_navobs":
+        sim = btsim_navobs
+    else:
+        raise ValueError("unrecognized simulation \""+str(ckpt.sim_name)+"\"")
+    return sim(aut=ckpt.aut, checkpoint=ckpt, **ckpt.args)
+
+
+def btsim_d(init, goal_list, aut, W_actual, num_steps=100, var_prefix="Y",
+            backend="gr1c", engine="patch", W=None, region="square",
+            minimize=False, checkpoint=None):
     """Backtrack/patching algorithm, applied to deterministic problem.
 
     This case is elementary and, being non-adversarial, may be better
@@ -833,432 +895,624 @@ def btsim_d(init, goal_list, aut, W_actual, num_steps=100, var_prefix="Y"):
 
     If patching is impossible or seems as hard as the original
     (overall) problem, then return (None, None).
+
+    backend is passed to gen_dsoln for solving local problems.
+
+    engine selects how faults are repaired.  The default, "patch", is
+    the backtracking algorithm: local problems are solved in square
+    neighborhoods of growing radius and merged into aut.  If engine is
+    "dstar", then dstar_patch is used instead, with D* Lite planners
+    kept between faults; the known world then starts as W (the nominal
+    world) if given, else as W_actual with all cells visited by aut
+    assumed open, and it is returned at completion.
+
+    region is the shape of patching neighborhoods, as in patch_region;
+    the default is a square.  For other shapes, cells of the bounding
+    rectangle outside the neighborhood are blocked in local problems.
+
+    If minimize is True, then equivalent nodes are merged after each
+    repair; cf. BTAutomaton.minimize.
+
+    If checkpoint is not None, then it is the name of a directory in
+    which the run is checkpointed at the start and after each repair,
+    so that it can be continued by resume_btsim if interrupted.
+    Checkpoints are written by a background thread; cf. module
+    btsynth.checkpoint.  While running, aut has a journal in the
+    checkpoint directory (cf. BTAutomaton.openJournal), so it should
+    not have another.
     """
+    ckpt = _open_checkpoint(checkpoint, "btsim_d", locals())
+    W_actual = world_matrix(W_actual)
+    init_var = var_prefix+"_"+str(init[0])+"_"+str(init[1])
+    if engine == "dstar":
+        W = world_matrix(W)
+        if W is not None:
+            W_known = W.copy()
+        else:
+            W_known = W_actual.copy()
+            for node in aut.states:
+                coord = extract_autcoord(node, var_prefix=var_prefix)
+                if coord is not None:
+                    W_known[coord[0][0]][coord[0][1]] = 0
+        planners = dict()
+    elif engine == "patch":
+        W_known = None
+    else:
+        raise ValueError("unrecognized repair engine \""+str(engine)+"\"")
     step_count = 0
-    while True:
-        if step_count == num_steps:
-            return aut, None
+    if ckpt is not None:
+        step_count = ckpt.step_count
+        if ckpt.extra is not None:
+            (W_known, planners) = ckpt.extra
+    try:
+        while True:
+            if ckpt is not None:
+                if engine == "dstar":
+                    ckpt.save(aut, step_count, extra=(W_known, planners))
+                else:
+                    ckpt.save(aut, step_count)
+            if step_count == num_steps:
+                return aut, W_known
 
-        # Loop invariants
-        if num_steps-step_count < 0:
-            raise ValueError("overstepped bt dsim loop.")
+            # Loop invariants
+            if num_steps-step_count < 0:
+                raise ValueError("overstepped bt dsim loop.")
         
-        # Sim
-        history, intent = dsim(init, aut, W_actual, var_prefix=var_prefix,
-                               num_it=num_steps-step_count)
-        if intent is True:
-            return aut, None
-        step_count += len(history)
-
-        # Detect special case
-        if intent in goal_list:
-            return None, None
-
-        # Patch (terminology follows that of the paper)
-        gamma = 1  # radius
-        delta = 1  # increment
-        iteration_count = 0
-        while True:
-            iteration_count += 1
-            radius = gamma + (iteration_count-1)*delta
-            nbhd_inclusion = []  # Use Manhattan distance as metric
-            for i in range(intent[0]-radius, intent[0]+radius+1):
-                for j in range(intent[1]-radius, intent[1]+radius+1):
-                    if i >= 0 and i < W_actual.shape[0] \
-                            and j >= 0 and j < W_actual.shape[1]:
-                        nbhd_inclusion.append((i, j))
-            if len(nbhd_inclusion) == 0:
-                raise ValueError("gamma radius is too small; neighborhood is empty.")
-            patch_goal_list = []
-            for v in nbhd_inclusion:
-                if v in goal_list:
-                    patch_goal_list.append(v)
-            fail_loc_var = var_prefix+"_"+str(intent[0])+"_"+str(intent[1])
+            # Sim
+            history, intent = dsim(init, aut, W_actual, var_prefix=var_prefix,
+                                   num_it=num_steps-step_count)
+            if intent is True:
+                return aut, W_known
+            step_count += len(history)
+
+            # Detect special case
+            if intent in goal_list:
+                return None, None
+
+            if engine == "dstar":
+                if not dstar_patch(aut, intent, W_known, planners,
+                                   var_prefix=var_prefix):
+                    return None, None
+                if minimize:
+                    aut.minimize()
+                    aut.packIDs()
+                continue
+
+            # Patch (terminology follows that of the paper).  Radii smaller
+            # than needed to reroute around intent are not tried.
+            gamma = initial_patch_radius(aut, W_actual, history[-1], intent,
+                                         var_prefix=var_prefix)  # radius
+            if gamma is None:
+                return None, None
+            delta = 1  # increment
+            iteration_count = 0
+            last_nbhd = None
+            while True:
+                iteration_count += 1
+                radius = gamma + (iteration_count-1)*delta
+                if radius > max_patch_radius(W_actual):
+                    return None, None  # Largest region already tried
+                if region == "corridor":
+                    route = _broken_route(aut, history, intent, radius,
+                                          var_prefix=var_prefix)
+                else:
+                    route = None
+                nbhd_inclusion = patch_region(W_actual, intent, radius,
+                                              shape=region, route=route)
+                if len(nbhd_inclusion) == 0:
+                    raise ValueError("gamma radius is too small; neighborhood is empty.")
+                if nbhd_inclusion == last_nbhd:
+                    continue  # Same region as at the last radius, which failed
+                last_nbhd = nbhd_inclusion
+                patch_goal_list = []
+                for v in nbhd_inclusion:
+                    if v in goal_list:
+                        patch_goal_list.append(v)
+                fail_loc_var = var_prefix+"_"+str(intent[0])+"_"+str(intent[1])
             
-            # Set of nodes in M corresponding to abstract neighborhood.
-            Reg = aut.computeGridReg(nbhd=nbhd_inclusion, var_prefix=var_prefix)
-            S0 = aut.getAutInit()
-            Init = set([node.id for node in S0]) & set(Reg)
-            Entry = aut.findEntry(Reg)
-            Exit = aut.findExit(Reg)
+                # Set of nodes in M corresponding to abstract neighborhood.
+                Reg = aut.computeGridReg(nbhd=nbhd_inclusion, var_prefix=var_prefix)
+                S0 = aut.getAutInit()
+                # Nodes where the simulation starts may be on a cycle,
+                # hence not in S0; cf. the trim after merging.
+                Init = (set([node.id for node in S0+aut.findAllAutPartState({init_var: 1})])
+                        & set(Reg))
+                Entry = aut.findEntry(Reg)
+                Exit = aut.findExit(Reg)
+                if len(Reg) == aut.size():
+                    return None, None  # Arrived at global problem, i.e., S = Reg
             
-            W_patch, offset = subworld(W_actual, nbhd_inclusion)
-            # Shift coordinates to be w.r.t. W_patch
-            for ind in range(len(patch_goal_list)):
-                patch_goal_list[ind] = (patch_goal_list[ind][0]-offset[0],
-                                        patch_goal_list[ind][1]-offset[1])
+                W_patch, offset = subworld(W_actual, nbhd_inclusion,
+                                           mask=(region != "square"))
+                # Shift coordinates to be w.r.t. W_patch
+                for ind in range(len(patch_goal_list)):
+                    patch_goal_list[ind] = (patch_goal_list[ind][0]-offset[0],
+                                            patch_goal_list[ind][1]-offset[1])
             
-            patch_auts = []
-            fail_flag = False
-            for l in Init|set(Entry):
-                init_loc = extract_autcoord(aut.getAutState(l), var_prefix=var_prefix)[0]
-                init_loc = (init_loc[0]-offset[0], init_loc[1]-offset[1])
-                local_goals_IDs = list(aut.computeReach(l, Reg) & set(Exit))
-                local_goals = []
-                for goal_ID in local_goals_IDs:
-                    local_goals.append(extract_autcoord(aut.getAutState(goal_ID),
-                                                        var_prefix=var_prefix)[0])
-                    local_goals[-1] = (local_goals[-1][0]-offset[0],
-                                       local_goals[-1][1]-offset[1])
-                aut_patch = gen_dsoln(init_list=[init_loc], goal_list=patch_goal_list,
-                                      W=W_patch, goals_disjunct=local_goals,
-                                      var_prefix=var_prefix)
-                if aut_patch is not None:
-                    patch_auts.append((aut_patch, l, local_goals_IDs))
-                else:
-                    fail_flag = True
-                    break
-            if not fail_flag:
-                break
-
-        # Merge (in several steps)
-
-        # Set rule to clearing mem cells for nodes in the original M
-        for node in aut.states:
-            node.addNodeRule(rule_clearall)
-
-        # Adjust map coordinates from local (patch-centric) to global,
-        # and expand set of variables of the patch to include all
-        # those of the (original) global problem.
-        patch_id_maps = []
-        full_state = aut.states[0].state.keys()  # Pick out full variable list
-        for aut_ind in range(len(patch_auts)):
-            Ml = patch_auts[aut_ind][0]
-            for node in Ml.states:
-                prev_keys = node.state.keys()
-                (i, j) = extract_autcoord(node, var_prefix=var_prefix)[0]
-                node.state = dict([(k, 0) for k in full_state])
-                node.state[var_prefix+"_"+str(i+offset[0])+"_"+str(j+offset[1])] = 1
-                node.addNodeRule(rule_setmatch)
-            patch_id_maps.append(aut.importChildAut(Ml))
-
-        # Undo offset of the part of sys goal list addressed in patch
-        for k in range(len(patch_goal_list)):
-            patch_goal_list[k] = (patch_goal_list[k][0]+offset[0],
-                                  patch_goal_list[k][1]+offset[1])
-
-        # Add memory for these goals
-        aut.memInit([var_prefix+"_"+str(i)+"_"+str(j) for (i, j) in patch_goal_list])
-
-        # Attach entry and exit points
-        for aut_ind in range(len(patch_auts)):
-            l = patch_auts[aut_ind][1]
-            Ml = patch_auts[aut_ind][0]
-            local_goals_IDs = patch_auts[aut_ind][2]
-            entry_node = aut.getAutState(l)
-            match_list = Ml.findAllAutState(entry_node.state)
-            if len(match_list) == 0:
-                raise Exception("FATAL")
-            # Shortcut, given we are only addressing deterministic
-            # (non-adversarial) problem in this example.
-            entry_node.transition = [patch_id_maps[aut_ind][match_list[0].transition[0]]]
-
-            match_flag = False
-            for local_goal_ID in local_goals_IDs:
-                goal_node = aut.getAutState(local_goal_ID)
-                match_list = Ml.findAllAutState(goal_node.state)
-                if len(match_list) > 0:
-                    match_flag = True
-                for match_node in match_list:
-                    if len(aut.getMem()) > 0:
-                        for k in range(len(aut.getAutState(patch_id_maps[aut_ind][match_node.id]).cond)):
-                            if aut.getAutState(patch_id_maps[aut_ind][match_node.id]).cond[k] is None:
-                                aut.getAutState(patch_id_maps[aut_ind][match_node.id]).cond[k] = cond_anynot
-                        aut.getAutState(patch_id_maps[aut_ind][match_node.id]).cond.extend([cond_all for k in goal_node.cond])
-                        aut.getAutState(patch_id_maps[aut_ind][match_node.id]).transition.extend(goal_node.transition)
+                local_problems = []
+                for l in Init|set(Entry):
+                    init_loc = extract_autcoord(aut.getAutState(l), var_prefix=var_prefix)[0]
+                    init_loc = (init_loc[0]-offset[0], init_loc[1]-offset[1])
+                    local_goals_IDs = list(aut.computeReach(l, Reg) & set(Exit))
+                    local_goals = []
+                    for goal_ID in local_goals_IDs:
+                        local_goals.append(extract_autcoord(aut.getAutState(goal_ID),
+                                                            var_prefix=var_prefix)[0])
+                        local_goals[-1] = (local_goals[-1][0]-offset[0],
+                                           local_goals[-1][1]-offset[1])
+                    local_problems.append((l, init_loc, local_goals_IDs, local_goals))
+                if not _patch_connected(W_patch, [(p[1], p[3]) for p in local_problems],
+                                        patch_goal_list):
+                    continue  # Provably infeasible; skip synthesis
+
+                patch_auts = []
+                fail_flag = False
+                for (l, init_loc, local_goals_IDs, local_goals) in local_problems:
+                    aut_patch = gen_dsoln(init_list=[init_loc], goal_list=patch_goal_list,
+                                          W=W_patch, goals_disjunct=local_goals,
+                                          var_prefix=var_prefix, backend=backend)
+                    if aut_patch is not None:
+                        patch_auts.append((aut_patch, l, local_goals_IDs))
                     else:
-                        aut.getAutState(patch_id_maps[aut_ind][match_node.id]).cond = [None for k in aut.getAutState(patch_id_maps[aut_ind][match_node.id]).transition]
-                        aut.getAutState(patch_id_maps[aut_ind][match_node.id]).cond.extend([None for k in goal_node.cond])
-                        aut.getAutState(patch_id_maps[aut_ind][match_node.id]).transition = goal_node.transition[:]
+                        fail_flag = True
+                        break
+                if not fail_flag:
+                    break
+
+            # Merge (in several steps)
+            # Changes to aut are undone if any step fails, so that the
+            # given controller is left intact.
+            snap = aut.snapshot()
+            try:
+                # Set rule to clearing mem cells for nodes in the original M
+                aut.allRule(rule_clearall)
+
+                # Adjust map coordinates from local (patch-centric) to global,
+                # and expand set of variables of the patch to include all
+                # those of the (original) global problem.
+                patch_id_maps = []
+                full_state = aut.states[0].state.keys()  # Pick out full variable list
+                for aut_ind in range(len(patch_auts)):
+                    Ml = patch_auts[aut_ind][0]
+                    for node in Ml.states:
+                        prev_keys = node.state.keys()
+                        (i, j) = extract_autcoord(node, var_prefix=var_prefix)[0]
+                        node.state = dict([(k, 0) for k in full_state])
+                        node.state[var_prefix+"_"+str(i+offset[0])+"_"+str(j+offset[1])] = 1
+                        node.addNodeRule(rule_setmatch)
+                    patch_id_maps.append(aut.importChildAut(Ml))
+
+                # Undo offset of the part of sys goal list addressed in patch
+                for k in range(len(patch_goal_list)):
+                    patch_goal_list[k] = (patch_goal_list[k][0]+offset[0],
+                                          patch_goal_list[k][1]+offset[1])
+
+                # Add memory for these goals
+                aut.memInit([var_prefix+"_"+str(i)+"_"+str(j) for (i, j) in patch_goal_list])
+
+                # Attach entry and exit points
+                for aut_ind in range(len(patch_auts)):
+                    l = patch_auts[aut_ind][1]
+                    Ml = patch_auts[aut_ind][0]
+                    local_goals_IDs = patch_auts[aut_ind][2]
+                    entry_node = aut.editNode(l)
+                    match_list = Ml.findAllAutState(entry_node.state)
+                    if len(match_list) == 0:
+                        raise Exception("FATAL")
+                    # Shortcut, given we are only addressing deterministic
+                    # (non-adversarial) problem in this example.
+                    entry_node.transition = [patch_id_maps[aut_ind][match_list[0].transition[0]]]
+
+                    match_flag = False
+                    for local_goal_ID in local_goals_IDs:
+                        goal_node = aut.getAutState(local_goal_ID)
+                        match_list = Ml.findAllAutState(goal_node.state)
+                        if len(match_list) > 0:
+                            match_flag = True
+                        for match_node in match_list:
+                            patch_node = aut.editNode(patch_id_maps[aut_ind][match_node.id])
+                            if len(aut.getMem()) > 0:
+                                for k in range(len(patch_node.cond)):
+                                    if patch_node.cond[k] is None:
+                                        patch_node.cond[k] = cond_anynot
+                                patch_node.cond.extend([cond_all for k in goal_node.cond])
+                                patch_node.transition.extend(goal_node.transition)
+                            else:
+                                patch_node.cond = [None for k in patch_node.transition]
+                                patch_node.cond.extend([None for k in goal_node.cond])
+                                patch_node.transition = goal_node.transition[:]
                     
                     
-            if not match_flag:
-                raise Exception("FATAL")
+                    if not match_flag:
+                        raise Exception("FATAL")
             
-        # Delete blocked nodes and dependent edges
-        kill_list = []
-        for ind in range(len(aut.states)):
-            if extract_autcoord(aut.states[ind], var_prefix=var_prefix)[0] == intent:
-                kill_list.append(aut.states[ind].id)
-        for kill_id in kill_list:
-            aut.removeNode(kill_id)
-        aut.packIDs()
+                # Delete blocked nodes and dependent edges
+                kill_list = []
+                for ind in range(len(aut.states)):
+                    if extract_autcoord(aut.states[ind], var_prefix=var_prefix)[0] == intent:
+                        kill_list.append(aut.states[ind].id)
+                for kill_id in kill_list:
+                    aut.removeNode(kill_id)
+                aut.packIDs()
         
-        # Pick-off invalid initial nodes
-        aut.removeFalseInits(S0)
-        aut.packIDs()
+                # Drop invalid initial nodes, and all else not reachable.
+                # Nodes where the simulation starts (cf. dsim) may be on
+                # a cycle, hence not in S0, so also keep what they reach.
+                aut.trimUnconnectedStates(list(S0)+aut.findAllAutPartState({init_var: 1}))
+                if minimize:
+                    aut.minimize()
+                aut.packIDs()
+            except:
+                aut.rollback(snap)
+                raise
+            aut.release(snap)
+            aut.flushJournal()  # Only the patch is written, if aut has a journal
+    finally:
+        if ckpt is not None:
+            ckpt.close()
 
 
 def btsim_navobs(init, goal_list, aut, W_actual,
                  env_init_list, restrict_radius=1,
                  num_obs=None,
                  num_steps=100,
-                 var_prefix="Y", env_prefix="X", use_JTLV=False):
+                 var_prefix="Y", env_prefix="X", use_JTLV=False,
+                 backend="gr1c", region="square", minimize=False,
+                 checkpoint=None):
     """Sister to btsim_d, but now for solutions from gen_navobs_soln.
     
     if num_obs is None, set it to len(env_init_list); this is a
     temporary hack till I clean up the code.
 
+    backend is passed to gen_navobs_soln for solving local problems;
+    it is ignored if use_JTLV is True.
+
     If the global problem is recovered, then a warning is printed and
     (None, None) is returned.
 
+    Obstacles that cannot reach the patch neighborhood (i.e., the
+    reachable part of their restricted region does not meet it) are
+    left out of the local problem, and restored as unconstrained when
+    merging the patch.
+
+    region is as in btsim_d.  Since blocking cells outside the
+    neighborhood would also confine obstacles, shapes other than the
+    square are only used when no obstacle can reach the square
+    neighborhood of the same radius.
+
+    minimize and checkpoint are as in btsim_d.
+
     Cf. doc for navobs_sim and gen_navobs_soln.
     """
+    ckpt = _open_checkpoint(checkpoint, "btsim_navobs", locals())
+    W_actual = world_matrix(W_actual)
+    init_var = var_prefix+"_"+str(init[0])+"_"+str(init[1])
     if num_obs is None:
         num_obs = len(env_init_list)
     # We do not (yet) allow env obstacle init/goals to differ by user choice
     env_goal_list = env_init_list[:]
+    obs_cells = [gridspec.reachable_cells(W_actual, [env_init_list[obs]],
+                                          center_loc=env_goal_list[obs],
+                                          restrict_radius=restrict_radius)
+                 for obs in range(num_obs)]
     step_count = 0
-    while True:
-        if step_count == num_steps:
-            return aut, None
-
-        # Loop invariants
-        if num_steps-step_count < 0:
-            raise ValueError("overstepped bt sim_navobs loop.")
-        
-        # Sim
-        history, intent, obs_poses = navobs_sim(init, aut, W_actual,
-                                                num_obs=num_obs,
-                                                var_prefix=var_prefix,
-                                                env_prefix=env_prefix,
-                                                num_it=num_steps-step_count)
-        if intent is True:
-            return aut, None
-        step_count += len(history)
-
-        # Detect special case
-        if intent in goal_list:
-            return None, None
-
-        # Patch (terminology follows that of the paper)
-        gamma = 1  # radius, increment
-        radius = 0
+    if ckpt is not None:
+        step_count = ckpt.step_count
+    try:
         while True:
-            radius += gamma
-            print "r_inc = "+str(radius)
-            nbhd_inclusion = []  # Use Manhattan distance as metric
-            for i in range(intent[0]-radius, intent[0]+radius+1):
-                for j in range(intent[1]-radius, intent[1]+radius+1):
-                    if i >= 0 and i < W_actual.shape[0] \
-                            and j >= 0 and j < W_actual.shape[1]:
-                        nbhd_inclusion.append((i, j))
-            if len(nbhd_inclusion) == 0:
-                raise ValueError("gamma radius is too small; neighborhood is empty.")
-            patch_goal_list = []
-            patch_env_goals = []
-            for v in nbhd_inclusion:
-                if v in goal_list:
-                    patch_goal_list.append(v)
-                if v in env_goal_list:
-                    patch_env_goals.append((env_goal_list.index(v), v))
-            fail_loc_var = var_prefix+"_"+str(intent[0])+"_"+str(intent[1])
+            if ckpt is not None:
+                ckpt.save(aut, step_count)
+            if step_count == num_steps:
+                return aut, None
+
+            # Loop invariants
+            if num_steps-step_count < 0:
+                raise ValueError("overstepped bt sim_navobs loop.")
+        
+            # Sim
+            history, intent, obs_poses = navobs_sim(init, aut, W_actual,
+                                                    num_obs=num_obs,
+                                                    var_prefix=var_prefix,
+                                                    env_prefix=env_prefix,
+                                                    num_it=num_steps-step_count)
+            if intent is True:
+                return aut, None
+            step_count += len(history)
+
+            # Detect special case
+            if intent in goal_list:
+                return None, None
+
+            # Patch (terminology follows that of the paper).  Radii smaller
+            # than needed to reroute around intent are not tried.
+            gamma = 1  # increment
+            radius = initial_patch_radius(aut, W_actual, history[-1], intent,
+                                          var_prefix=var_prefix)
+            if radius is None:
+                print "WARNING: blocked route cannot be rerouted in the known world."
+                return None, None
+            radius -= gamma
+            last_nbhd = None
+            while True:
+                radius += gamma
+                if radius > max_patch_radius(W_actual):
+                    return None, None  # Largest region already tried
+                print "r_inc = "+str(radius)
+                nbhd_inclusion = patch_region(W_actual, intent, radius)
+                shaped = (region != "square"
+                          and not any([len(obs_cells[obs] & set(nbhd_inclusion)) > 0
+                                       for obs in range(num_obs)]))
+                if shaped:
+                    if region == "corridor":
+                        route = _broken_route(aut, history, intent, radius,
+                                              var_prefix=var_prefix)
+                    else:
+                        route = None
+                    nbhd_inclusion = patch_region(W_actual, intent, radius,
+                                                  shape=region, route=route)
+                if len(nbhd_inclusion) == 0:
+                    raise ValueError("gamma radius is too small; neighborhood is empty.")
+                if nbhd_inclusion == last_nbhd:
+                    continue  # Same region as at the last radius, which failed
+                last_nbhd = nbhd_inclusion
+                patch_goal_list = []
+                patch_env_goals = []
+                for v in nbhd_inclusion:
+                    if v in goal_list:
+                        patch_goal_list.append(v)
+                    if v in env_goal_list:
+                        patch_env_goals.append((env_goal_list.index(v), v))
+                fail_loc_var = var_prefix+"_"+str(intent[0])+"_"+str(intent[1])
             
-            # Re-sort env obstacle goals
-            patch_env_goal_list = env_init_list[:]
-            for env_g in patch_env_goals:
-                patch_env_goal_list[env_g[0]] = env_g[1]
+                # Re-sort env obstacle goals
+                patch_env_goal_list = env_init_list[:]
+                for env_g in patch_env_goals:
+                    patch_env_goal_list[env_g[0]] = env_g[1]
             
-            # Set of nodes in M corresponding to abstract nbhd.
-            Reg = aut.computeGridReg(nbhd=nbhd_inclusion, var_prefix=var_prefix)
-            S0 = aut.getAutInit()
-            Init = set([node.id for node in S0]) & set(Reg)
-            Entry = list(aut.findEntry(Reg))
-            Exit = aut.findExit(Reg)
-
-            # Remove newly blocked possibilities for dynamic obstacle positions.
-            for env_i in range(len(env_init_list)):
-                env_i_prefix = env_prefix+"_"+str(env_i)
-                Init = set([ind for ind in Init if extract_autcoord(aut.states[ind], var_prefix=env_i_prefix)[0] != intent])
-                Entry = set([ind for ind in Entry if extract_autcoord(aut.states[ind], var_prefix=env_i_prefix)[0] != intent])
+                # Set of nodes in M corresponding to abstract nbhd.
+                Reg = aut.computeGridReg(nbhd=nbhd_inclusion, var_prefix=var_prefix)
+                S0 = aut.getAutInit()
+                # Nodes where the simulation starts may be on a cycle,
+                # hence not in S0; cf. the trim after merging.
+                Init = (set([node.id for node in S0+aut.findAllAutPartState({init_var: 1})])
+                        & set(Reg))
+                Entry = list(aut.findEntry(Reg))
+                Exit = aut.findExit(Reg)
+
+                # Remove newly blocked possibilities for dynamic obstacle positions.
+                for env_i in range(len(env_init_list)):
+                    env_i_prefix = env_prefix+"_"+str(env_i)
+                    Init = set([ind for ind in Init if extract_autcoord(aut.states[ind], var_prefix=env_i_prefix)[0] != intent])
+                    Entry = set([ind for ind in Entry if extract_autcoord(aut.states[ind], var_prefix=env_i_prefix)[0] != intent])
             
-            if len(Reg) == aut.size():
-                print "WARNING: arrived at global problem, i.e., S = Reg."
-                return None, None
+                if len(Reg) == aut.size():
+                    print "WARNING: arrived at global problem, i.e., S = Reg."
+                    return None, None
             
-            W_patch, offset = subworld(W_actual, nbhd_inclusion)
-            # Shift coordinates to be w.r.t. W_patch
-            for ind in range(len(patch_goal_list)):
-                patch_goal_list[ind] = (patch_goal_list[ind][0]-offset[0],
-                                        patch_goal_list[ind][1]-offset[1])
-            for ind in range(len(patch_env_goal_list)):
-                patch_env_goal_list[ind] = (patch_env_goal_list[ind][0]-offset[0],
-                                            patch_env_goal_list[ind][1]-offset[1])
-
-            patch_auts = []
-            fail_flag = False
-            for l in Init|set(Entry):
-                init_loc = extract_autcoord(aut.getAutState(l), var_prefix=var_prefix)[0]
-                init_loc = (init_loc[0]-offset[0], init_loc[1]-offset[1])
-                local_env_init = env_init_list[:]
-                for obs in range(num_obs):
-                    local_env_init[obs] = extract_autcoord(aut.getAutState(l),
-                                                           var_prefix=env_prefix+"_"+str(obs))[0]
-                    local_env_init[obs] = (local_env_init[obs][0]-offset[0],
-                                           local_env_init[obs][1]-offset[1])
-                if len(Exit) == 0:
-                    # Special case where it suffices to remain local
-                    # forever (all system goals in here, etc.).
-                    local_goals_IDs = []  
-                else:
-                    local_goals_IDs = list(aut.computeReach(l, Reg) & set(Exit))
-                if (l in local_goals_IDs) and (len(local_goals_IDs) > 1):
-                    del local_goals_IDs[local_goals_IDs.index(l)]
-                local_goals = []
-                for goal_ID in local_goals_IDs:
-                    local_goals.append(extract_autcoord(aut.getAutState(goal_ID),
-                                                        var_prefix=var_prefix)[0])
-                    local_goals[-1] = (local_goals[-1][0]-offset[0],
-                                       local_goals[-1][1]-offset[1])
-                local_goals = list(set(local_goals))  # Remove redundancy
-                if use_JTLV:
-                    aut_patch = gen_navobs_soln_JTLV(init_list=[init_loc], goal_list=patch_goal_list,
-                                                     W=W_patch, num_obs=num_obs,
-                                                     env_init_list=local_env_init,
-                                                     env_goal_list=patch_env_goal_list,
-                                                     restrict_radius=restrict_radius,
-                                                     goals_disjunct=local_goals,
-                                                     var_prefix=var_prefix,
-                                                     env_prefix=env_prefix)
-                else:
-                    aut_patch = gen_navobs_soln(init_list=[init_loc], goal_list=patch_goal_list,
-                                                W=W_patch, num_obs=num_obs,
-                                                env_init_list=local_env_init,
-                                                env_goal_list=patch_env_goal_list,
-                                                restrict_radius=restrict_radius,
-                                                goals_disjunct=local_goals,
-                                                var_prefix=var_prefix,
-                                                env_prefix=env_prefix)
-                if aut_patch is not None:
-                    patch_auts.append((aut_patch, l, local_goals_IDs))
-                else:
-                    fail_flag = True
-                    break
-            if not fail_flag:
-                break
-
-        # Merge (in several steps)
-
-        for aut_ind in range(len(patch_auts)):
-            patch_auts[aut_ind][0].trimDeadStates()
-
-        # Set rule to clearing mem cells for nodes in the original M
-        for node in aut.states:
-            node.addNodeRule(rule_clearall)
-
-        # Adjust map coordinates from local (patch-centric) to global,
-        # and expand set of variables of the patch to include all
-        # those of the (original) global problem.
-        patch_id_maps = []
-        env_vars_list = []
-        env_nowhere_vars = []
-        for obs in range(num_obs):
-            # Pick out full list of env variables, for each obstacle
-            env_vars_list.append(prefix_filt(aut.states[0].state,
-                                             prefix=env_prefix+"_"+str(obs)))
-            env_vars_list[-1] = env_vars_list[-1].keys()
-            env_nowhere_vars.append(env_prefix+"_"+str(obs)+"_n_n")
-        # Pick out full list of sys variables
-        sys_vars = prefix_filt(aut.states[0].state, prefix=var_prefix)  
-        for aut_ind in range(len(patch_auts)):
-            Ml = patch_auts[aut_ind][0]
-            for node in Ml.states:
-                temp_state = copy.copy(node.state)
-                node.state = {}
-                for (k,v) in temp_state.items():
-                    ex_result = extract_coord(k)
-                    if ((ex_result is None)
-                        or (ex_result[1] == -1 and ex_result[2] == -1)):
-                        # not spatially-dependent variable; ignore
-                        node.state[k] = v
+                W_patch, offset = subworld(W_actual, nbhd_inclusion, mask=shaped)
+                # Shift coordinates to be w.r.t. W_patch
+                for ind in range(len(patch_goal_list)):
+                    patch_goal_list[ind] = (patch_goal_list[ind][0]-offset[0],
+                                            patch_goal_list[ind][1]-offset[1])
+                for ind in range(len(patch_env_goal_list)):
+                    patch_env_goal_list[ind] = (patch_env_goal_list[ind][0]-offset[0],
+                                                patch_env_goal_list[ind][1]-offset[1])
+                patch_obs = [obs for obs in range(num_obs)
+                             if len(obs_cells[obs] & set(nbhd_inclusion)) > 0]
+
+                local_problems = []
+                for l in Init|set(Entry):
+                    init_loc = extract_autcoord(aut.getAutState(l), var_prefix=var_prefix)[0]
+                    init_loc = (init_loc[0]-offset[0], init_loc[1]-offset[1])
+                    local_env_init = []
+                    for obs in patch_obs:
+                        local_env_init.append(extract_autcoord(aut.getAutState(l),
+                                                               var_prefix=env_prefix+"_"+str(obs))[0])
+                        local_env_init[-1] = (local_env_init[-1][0]-offset[0],
+                                              local_env_init[-1][1]-offset[1])
+                    if len(Exit) == 0:
+                        # Special case where it suffices to remain local
+                        # forever (all system goals in here, etc.).
+                        local_goals_IDs = []  
                     else:
-                        node.state[ex_result[0]+"_"+str(ex_result[1]+offset[0])+"_"+str(ex_result[2]+offset[1])] = v
-                for k in sys_vars.keys():
-                    if not node.state.has_key(k):
-                        node.state[k] = 0
-            for obs in range(num_obs):
-                if env_nowhere_vars[obs] in Ml.states[0].state.keys():
-                    Ml.fleshOutGridState(env_vars_list[obs],
-                                         special_var=env_nowhere_vars[obs])
-            for node in Ml.states:
-                node.addNodeRule(rule_setmatch)
-
-            patch_id_maps.append(aut.importChildAut(Ml,
-                                                    tags={"color": (np.random.randint(0, 256), np.random.randint(0, 256), np.random.randint(0, 256), 0.5),
-                                                          "cluster_id": aut_ind}))
-
-        # Undo offset of the part of sys goal list addressed in patch
-        for k in range(len(patch_goal_list)):
-            patch_goal_list[k] = (patch_goal_list[k][0]+offset[0],
-                                  patch_goal_list[k][1]+offset[1])
-
-        # Add memory for these goals
-        aut.memInit([var_prefix+"_"+str(i)+"_"+str(j) for (i, j) in patch_goal_list])
-
-        # Attach entry and exit points
-        for aut_ind in range(len(patch_auts)):
-            l = patch_auts[aut_ind][1]
-            Ml = patch_auts[aut_ind][0]
-            local_goals_IDs = patch_auts[aut_ind][2]
-            entry_InSet = set(aut.getAutInSet(l)) - set(Reg)
-            if len(entry_InSet) == 0:
-                S0 = set([S0_node for S0_node in S0 if S0_node.id != l])
-                S0 = S0|set([aut.getAutState(patch_id_maps[aut_ind][Ml_node.id]) for Ml_node in Ml.getAutInit()])
-            else:
-                match_list = Ml.findAllAutPartState(aut.getAutState(l).state)
-                assert len(match_list) != 0
-                for entry_prenode in entry_InSet:
-                    entry_prenode.transition[entry_prenode.transition.index(l)] = patch_id_maps[aut_ind][match_list[0].id]
-            if len(local_goals_IDs) == 0:
-                # Special case where it suffices to remain local
-                # forever (all system goals in here, etc.).
-                match_flag = True
-            else:
-                match_flag = False
-            for local_goal_ID in local_goals_IDs:
-                goal_node = aut.getAutState(local_goal_ID)
-                sys_state = prefix_filt(goal_node.state, prefix=var_prefix)
-                # match_list = Ml.findAllAutPartState(sys_state)
-                match_list = Ml.findAllAutPartState(goal_node.state)
-                if len(match_list) > 0:
-                    match_flag = True
-                for match_node in match_list:
-                    if len(aut.getMem()) > 0:
-                        for k in range(len(aut.getAutState(patch_id_maps[aut_ind][match_node.id]).cond)):
-                            if aut.getAutState(patch_id_maps[aut_ind][match_node.id]).cond[k] is None:
-                                aut.getAutState(patch_id_maps[aut_ind][match_node.id]).cond[k] = cond_anynot
-                        aut.getAutState(patch_id_maps[aut_ind][match_node.id]).cond.extend([cond_all for k in goal_node.cond])
-                        aut.getAutState(patch_id_maps[aut_ind][match_node.id]).transition.extend(goal_node.transition)
-                        if goal_node.id in goal_node.transition:
-                            aut.getAutState(patch_id_maps[aut_ind][match_node.id]).transition[aut.getAutState(patch_id_maps[aut_ind][match_node.id]).transition.index(goal_node.id)] = patch_id_maps[aut_ind][match_node.id]
+                        local_goals_IDs = list(aut.computeReach(l, Reg) & set(Exit))
+                    if (l in local_goals_IDs) and (len(local_goals_IDs) > 1):
+                        del local_goals_IDs[local_goals_IDs.index(l)]
+                    local_goals = []
+                    for goal_ID in local_goals_IDs:
+                        local_goals.append(extract_autcoord(aut.getAutState(goal_ID),
+                                                            var_prefix=var_prefix)[0])
+                        local_goals[-1] = (local_goals[-1][0]-offset[0],
+                                           local_goals[-1][1]-offset[1])
+                    local_goals = list(set(local_goals))  # Remove redundancy
+                    local_problems.append((l, init_loc, local_env_init,
+                                           local_goals_IDs, local_goals))
+                if not _patch_connected(W_patch, [(p[1], p[4]) for p in local_problems],
+                                        patch_goal_list):
+                    continue  # Provably infeasible; skip synthesis
+
+                patch_auts = []
+                fail_flag = False
+                for (l, init_loc, local_env_init,
+                     local_goals_IDs, local_goals) in local_problems:
+                    local_env_goal_list = [patch_env_goal_list[obs] for obs in patch_obs]
+                    if use_JTLV:
+                        aut_patch = gen_navobs_soln_JTLV(init_list=[init_loc], goal_list=patch_goal_list,
+                                                         W=W_patch, num_obs=len(patch_obs),
+                                                         env_init_list=local_env_init,
+                                                         env_goal_list=local_env_goal_list,
+                                                         restrict_radius=restrict_radius,
+                                                         goals_disjunct=local_goals,
+                                                         var_prefix=var_prefix,
+                                                         env_prefix=env_prefix)
                     else:
-                        aut.getAutState(patch_id_maps[aut_ind][match_node.id]).cond = [None for k in aut.getAutState(patch_id_maps[aut_ind][match_node.id]).transition]
-                        aut.getAutState(patch_id_maps[aut_ind][match_node.id]).cond.extend([None for k in goal_node.cond])
-                        aut.getAutState(patch_id_maps[aut_ind][match_node.id]).transition = goal_node.transition[:]
-                        if goal_node.id in goal_node.transition:
-                            aut.getAutState(patch_id_maps[aut_ind][match_node.id]).transition[aut.getAutState(patch_id_maps[aut_ind][match_node.id]).transition.index(goal_node.id)] = patch_id_maps[aut_ind][match_node.id]
+                        aut_patch = gen_navobs_soln(init_list=[init_loc], goal_list=patch_goal_list,
+                                                    W=W_patch, num_obs=len(patch_obs),
+                                                    env_init_list=local_env_init,
+                                                    env_goal_list=local_env_goal_list,
+                                                    restrict_radius=restrict_radius,
+                                                    goals_disjunct=local_goals,
+                                                    var_prefix=var_prefix,
+                                                    env_prefix=env_prefix,
+                                                    backend=backend)
+                    if aut_patch is not None:
+                        patch_auts.append((aut_patch, l, local_goals_IDs))
+                    else:
+                        fail_flag = True
+                        break
+                if not fail_flag:
+                    break
 
-            assert match_flag
+            # Merge (in several steps)
+            # Changes to aut are undone if any step fails, so that the
+            # given controller is left intact.
+            snap = aut.snapshot()
+            try:
+                for aut_ind in range(len(patch_auts)):
+                    patch_auts[aut_ind][0].trimDeadStates()
+
+                # Set rule to clearing mem cells for nodes in the original M
+                aut.allRule(rule_clearall)
+
+                # Adjust map coordinates from local (patch-centric) to global,
+                # and expand set of variables of the patch to include all
+                # those of the (original) global problem.
+                patch_id_maps = []
+                env_vars_list = []
+                env_nowhere_vars = []
+                for obs in range(num_obs):
+                    # Pick out full list of env variables, for each obstacle
+                    env_vars_list.append(prefix_filt(aut.states[0].state,
+                                                     prefix=env_prefix+"_"+str(obs)))
+                    env_vars_list[-1] = env_vars_list[-1].keys()
+                    env_nowhere_vars.append(env_prefix+"_"+str(obs)+"_n_n")
+                # Pick out full list of sys variables
+                sys_vars = prefix_filt(aut.states[0].state, prefix=var_prefix)  
+                # Obstacles of the local problem are numbered as in patch_obs
+                env_rename = dict([(env_prefix+"_"+str(local_obs), env_prefix+"_"+str(obs))
+                                   for (local_obs, obs) in enumerate(patch_obs)])
+                for aut_ind in range(len(patch_auts)):
+                    Ml = patch_auts[aut_ind][0]
+                    for node in Ml.states:
+                        temp_state = copy.copy(node.state)
+                        node.state = {}
+                        for (k,v) in temp_state.items():
+                            ex_result = extract_coord(k)
+                            if (ex_result is not None) and env_rename.has_key(ex_result[0]):
+                                k = env_rename[ex_result[0]]+k[len(ex_result[0]):]
+                                ex_result = (env_rename[ex_result[0]],)+ex_result[1:]
+                            if ((ex_result is None)
+                                or (ex_result[1] == -1 and ex_result[2] == -1)):
+                                # not spatially-dependent variable; ignore
+                                node.state[k] = v
+                            else:
+                                node.state[ex_result[0]+"_"+str(ex_result[1]+offset[0])+"_"+str(ex_result[2]+offset[1])] = v
+                        for k in sys_vars.keys():
+                            if not node.state.has_key(k):
+                                node.state[k] = 0
+                        # Obstacles left out of the local problem are never in
+                        # the patch, i.e., "nowhere" from its perspective.
+                        for obs in range(num_obs):
+                            if obs not in patch_obs:
+                                node.state[env_nowhere_vars[obs]] = 1
+                    for obs in range(num_obs):
+                        if env_nowhere_vars[obs] in Ml.states[0].state.keys():
+                            Ml.fleshOutGridState(env_vars_list[obs],
+                                                 special_var=env_nowhere_vars[obs])
+                    for node in Ml.states:
+                        node.addNodeRule(rule_setmatch)
+
+                    patch_id_maps.append(aut.importChildAut(Ml,
+                                                            tags={"color": (np.random.randint(0, 256), np.random.randint(0, 256), np.random.randint(0, 256), 0.5),
+                                                                  "cluster_id": aut_ind}))
+
+                # Undo offset of the part of sys goal list addressed in patch
+                for k in range(len(patch_goal_list)):
+                    patch_goal_list[k] = (patch_goal_list[k][0]+offset[0],
+                                          patch_goal_list[k][1]+offset[1])
+
+                # Add memory for these goals
+                aut.memInit([var_prefix+"_"+str(i)+"_"+str(j) for (i, j) in patch_goal_list])
+
+                # Attach entry and exit points
+                for aut_ind in range(len(patch_auts)):
+                    l = patch_auts[aut_ind][1]
+                    Ml = patch_auts[aut_ind][0]
+                    local_goals_IDs = patch_auts[aut_ind][2]
+                    entry_InSet = set(aut.getAutInSet(l)) - set(Reg)
+                    if len(entry_InSet) == 0:
+                        S0 = set([S0_node for S0_node in S0 if S0_node.id != l])
+                        S0 = S0|set([aut.getAutState(patch_id_maps[aut_ind][Ml_node.id]) for Ml_node in Ml.getAutInit()])
+                    else:
+                        match_list = Ml.findAllAutPartState(aut.getAutState(l).state)
+                        assert len(match_list) != 0
+                        for entry_prenode in entry_InSet:
+                            entry_prenode = aut.editNode(entry_prenode.id)
+                            entry_prenode.transition[entry_prenode.transition.index(l)] = patch_id_maps[aut_ind][match_list[0].id]
+                    if len(local_goals_IDs) == 0:
+                        # Special case where it suffices to remain local
+                        # forever (all system goals in here, etc.).
+                        match_flag = True
+                    else:
+                        match_flag = False
+                    for local_goal_ID in local_goals_IDs:
+                        goal_node = aut.getAutState(local_goal_ID)
+                        sys_state = prefix_filt(goal_node.state, prefix=var_prefix)
+                        # match_list = Ml.findAllAutPartState(sys_state)
+                        match_list = Ml.findAllAutPartState(goal_node.state)
+                        if len(match_list) > 0:
+                            match_flag = True
+                        for match_node in match_list:
+                            patch_node = aut.editNode(patch_id_maps[aut_ind][match_node.id])
+                            if len(aut.getMem()) > 0:
+                                for k in range(len(patch_node.cond)):
+                                    if patch_node.cond[k] is None:
+                                        patch_node.cond[k] = cond_anynot
+                                patch_node.cond.extend([cond_all for k in goal_node.cond])
+                                patch_node.transition.extend(goal_node.transition)
+                                if goal_node.id in goal_node.transition:
+                                    patch_node.transition[patch_node.transition.index(goal_node.id)] = patch_id_maps[aut_ind][match_node.id]
+                            else:
+                                patch_node.cond = [None for k in patch_node.transition]
+                                patch_node.cond.extend([None for k in goal_node.cond])
+                                patch_node.transition = goal_node.transition[:]
+                                if goal_node.id in goal_node.transition:
+                                    patch_node.transition[patch_node.transition.index(goal_node.id)] = patch_id_maps[aut_ind][match_node.id]
+
+                    assert match_flag
             
-        # Delete blocked nodes and dependent edges
-        kill_list = []
-        for ind in range(len(aut.states)):
-            if extract_autcoord(aut.states[ind], var_prefix=var_prefix)[0] == intent:
-                kill_list.append(aut.states[ind].id)
-        for kill_id in kill_list:
-            aut.removeNode(kill_id)
-        aut.packIDs()
-
-        # Clean up any dangling ends
-        last_size = -1
-        while last_size != aut.size():
-            last_size = aut.size()
-            aut.trimDeadStates()
+                # Delete blocked nodes and dependent edges
+                kill_list = []
+                for ind in range(len(aut.states)):
+                    if extract_autcoord(aut.states[ind], var_prefix=var_prefix)[0] == intent:
+                        kill_list.append(aut.states[ind].id)
+                for kill_id in kill_list:
+                    aut.removeNode(kill_id)
+                aut.packIDs()
+
+                # Clean up any dangling ends
+                last_size = -1
+                while last_size != aut.size():
+                    last_size = aut.size()
+                    aut.trimDeadStates()
         
-        # Pick-off invalid initial nodes, and other clean-up
-        aut.removeFalseInits(S0)
-        aut.packIDs()
-        aut.cleanDuplicateTrans()
+                # Drop invalid initial nodes and all else not reachable
+                # (from S0 or from where the simulation starts, cf.
+                # navobs_sim), and other clean-up
+                aut.trimUnconnectedStates(list(S0)+aut.findAllAutPartState({init_var: 1}))
+                aut.packIDs()
+                aut.cleanDuplicateTrans()
+                if minimize:
+                    aut.minimize()
+                    aut.packIDs()
+            except:
+                aut.rollback(snap)
+                raise
+            aut.release(snap)
+            aut.flushJournal()  # Only the patch is written, if aut has a journal
+    finally:
+        if ckpt is not None:
+            ckpt.close()
 
 
 def to_formula(aut_node):
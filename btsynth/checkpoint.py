@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+"""
+Checkpoints of long runs of btsim_d and btsim_navobs.
+
+A checkpoint directory holds the automaton, as a base saved by
+write_autb (in a subdirectory autN) with a journal of the changes
+since (cf. BTAutomaton.openJournal), and the file STATE_FNAME, a
+pickle of the arguments of the run, the step count, automaton memory,
+states of the random number generators (of modules random and
+numpy.random), the length of the journal, and any other state of the
+repair engine.  Thus after the first checkpoint, each writes only the
+patches merged since the previous one.  Once the journal is larger
+than the base, the next checkpoint starts a new base (autN+1).
+
+Writing is done by a background thread, in order, and the state file
+is replaced (by rename) only after the records it refers to are
+written, so the directory always holds a complete checkpoint.
+
+Cf. resume_btsim in btsynth.btsynth.
+
+SCL; 2012.
+"""
+
+import os
+import re
+import sys
+import copy
+import random
+import shutil
+import pickle
+import threading
+import Queue
+import numpy as np
+
+from automaton import BTAutomaton, PatchJournal, write_autb, read_autb
+
+
+STATE_FNAME = "state"
+CHECKPOINT_VERSION = 1
+
+
+class SimCheckpoint:
+    """Checkpoints of a run, in directory dirname.
+
+    sim_name is the name of the simulation function (e.g.,
+    "btsim_navobs"), and args is a dictionary of its arguments other
+    than aut and checkpoint; these are saved for resuming.  Any
+    checkpoint already in dirname is removed.
+
+    If sim_name is None, then the checkpoint in dirname is read, and
+    attributes sim_name, args, aut, step_count and extra are as
+    saved; use restore_random to put the random number generators
+    back in their saved states.  Later checkpoints continue it.
+
+    Call save at each checkpoint, and close at the end of the run.
+    """
+    def __init__(self, dirname, sim_name=None, args=None):
+        self.dirname = dirname
+        self.sim_name = sim_name
+        self.args = args
+        self.aut = None
+        self.step_count = 0
+        self.extra = None
+        self.journal = None
+        self.generation = 0  # Number of the current base, as in autN
+        self.error = None  # Exception info from writer thread
+        if sim_name is None:
+            self._load()
+        elif os.path.isdir(dirname):
+            for fname in os.listdir(dirname):
+                if fname.startswith(STATE_FNAME):
+                    os.remove(os.path.join(dirname, fname))
+                elif re.match(r"aut\d+$", fname):
+                    shutil.rmtree(os.path.join(dirname, fname))
+        else:
+            os.makedirs(dirname)
+        self.queue = Queue.Queue()
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _aut_dirname(self, generation):
+        return os.path.join(self.dirname, "aut"+str(generation))
+
+    def _load(self):
+        with open(os.path.join(self.dirname, STATE_FNAME), "rb") as f:
+            state = pickle.load(f)
+        if state["version"] != CHECKPOINT_VERSION:
+            raise ValueError("unsupported checkpoint version "+str(state["version"]))
+        self.sim_name = state["sim_name"]
+        self.args = state["args"]
+        self.step_count = state["step_count"]
+        self.extra = state["extra"]
+        self.random_state = state["random_state"]
+        self.generation = state["generation"]
+        aut_dirname = self._aut_dirname(self.generation)
+        self.aut = read_autb(aut_dirname, mmap=False,
+                             num_records=state["journal_records"])
+        self.aut.memory = state["memory"]
+        self.journal = PatchJournal(aut_dirname, append=True,
+                                    num_records=state["journal_records"],
+                                    writer=self._write)
+        self.aut._journal = self.journal
+
+    def restore_random(self):
+        """Set states of random number generators to those saved."""
+        random.setstate(self.random_state[0])
+        np.random.set_state(self.random_state[1])
+
+    def _run(self):
+        while True:
+            task = self.queue.get()
+            if task is None:
+                break
+            if self.error is None:  # Do nothing more after failure
+                try:
+                    task()
+                except:
+                    self.error = sys.exc_info()
+
+    def _check(self):
+        if self.error is not None:
+            (exc_type, exc_value, traceback) = self.error
+            raise exc_type, exc_value, traceback
+
+    def _write(self, f, data):
+        def task():
+            f.write(data)
+            f.flush()
+        self.queue.put(task)
+
+    def _write_state(self, data, old_aut_dirname):
+        fname = os.path.join(self.dirname, STATE_FNAME)
+        with open(fname+".tmp", "wb") as f:
+            f.write(data)
+        os.rename(fname+".tmp", fname)
+        if old_aut_dirname is not None:
+            shutil.rmtree(old_aut_dirname)
+
+    def _new_base(self, aut):
+        """Begin new base and journal, copying aut for writing."""
+        base = BTAutomaton()
+        for node in aut.states:
+            base.states.append(node.copy())
+            base.states[-1].tags = copy.copy(node.tags)
+        base.memory = copy.copy(aut.memory)
+        if self.journal is not None:
+            self.queue.put(self.journal.close)
+        self.generation += 1
+        aut_dirname = self._aut_dirname(self.generation)
+        if os.path.isdir(aut_dirname):
+            shutil.rmtree(aut_dirname)  # Left by an interrupted run
+        os.makedirs(aut_dirname)
+        journal = PatchJournal(aut_dirname, writer=self._write)
+        journal.base_size = None  # Until written
+        def task():
+            write_autb(base, aut_dirname)
+            journal.base_size = journal._base_size()
+        self.queue.put(task)
+        self.journal = journal
+        aut._journal = journal
+
+    def save(self, aut, step_count, extra=None):
+        """Checkpoint run at given step count.
+
+        aut should be the automaton of the run; while checkpointing,
+        it has a journal in dirname, so it should not have another.
+        extra is any other state needed to resume (e.g., of the repair
+        engine), and must be picklable.  Raise exception if writing an
+        earlier checkpoint failed.
+        """
+        self._check()
+        if (aut._journal is not None) and (aut._journal is not self.journal):
+            raise ValueError("automaton to checkpoint already has a journal.")
+        self.aut = aut
+        old_aut_dirname = None
+        if ((self.journal is None) or (aut._journal is None)
+            or ((self.journal.base_size is not None)
+                and (self.journal.size() > self.journal.base_size))):
+            if self.journal is not None:
+                old_aut_dirname = self._aut_dirname(self.generation)
+            self._new_base(aut)
+        else:
+            aut.flushJournal()
+        state = {"version": CHECKPOINT_VERSION,
+                 "sim_name": self.sim_name,
+                 "args": self.args,
+                 "step_count": step_count,
+                 "memory": aut.getMem(),
+                 "random_state": (random.getstate(), np.random.get_state()),
+                 "generation": self.generation,
+                 "journal_records": self.journal.written,
+                 "extra": extra}
+        data = pickle.dumps(state, pickle.HIGHEST_PROTOCOL)
+        self.queue.put(lambda: self._write_state(data, old_aut_dirname))
+
+    def close(self):
+        """Wait for writing to finish, and stop journaling the automaton.
+
+        Raise exception if writing failed.
+        """
+        if self.journal is not None:
+            self.queue.put(self.journal.close)
+        self.queue.put(None)
+        self.thread.join()
+        if (self.aut is not None) and (self.aut._journal is self.journal):
+            self.aut._journal = None
+        self._check()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+"""
+Incremental shortest paths on gridworlds, following D* Lite.
+
+The planner keeps its search state (g and rhs values, and the
+priority queue) between queries, so that when a cell is discovered to
+be blocked only the affected part of the search is repaired.  Cf.
+S. Koenig and M. Likhachev, "D* Lite", in Proc. of AAAI, 2002.
+
+SCL; 2012.
+"""
+
+import heapq
+
+
+INF = float("inf")
+
+
+class DStarLite:
+    """D* Lite planner toward a fixed goal cell of a gridworld.
+
+    Movement is as in LTL_world, i.e., by one step along a row or
+    column into an open cell, with unit cost.  The world matrix W is
+    copied, and thereafter changed only through the block method.
+
+    Typical usage is to call plan(start) to obtain a path, then upon
+    discovering that some cell is occupied, call block(cell) and
+    plan() again from the current start.
+    """
+    def __init__(self, W, goal):
+        self.W = W.copy()
+        self.goal = tuple(goal)
+        self.start = None
+        self.km = 0
+        self.g = dict()
+        self.rhs = {self.goal: 0}
+        self.queue = []
+        self.queued = dict()  # Current key of each vertex in queue
+        self._push(self.goal)
+
+    def _h(self, a, b):
+        return abs(a[0]-b[0]) + abs(a[1]-b[1])
+
+    def _key(self, u):
+        m = min(self.g.get(u, INF), self.rhs.get(u, INF))
+        if self.start is None:
+            return (m, m)
+        return (m+self._h(self.start, u)+self.km, m)
+
+    def _push(self, u):
+        key = self._key(u)
+        self.queued[u] = key
+        heapq.heappush(self.queue, (key, u))
+
+    def _nbrs(self, u):
+        (i, j) = u
+        return [(ni, nj) for (ni, nj) in [(i-1, j), (i, j-1), (i+1, j), (i, j+1)]
+                if ni >= 0 and ni < self.W.shape[0] and nj >= 0 and nj < self.W.shape[1]]
+
+    def _cost(self, u, v):
+        if self.W[u[0]][u[1]] != 0 or self.W[v[0]][v[1]] != 0:
+            return INF
+        return 1
+
+    def _update(self, u):
+        if u != self.goal:
+            self.rhs[u] = min([self._cost(u, v)+self.g.get(v, INF)
+                               for v in self._nbrs(u)]+[INF])
+        if self.queued.has_key(u):
+            del self.queued[u]  # Lazy removal from heap
+        if self.g.get(u, INF) != self.rhs.get(u, INF):
+            self._push(u)
+
+    def _top(self):
+        while len(self.queue) > 0:
+            (key, u) = self.queue[0]
+            if self.queued.get(u) == key:
+                return key, u
+            heapq.heappop(self.queue)  # Stale entry
+        return None, None
+
+    def _compute(self):
+        while True:
+            (key, u) = self._top()
+            if (key is None
+                or (key >= self._key(self.start)
+                    and self.rhs.get(self.start, INF) == self.g.get(self.start, INF))):
+                return
+            key_new = self._key(u)
+            if key < key_new:
+                self._push(u)
+            elif self.g.get(u, INF) > self.rhs.get(u, INF):
+                heapq.heappop(self.queue)
+                del self.queued[u]
+                self.g[u] = self.rhs[u]
+                for v in self._nbrs(u):
+                    self._update(v)
+            else:
+                heapq.heappop(self.queue)
+                del self.queued[u]
+                self.g[u] = INF
+                for v in self._nbrs(u)+[u]:
+                    self._update(v)
+
+    def block(self, loc):
+        """Mark cell loc as occupied and repair affected search state."""
+        loc = tuple(loc)
+        if self.W[loc[0]][loc[1]] != 0:
+            return
+        self.W[loc[0]][loc[1]] = 1
+        for u in self._nbrs(loc)+[loc]:
+            self._update(u)
+
+    def plan(self, start):
+        """Return shortest path from start to goal, as list of (row, col).
+
+        The path begins with start and ends with goal.  Return None
+        if goal is not reachable.
+        """
+        start = tuple(start)
+        if self.start is not None:
+            self.km += self._h(self.start, start)
+        self.start = start
+        self._compute()
+        if self.g.get(start, INF) == INF:
+            return None
+        path = [start]
+        u = start
+        while u != self.goal:
+            u = min(self._nbrs(u), key=lambda v: self._cost(u, v)+self.g.get(v, INF))
+            path.append(u)
+            if len(path) > self.W.size:
+                raise ValueError("failed to extract path; search state is inconsistent.")
+        return path
@@ -0,0 +1,345 @@
+#!/usr/bin/env python
+"""
+Explicit-state GR(1) solver for gridworld specifications.
+
+This solver handles exactly the family of specifications built by
+gen_navobs_soln and gen_dsoln: sys moves among adjacent open cells of
+a world matrix W, each env-controlled obstacle moves within a square
+window (possibly including "nowhere"), sys must avoid collisions and
+visit its goals infinitely often, and each obstacle must visit its own
+goal infinitely often.  Rather than building a formula and calling an
+external solver, the game graph is constructed directly from W as
+NumPy arrays and the usual GR(1) nested fixpoints are computed on it.
+
+SCL; 2012.
+"""
+
+import itertools
+import numpy as np
+
+from automaton import BTAutomaton, BTAutomatonNode
+from gridworld import obs_window, world_matrix
+
+
+def _pad_succ(succ_lists):
+    """Pack variable-length successor lists into a rectangular array.
+
+    Short rows are padded by repeating their own index (i.e., the
+    "stay" move), which is always available in gridworlds.
+    """
+    width = max([len(s) for s in succ_lists])
+    succ = np.empty((len(succ_lists), width), dtype=np.intp)
+    for k in range(len(succ_lists)):
+        succ[k, :] = k
+        succ[k, :len(succ_lists[k])] = succ_lists[k]
+    return succ
+
+
+def sys_graph(W):
+    """Open cells of W and their adjacency.
+
+    Return (cells, index, succ), where cells is an array of shape
+    (N,2) of (row, column) of open cells in row-major order, index is
+    an int array with the shape of W giving position of each cell in
+    cells (-1 for walls), and succ is an (N,5) array of successors
+    (stay, up, left, down, right), padded with the stay move where
+    the neighbor is blocked or outside W.
+    """
+    index = -np.ones(W.shape, dtype=np.intp)
+    rows, cols = np.nonzero(W == 0)
+    index[rows, cols] = np.arange(len(rows))
+    succ = np.empty((len(rows), 5), dtype=np.intp)
+    succ[:, 0] = np.arange(len(rows))
+    for (k, (dr, dc)) in enumerate([(-1, 0), (0, -1), (1, 0), (0, 1)]):
+        nr = rows+dr
+        nc = cols+dc
+        inside = (nr >= 0) & (nr < W.shape[0]) & (nc >= 0) & (nc < W.shape[1])
+        cand = succ[:, 0].copy()
+        nbr = index[nr[inside], nc[inside]]
+        cand[inside] = np.where(nbr >= 0, nbr, cand[inside])
+        succ[:, k+1] = cand
+    return np.column_stack((rows, cols)), index, succ
+
+
+def obs_graph(W, center_loc, restrict_radius=1):
+    """Positions and adjacency for an obstacle, following LTL_world.
+
+    Return (positions, succ), where positions is a list of (row,
+    column) pairs, with (-1, -1) denoting "nowhere", and succ is a
+    padded successor array as in sys_graph.
+    """
+    (row_low, row_high, col_low, col_high, nowhere) = obs_window(W, center_loc, restrict_radius)
+    positions = [(i, j) for (i, j) in itertools.product(range(row_low, row_high+1),
+                                                        range(col_low, col_high+1))
+                 if W[i][j] == 0]
+    has_nowhere = nowhere[0] or nowhere[1] or nowhere[2] or nowhere[3]
+    if has_nowhere:
+        positions.append((-1, -1))
+    index = dict([(loc, k) for (k, loc) in enumerate(positions)])
+    succ_lists = []
+    for loc in positions:
+        if loc == (-1, -1):
+            continue
+        (i, j) = loc
+        succ_lists.append([index[loc]])
+        for nbr in [(i-1, j), (i, j-1), (i+1, j), (i, j+1)]:
+            if (nbr[0] >= row_low and nbr[0] <= row_high
+                and nbr[1] >= col_low and nbr[1] <= col_high
+                and index.has_key(nbr)):
+                succ_lists[-1].append(index[nbr])
+        if ((i == row_low and nowhere[0])
+            or (i == row_high and nowhere[1])
+            or (j == col_low and nowhere[2])
+            or (j == col_high and nowhere[3])):
+            succ_lists[-1].append(index[(-1, -1)])
+    if has_nowhere:
+        # Transitions from "nowhere" back into the clipped boundary
+        succ_lists.append([index[(-1, -1)]])
+        for (i, j) in positions[:-1]:
+            if ((i == row_low and nowhere[0])
+                or (i == row_high and nowhere[1])
+                or (j == col_low and nowhere[2])
+                or (j == col_high and nowhere[3])):
+                succ_lists[-1].append(index[(i, j)])
+    return positions, _pad_succ(succ_lists)
+
+
+def cpre(T, sys_succ, env_succs, safe):
+    """Controllable predecessor of the set T.
+
+    T and safe are boolean arrays of shape env_shape+(N,), where
+    env_shape has one axis per obstacle and N is the number of sys
+    positions.  safe marks states that sys is allowed to move into
+    (i.e., those without collisions).  A state is in the result if,
+    for every env move, there is a sys move into T & safe.
+    """
+    A = (T & safe)[..., sys_succ].any(axis=-1)
+    for (k, succ) in enumerate(env_succs):
+        A = A.take(succ, axis=k).all(axis=k+1)
+    return A
+
+
+def _reach_layers(Z, base, env_goals, sys_succ, env_succs, safe,
+                  ranks=None):
+    """Inner mu-nu fixpoints for one sys goal, given outer Z.
+
+    If ranks is not None, it should be an int array of the shape of Z
+    filled with a sentinel; on return it holds, for each state, the
+    first (layer, env goal) at which the state was found, packed as
+    layer*len(env_goals)+i, and -1 for states in base.
+    """
+    Y = np.zeros(Z.shape, dtype=bool)
+    if ranks is not None:
+        ranks[base] = -1
+    layer = 0
+    while True:
+        start = base | cpre(Y, sys_succ, env_succs, safe)
+        Y_next = np.zeros(Z.shape, dtype=bool)
+        for i in range(len(env_goals)):
+            X = Z.copy()
+            while True:
+                X_next = start | (~env_goals[i] & cpre(X, sys_succ, env_succs, safe))
+                if np.array_equal(X, X_next):
+                    break
+                X = X_next
+            if ranks is not None:
+                ranks[X & (ranks > layer*len(env_goals)+i)] = layer*len(env_goals)+i
+            Y_next |= X
+        if np.array_equal(Y, Y_next):
+            return Y
+        Y = Y_next
+        layer += 1
+
+
+def solve_game(sys_goals, env_goals, sys_succ, env_succs, safe):
+    """Compute the winning set and strategy ranks of a GR(1) game.
+
+    sys_goals and env_goals are lists of boolean arrays (as in cpre);
+    each list must be nonempty (use an all-True array for "no
+    goals").  Return (Z, ranks), where Z is the winning set and ranks
+    is a list with one int array per sys goal; cf. _reach_layers.
+    """
+    Z = np.ones(safe.shape, dtype=bool)
+    while True:
+        Z_next = Z.copy()
+        for J in sys_goals:
+            base = J & cpre(Z, sys_succ, env_succs, safe)
+            Z_next &= _reach_layers(Z, base, env_goals,
+                                    sys_succ, env_succs, safe)
+        if np.array_equal(Z, Z_next):
+            break
+        Z = Z_next
+    sentinel = np.iinfo(np.intp).max
+    ranks = []
+    for J in sys_goals:
+        ranks.append(np.empty(Z.shape, dtype=np.intp))
+        ranks[-1][:] = sentinel
+        base = J & cpre(Z, sys_succ, env_succs, safe)
+        _reach_layers(Z, base, env_goals, sys_succ, env_succs, safe,
+                      ranks=ranks[-1])
+    return Z, ranks
+
+
+def synthesize(init_list, goal_list, W, env_init_list=[],
+               env_goal_list=None, goals_disjunct=None,
+               restrict_radius=1,
+               var_prefix="Y", env_prefix="X",
+               only_realizability=False):
+    """Solve gridworld navigation game in-process; cf. gen_navobs_soln.
+
+    Arguments have the same meaning as in gen_navobs_soln, except
+    that the number of obstacles is len(env_init_list) (empty for the
+    deterministic problem of gen_dsoln).  N.B., obstacles are
+    initialized jointly, i.e., each obstacle starts at its entry of
+    env_init_list (or "nowhere", if that position is outside its
+    restricted region).
+
+    Nodes of the returned automaton have the same variables as those
+    from gen_navobs_soln (or gen_dsoln): one per cell of W for sys,
+    and for each obstacle, one per cell of its restricted region and
+    "nowhere" (if needed).
+
+    Return instance of btsynth.BTAutomaton on success; None if not
+    realizable.  If only_realizability is True, then return True if
+    realizable, False if not.
+    """
+    if len(init_list) == 0:
+        return None
+    W = world_matrix(W)
+    num_obs = len(env_init_list)
+    if env_goal_list is None:
+        env_goal_list = env_init_list
+
+    (cells, index, sys_succ) = sys_graph(W)
+    obs_positions = []
+    env_succs = []
+    for k in range(num_obs):
+        (positions, succ) = obs_graph(W, env_goal_list[k], restrict_radius)
+        obs_positions.append(positions)
+        env_succs.append(succ)
+    env_shape = tuple([len(p) for p in obs_positions])
+    shape = env_shape+(len(cells),)
+
+    # Collisions, and env goals
+    safe = np.ones(shape, dtype=bool)
+    env_goals = []
+    for k in range(num_obs):
+        obs_cell = np.array([(index[loc] if loc != (-1, -1) else -1)
+                             for loc in obs_positions[k]])
+        hit = (obs_cell[:, np.newaxis] == np.arange(len(cells))[np.newaxis, :])
+        bshape = [1 for i in range(num_obs)]+[len(cells)]
+        bshape[k] = len(obs_positions[k])
+        safe &= ~hit.reshape(bshape)
+        goal_loc = env_goal_list[k]
+        if goal_loc not in obs_positions[k]:
+            goal_loc = (-1, -1)
+        env_goals.append(np.zeros(shape, dtype=bool))
+        at_goal = [slice(None) for i in range(num_obs+1)]
+        at_goal[k] = obs_positions[k].index(goal_loc)
+        env_goals[-1][tuple(at_goal)] = True
+    if len(env_goals) == 0:
+        env_goals = [np.ones(shape, dtype=bool)]
+
+    # Sys goals
+    def cell_set(locs):
+        J = np.zeros(shape, dtype=bool)
+        for loc in locs:
+            if (loc[0] >= 0 and loc[0] < W.shape[0]
+                and loc[1] >= 0 and loc[1] < W.shape[1]
+                and index[loc[0], loc[1]] >= 0):
+                J[..., index[loc[0], loc[1]]] = True
+        return J
+    sys_goals = [cell_set([loc]) for loc in goal_list]
+    if (goals_disjunct is not None) and len(goals_disjunct) > 0:
+        sys_goals.append(cell_set(goals_disjunct))
+    if len(sys_goals) == 0:
+        sys_goals = [np.ones(shape, dtype=bool)]
+
+    # Initial conditions
+    env_init = []
+    for k in range(num_obs):
+        loc = tuple(env_init_list[k])
+        if loc not in obs_positions[k]:
+            if (-1, -1) not in obs_positions[k]:
+                return None
+            loc = (-1, -1)
+        env_init.append(obs_positions[k].index(loc))
+    env_init = tuple(env_init)
+    sys_init = [index[loc[0], loc[1]] for loc in init_list
+                if (loc[0] >= 0 and loc[0] < W.shape[0]
+                    and loc[1] >= 0 and loc[1] < W.shape[1])]
+    sys_init = [s for s in sys_init if s >= 0]
+
+    (Z, ranks) = solve_game(sys_goals, env_goals, sys_succ, env_succs, safe)
+    sys_init = [s for s in sys_init if Z[env_init+(s,)]]
+    if only_realizability:
+        return len(sys_init) > 0
+    if len(sys_init) == 0:
+        return None
+
+    ########################################
+    # Strategy extraction
+    sentinel = np.iinfo(np.intp).max
+    num_goals = len(sys_goals)
+    # Cost of moving into each state, per target mode
+    costs = [np.where(safe, ranks[j], sentinel) for j in range(num_goals)]
+    switch_costs = [np.where(safe & Z, ranks[j], sentinel) for j in range(num_goals)]
+    env_moves = []  # Distinct successors, per obstacle position
+    for k in range(num_obs):
+        env_moves.append([sorted(set(row)) for row in env_succs[k]])
+
+    # Variable naming, as in gen_navobs_soln
+    sys_vars = [var_prefix+"_"+str(i)+"_"+str(j)
+                for (i, j) in itertools.product(range(W.shape[0]), range(W.shape[1]))]
+    env_vars = []
+    obs_vars = []
+    for k in range(num_obs):
+        (row_low, row_high, col_low, col_high, nowhere) = obs_window(W, env_goal_list[k],
+                                                                    restrict_radius)
+        obs_prefix = env_prefix+"_"+str(k)
+        if nowhere[0] or nowhere[1] or nowhere[2] or nowhere[3]:
+            env_vars.append(obs_prefix+"_n_n")
+        for i in range(row_low, row_high+1):
+            for j in range(col_low, col_high+1):
+                env_vars.append(obs_prefix+"_"+str(i)+"_"+str(j))
+        obs_vars.append([(obs_prefix+"_n_n" if loc == (-1, -1)
+                          else obs_prefix+"_"+str(loc[0])+"_"+str(loc[1]))
+                         for loc in obs_positions[k]])
+    cell_vars = [var_prefix+"_"+str(i)+"_"+str(j) for (i, j) in cells]
+    all_clear = dict([(v, 0) for v in sys_vars+env_vars])
+
+    aut = BTAutomaton()
+    node_ids = dict()  # Key is (env, sys, mode), value is node ID
+    queue = []
+    def get_node(key):
+        if not node_ids.has_key(key):
+            node_ids[key] = len(aut.states)
+            state = all_clear.copy()
+            state[cell_vars[key[-2]]] = 1
+            for k in range(num_obs):
+                state[obs_vars[k][key[k]]] = 1
+            aut.states.append(BTAutomatonNode(id=node_ids[key], state=state,
+                                              transition=[]))
+            queue.append(key)
+        return node_ids[key]
+
+    for s in sys_init:
+        get_node(env_init+(s, 0))
+    while len(queue) > 0:
+        key = queue.pop()
+        node = aut.states[node_ids[key]]
+        (e, s, mode) = (key[:-2], key[-2], key[-1])
+        if ranks[mode][e+(s,)] == -1:
+            mode = (mode+1) % num_goals
+            cost = switch_costs[mode]
+        else:
+            cost = costs[mode]
+        for e_next in itertools.product(*[env_moves[k][e[k]] for k in range(num_obs)]):
+            cand = sys_succ[s]
+            s_next = cand[np.argmin(cost[e_next][cand])]
+            if cost[e_next+(s_next,)] == sentinel:
+                raise ValueError("strategy extraction failed; no winning move from node "
+                                 +str(node.id))
+            node.transition.append(get_node(e_next+(s_next, mode)))
+    aut.recastBTAutNodes()
+    return aut
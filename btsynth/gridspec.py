@@ -0,0 +1,870 @@
+#!/usr/bin/env python
+"""
+Structured representation of GR(1) specifications for gridworlds.
+
+Rather than building formulas by string concatenation, clauses are
+kept as tuples of indices into a variable table.  Formulas in gr1c or
+JTLV syntax are only produced when writing solver input, and then
+streamed to a file.  Instances of GridSpec are hashable, e.g., for
+caching solver results.
+
+Clause forms (v, a, b are variable indices; group, cands, succs are
+tuples of variable indices):
+
+  ("trans", v, succs)     -- if v, then next one of succs;
+  ("forbid", v)           -- never next v;
+  ("exactlyone", group)   -- next precisely one of group;
+  ("notboth", a, b)       -- never next both a and b;
+  ("onehot", group, cands) -- (initial) precisely one of group, and
+                              that one is among cands.
+
+Progress formulas are tuples of variable indices, read disjunctively.
+
+Groups of mutually exclusive variables may instead be encoded by a
+single integer variable, where each member of the group corresponds
+to one value; e.g., in the "int" encoding of navobs_spec, positions
+are numbered as in gridworld.cell_code.  The clauses are unchanged,
+but the "exactlyone" clause of such a group is then implicit and
+omitted from solver input.  Valuations returned by solvers are
+decoded back into the variable table by GridSpec.decode_state.
+
+SCL; 2012.
+"""
+
+import itertools
+import subprocess
+import tempfile
+import StringIO
+
+import numpy as np
+import tulip.gr1cint
+
+from gridworld import obs_window, window_masks, cell_code, dist_field, world_matrix
+from automaton import read_gr1c_aut
+
+
+class GridSpec:
+    """GR(1) specification with clauses over a table of Boolean variables.
+
+    The variable table is env_vars followed by sys_vars, i.e., index
+    k < len(env_vars) refers to env_vars[k], and otherwise to
+    sys_vars[k-len(env_vars)].  Each of the init and safety arguments
+    is a sequence of clauses, and each of the progress arguments is a
+    sequence of tuples of indices; cf. module docstring.
+
+    int_vars is a sequence of triples (name, max_value, members),
+    where members is a tuple of pairs (k, value), indicating that
+    variable k is true if and only if the integer variable name
+    (ranging over 0..max_value) has the given value.  Members of an
+    int_vars entry must all be env or all be sys variables.
+
+    hidden_vars is a sequence of names of variables that are always
+    false, e.g., positions that cannot be reached.  They are omitted
+    from solver input, and restored by decode_state.
+
+    Instances should be regarded as immutable.
+    """
+    def __init__(self, env_vars=(), sys_vars=(),
+                 env_init=(), env_safety=(), env_prog=(),
+                 sys_init=(), sys_safety=(), sys_prog=(),
+                 int_vars=(), hidden_vars=()):
+        self.env_vars = tuple(env_vars)
+        self.sys_vars = tuple(sys_vars)
+        self.env_init = tuple(env_init)
+        self.env_safety = tuple(env_safety)
+        self.env_prog = tuple([tuple(p) for p in env_prog])
+        self.sys_init = tuple(sys_init)
+        self.sys_safety = tuple(sys_safety)
+        self.sys_prog = tuple([tuple(p) for p in sys_prog])
+        self.int_vars = tuple([(name, max_value, tuple(members))
+                               for (name, max_value, members) in int_vars])
+        self.hidden_vars = tuple(hidden_vars)
+        self._encoded = dict()  # Variable index -> (name, value)
+        for (name, max_value, members) in self.int_vars:
+            for (k, value) in members:
+                self._encoded[k] = (name, value)
+        self._hash = None
+
+    def _key(self):
+        return (self.env_vars, self.sys_vars,
+                self.env_init, self.env_safety, self.env_prog,
+                self.sys_init, self.sys_safety, self.sys_prog,
+                self.int_vars, self.hidden_vars)
+
+    def __eq__(self, other):
+        return isinstance(other, GridSpec) and self._key() == other._key()
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash(self._key())
+        return self._hash
+
+    def varname(self, k):
+        if k < len(self.env_vars):
+            return self.env_vars[k]
+        return self.sys_vars[k-len(self.env_vars)]
+
+    def _declared(self, env):
+        """Names of env (or sys) variables as given to the solver.
+
+        Return list of pairs (name, max_value), where max_value is
+        None for Boolean variables.
+        """
+        if env:
+            (offset, names) = (0, self.env_vars)
+        else:
+            (offset, names) = (len(self.env_vars), self.sys_vars)
+        decl = [(names[k], None) for k in range(len(names))
+                if not self._encoded.has_key(k+offset)]
+        for (name, max_value, members) in self.int_vars:
+            if len(members) > 0 and (members[0][0] < len(self.env_vars)) == env:
+                decl.append((name, max_value))
+        return decl
+
+    def _literals(self, module_prefixes=("", "")):
+        """Literal of each variable at current and next time step.
+
+        Return list of pairs of strings, indexed as the variable
+        table.  Next time step is indicated by priming (gr1c syntax).
+        """
+        lits = []
+        for k in range(len(self.env_vars)+len(self.sys_vars)):
+            if k < len(self.env_vars):
+                prefix = module_prefixes[0]
+            else:
+                prefix = module_prefixes[1]
+            if self._encoded.has_key(k):
+                (name, value) = self._encoded[k]
+                lits.append(("("+prefix+name+" = "+str(value)+")",
+                             "("+prefix+name+"' = "+str(value)+")"))
+            else:
+                lits.append((prefix+self.varname(k), prefix+self.varname(k)+"'"))
+        return lits
+
+    def _implicit(self, clause):
+        """Is clause implied by an integer encoding?"""
+        if clause[0] == "exactlyone":
+            group = clause[1]
+        elif clause[0] == "notboth":
+            group = clause[1:]
+        else:
+            return False
+        if not self._encoded.has_key(group[0]):
+            return False
+        name = self._encoded[group[0]][0]
+        for k in group:
+            if (not self._encoded.has_key(k)) or self._encoded[k][0] != name:
+                return False
+        return True
+
+    def decode_state(self, state):
+        """Translate valuation from solver into the variable table.
+
+        state is a dictionary keyed by variable name, as in nodes of
+        tulip.automaton.Automaton.  Integer variables (cf. int_vars)
+        are replaced by their members, and hidden variables are added
+        (as false).  Return new dictionary.
+        """
+        state = state.copy()
+        for name in self.hidden_vars:
+            state[name] = 0
+        for (name, max_value, members) in self.int_vars:
+            if not state.has_key(name):
+                continue
+            value = state[name]
+            del state[name]
+            for (k, member_value) in members:
+                if member_value == value:
+                    state[self.varname(k)] = 1
+                else:
+                    state[self.varname(k)] = 0
+        return state
+
+    def decode_aut(self, aut):
+        """Apply decode_state to every node of the given automaton."""
+        if len(self.int_vars) == 0 and len(self.hidden_vars) == 0:
+            return
+        for node in aut.states:
+            node.state = self.decode_state(node.state)
+
+    def dump_gr1c(self, f):
+        """Write specification in gr1c syntax to the file object f."""
+        lits = self._literals()
+        for (section, env) in [("ENV", True), ("SYS", False)]:
+            f.write(section+": ")
+            f.write(" ".join([name if max_value is None
+                              else name+" [0,"+str(max_value)+"]"
+                              for (name, max_value) in self._declared(env)]))
+            f.write(";\n")
+        for (section, clauses) in [("ENVINIT", self.env_init),
+                                   ("ENVTRANS", self.env_safety),
+                                   ("SYSINIT", self.sys_init),
+                                   ("SYSTRANS", self.sys_safety)]:
+            f.write(section+":")
+            is_trans = section.endswith("TRANS")
+            first = True
+            for clause in clauses:
+                if self._implicit(clause):
+                    continue
+                if not first:
+                    f.write(" &")
+                first = False
+                f.write("\n")
+                if is_trans:
+                    f.write("[](")
+                    _write_clause(f, clause, lits, 1, self._encoded)
+                    f.write(")")
+                else:
+                    _write_clause(f, clause, lits, 0, self._encoded)
+            f.write(";\n")
+        for (section, progs) in [("ENVGOAL", self.env_prog),
+                                 ("SYSGOAL", self.sys_prog)]:
+            f.write(section+":")
+            f.write(" &".join(["\n[]<>("+" | ".join([lits[k][0] for k in p])+")"
+                               for p in progs]))
+            f.write(";\n")
+
+    def dump_jtlv(self, fname_prefix):
+        """Write specification as JTLV input files.
+
+        The files are fname_prefix.smv and fname_prefix.spc, as used
+        by tulip.jtlvint.solveGame.  Variable names are qualified by
+        module, e.g., e.X_0_1_1 and s.Y_2_3.
+        """
+        lits = self._literals(module_prefixes=("e.", "s."))
+        with open(fname_prefix+".smv", "w") as f:
+            # Some parts of this code are copied from tulip/rhtlp.py
+            f.write("MODULE main \n")
+            f.write("\tVAR\n")
+            f.write("\t\te : env();\n")
+            f.write("\t\ts : sys();\n\n")
+            f.write("MODULE sys \n")
+            f.write("\tVAR\n")
+            for env in [False, True]:
+                if env:
+                    f.write("MODULE env \n")
+                    f.write("\tVAR\n")
+                for (name, max_value) in self._declared(env):
+                    if max_value is None:
+                        f.write("\t\t" + name + " : boolean;\n")
+                    else:
+                        f.write("\t\t" + name + " : 0.."+str(max_value)+";\n")
+
+        with open(fname_prefix+".spc", "w") as f:
+            for (init, safety, progs) in [(self.env_init, self.env_safety, self.env_prog),
+                                          (self.sys_init, self.sys_safety, self.sys_prog)]:
+                f.write("LTLSPEC\n")
+                parts = []
+                if len(init) > 0:
+                    parts.append(_jtlv_init)
+                if len(progs) > 0:
+                    parts.append(_jtlv_progs)
+                if len(safety) > 0:
+                    parts.append(_jtlv_safety)
+                for k in range(len(parts)):
+                    if k > 0:
+                        f.write(" & \n")
+                    parts[k](f, self, init, safety, progs, lits)
+                f.write("\n;\n\n")
+
+
+def _write_clause(f, clause, lits, t, encoded):
+    """Write one clause to file object f.
+
+    lits is as returned by GridSpec._literals, and t is the time step
+    (0 for current, 1 for next) of variables constrained by clause.
+    encoded is the GridSpec._encoded dictionary.
+    """
+    if clause[0] == "trans":
+        f.write(lits[clause[1]][0]+" -> (")
+        f.write(" | ".join([lits[k][t] for k in clause[2]]))
+        f.write(")")
+    elif clause[0] == "forbid":
+        f.write("!("+lits[clause[1]][t]+")")
+    elif clause[0] == "notboth":
+        f.write("!("+lits[clause[1]][t]+" & "+lits[clause[2]][t]+")")
+    elif clause[0] == "exactlyone":
+        _write_onehot(f, clause[1], clause[1], lits, t)
+    elif clause[0] == "onehot":
+        if encoded.has_key(clause[1][0]):
+            # Mutual exclusion is implied by the integer encoding.
+            f.write(" | ".join([lits[k][t] for k in clause[2]]))
+        else:
+            _write_onehot(f, clause[1], clause[2], lits, t)
+    else:
+        raise ValueError("unrecognized clause \""+str(clause[0])+"\"")
+
+def _write_onehot(f, group, cands, lits, t):
+    """Disjunction over c in cands of c and no other member of group true."""
+    negated = [" & !"+lits[k][t] for k in group]
+    first = True
+    for c in cands:
+        if not first:
+            f.write("\n| ")
+        first = False
+        f.write("("+lits[c][t])
+        ind = group.index(c)
+        f.write("".join(negated[:ind]))
+        f.write("".join(negated[ind+1:]))
+        f.write(")")
+
+def _jtlv_init(f, spec, init, safety, progs, lits):
+    # Mutual exclusion at the initial time is implied by the safety
+    # formula, thus only list the candidates.
+    clauses = []
+    for clause in init:
+        if clause[0] == "onehot":
+            clauses.append("("+" | ".join([lits[k][0] for k in clause[2]])+")")
+        else:
+            raise ValueError("unsupported init clause \""+str(clause[0])+"\"")
+    f.write("("+" & ".join(clauses)+")")
+
+def _jtlv_progs(f, spec, init, safety, progs, lits):
+    f.write(" & ".join(["[]<>("+" | ".join([lits[k][0] for k in p])+")"
+                        for p in progs]))
+
+def _jtlv_safety(f, spec, init, safety, progs, lits):
+    first = True
+    for clause in safety:
+        if spec._implicit(clause):
+            continue
+        if not first:
+            f.write(" &\n\t")
+        first = False
+        if clause[0] == "trans":
+            f.write("[]("+lits[clause[1]][0]+" -> next(")
+            f.write(" | ".join([lits[k][0] for k in clause[2]]))
+            f.write("))")
+        else:
+            f.write("[](")
+            _write_clause(f, clause, lits, 0, spec._encoded)
+            f.write(")")
+
+
+def world_clauses(W, var_index, center_loc=None, restrict_radius=1,
+                  cells=None):
+    """Clauses describing motion in W; cf. LTL_world.
+
+    var_index is a callable taking (row, column), or (-1, -1) for
+    "nowhere", and returning the corresponding variable index.  If
+    center_loc is None, motion is over all of W; otherwise it is
+    restricted as in LTL_world.
+
+    If cells is not None, then it is the set of positions (possibly
+    including (-1, -1)) that have variables, e.g., as returned by
+    reachable_cells.  Positions not in cells are omitted; blocked
+    cells in it are forbidden.
+
+    Return (safety, group), where safety is a list of clauses
+    (including mutual exclusion) and group is the tuple of indices of
+    variables for possible positions (open cells, and "nowhere" if
+    present), in row-major order with "nowhere" last.
+    """
+    W = world_matrix(W)
+    if center_loc is None:
+        (row_low, row_high, col_low, col_high) = (0, W.shape[0]-1, 0, W.shape[1]-1)
+        nowhere = [False, False, False, False]
+    else:
+        (row_low, row_high, col_low, col_high, nowhere) = obs_window(W, center_loc,
+                                                                     restrict_radius)
+    has_nowhere = ((nowhere[0] or nowhere[1] or nowhere[2] or nowhere[3])
+                   and (cells is None or (-1, -1) in cells))
+    if row_low > row_high or col_low > col_high:
+        sub = np.zeros((0, 0), dtype=W.dtype)
+    else:
+        sub = W[row_low:row_high+1, col_low:col_high+1]
+    if cells is None:
+        keep = np.ones(sub.shape, dtype=bool)
+    else:
+        keep = np.zeros(sub.shape, dtype=bool)
+        for (i, j) in cells:
+            if i >= row_low and i <= row_high and j >= col_low and j <= col_high:
+                keep[i-row_low, j-col_low] = True
+    (up, left, down, right, edge) = window_masks((sub == 0) & keep, nowhere)
+    safety = []
+    group = []
+    boundary = []
+    for (a, b) in np.argwhere(keep):
+        (i, j) = (int(a)+row_low, int(b)+col_low)
+        if sub[a, b] != 0:
+            safety.append(("forbid", var_index(i, j)))
+            continue
+        group.append(var_index(i, j))
+        succs = [var_index(i, j)]
+        if up[a, b]:
+            succs.append(var_index(i-1, j))
+        if left[a, b]:
+            succs.append(var_index(i, j-1))
+        if down[a, b]:
+            succs.append(var_index(i+1, j))
+        if right[a, b]:
+            succs.append(var_index(i, j+1))
+        if has_nowhere and edge[a, b]:
+            succs.append(var_index(-1, -1))
+            boundary.append(var_index(i, j))
+        safety.append(("trans", var_index(i, j), tuple(succs)))
+    if has_nowhere:
+        safety.append(("trans", var_index(-1, -1), tuple([var_index(-1, -1)]+boundary)))
+        group.append(var_index(-1, -1))
+    if len(group) > 0:
+        safety.append(("exactlyone", tuple(group)))
+    return safety, tuple(group)
+
+
+def int_world_formula(W, var_prefix, center_loc=None, restrict_radius=1,
+                      jtlv=False):
+    """Motion in W as a formula over one integer position variable.
+
+    This is the "int" encoding of navobs_spec, i.e., the position is
+    the variable var_prefix, with values given by cell_code, and
+    clauses are those of world_clauses.  Used by gridworld.LTL_world
+    and LTL_world_JTLV.  Return tuple of transition rules (gr1c
+    syntax), or formula string if jtlv is True.
+    """
+    W = world_matrix(W)
+    (safety, group) = world_clauses(W, lambda i, j: cell_code(W.shape, (i, j)),
+                                    center_loc=center_loc,
+                                    restrict_radius=restrict_radius)
+    # Variable k is position k; names are never written, as all are
+    # members of the integer variable.
+    spec = GridSpec(sys_vars=[var_prefix+"_"+str(k) for k in range(W.size+1)],
+                    sys_safety=safety,
+                    int_vars=[(var_prefix, W.size,
+                               [(k, k) for k in range(W.size+1)])])
+    lits = spec._literals()
+    if jtlv:
+        f = StringIO.StringIO()
+        _jtlv_safety(f, spec, (), spec.sys_safety, (), lits)
+        return f.getvalue()
+    rules = []
+    for clause in spec.sys_safety:
+        if spec._implicit(clause):
+            continue
+        f = StringIO.StringIO()
+        _write_clause(f, clause, lits, 1, spec._encoded)
+        rules.append(f.getvalue())
+    return tuple(rules)
+
+
+def reachable_cells(W, sources, center_loc=None, restrict_radius=1):
+    """Positions reachable from sources under motion as in world_clauses.
+
+    sources is a list of positions, where (-1, -1) is "nowhere".  If
+    center_loc is not None, motion is restricted as in LTL_world, and
+    "nowhere" connects all cells along the clipped sides of the
+    restricted region.
+
+    Return set of positions, including (-1, -1) if "nowhere" is
+    reachable.  Blocked sources are not included.
+    """
+    sources = [tuple(loc) for loc in sources]
+    if center_loc is None:
+        reached = dist_field(W, sources) >= 0
+        return set([(int(i), int(j)) for (i, j) in zip(*np.nonzero(reached))])
+
+    W = world_matrix(W)
+    (row_low, row_high, col_low, col_high, nowhere) = obs_window(W, center_loc,
+                                                                 restrict_radius)
+    W_win = np.ones(W.shape, dtype=W.dtype)
+    W_win[row_low:row_high+1, col_low:col_high+1] = W[row_low:row_high+1,
+                                                      col_low:col_high+1]
+    boundary = []
+    for i in range(row_low, row_high+1):
+        for j in range(col_low, col_high+1):
+            if W_win[i][j] == 0 and ((i == row_low and nowhere[0])
+                                     or (i == row_high and nowhere[1])
+                                     or (j == col_low and nowhere[2])
+                                     or (j == col_high and nowhere[3])):
+                boundary.append((i, j))
+    reached = dist_field(W_win, sources) >= 0
+    from_nowhere = False
+    if nowhere[0] or nowhere[1] or nowhere[2] or nowhere[3]:
+        from_nowhere = ((-1, -1) in sources
+                        or any([reached[i][j] for (i, j) in boundary]))
+        if from_nowhere:
+            reached |= dist_field(W_win, boundary) >= 0
+    cells = set([(int(i), int(j)) for (i, j) in zip(*np.nonzero(reached))])
+    if from_nowhere:
+        cells.add((-1, -1))
+    return cells
+
+
+def navobs_spec(init_list, goal_list, W, env_init_list=[],
+                env_goal_list=None, goals_disjunct=None,
+                restrict_radius=1, var_prefix="Y", env_prefix="X",
+                encoding="onehot"):
+    """Build GridSpec for the problem of gen_navobs_soln.
+
+    Arguments are as in gen_navobs_soln, with number of obstacles
+    given by len(env_init_list).  If env_init_list is empty, then the
+    result is the deterministic problem of gen_dsoln.  N.B., obstacles
+    are initialized jointly; cf. btsynth.explicit.synthesize.
+
+    Variables are named as those of gen_navobs_soln.  Only positions
+    reachable from initial positions (and goal positions, to keep the
+    progress formulas meaningful) are given to the solver; the sys
+    position is restricted to the connected component of open cells
+    containing init_list, and each obstacle to the part of its
+    restricted region reachable from its initial position.  All
+    other variables are listed in hidden_vars of the result.
+
+    If encoding is "int", then the sys position and the position of
+    each obstacle are given to the solver as single integer variables
+    named var_prefix and env_prefix_N, respectively (N is the number
+    of the obstacle), with values as in gridworld.cell_code.  Default
+    is "onehot", i.e., one Boolean variable per position.
+
+    Raise ValueError if the initial position of an obstacle is
+    outside its restricted region, unless the region is clipped by
+    the edge of W (cf. gridworld.obs_window); the obstacle then starts
+    at "nowhere".
+
+    To build several specifications on the same world, use
+    WorldSession instead.
+    """
+    session = WorldSession(W, restrict_radius=restrict_radius,
+                           var_prefix=var_prefix, env_prefix=env_prefix,
+                           encoding=encoding)
+    return session.spec(init_list, goal_list, env_init_list=env_init_list,
+                        env_goal_list=env_goal_list,
+                        goals_disjunct=goals_disjunct)
+
+
+MAX_PLACED = 16  # Bound on relocated sys fragments kept by a WorldSession
+
+class WorldSession:
+    """Specifications on one world, sharing fragments across queries.
+
+    The world matrix W is copied, and thereafter changed only through
+    set_cell.  Other arguments are as in navobs_spec.  Each call of
+    spec builds a GridSpec equal to that from navobs_spec with the
+    same arguments, but reachable sets, motion clauses and variable
+    names of the sys and obstacle regions are kept, so that queries
+    varying only init, goals or obstacle centers reuse them.  When a
+    cell is changed, only what depends on that cell is discarded.
+    """
+    def __init__(self, W, restrict_radius=1, var_prefix="Y", env_prefix="X",
+                 encoding="onehot"):
+        if encoding not in ["onehot", "int"]:
+            raise ValueError("unrecognized encoding \""+str(encoding)+"\"")
+        self.W = world_matrix(W).copy()
+        self.restrict_radius = restrict_radius
+        self.var_prefix = var_prefix
+        self.env_prefix = env_prefix
+        self.encoding = encoding
+        self._reach = dict()  # (sources, center_loc) -> cells
+        self._frags = dict()  # (center_loc, cells) -> fragment
+        self._names = dict()  # (prefix, center_loc, cells) -> (names, hidden)
+        self._placed = dict()  # (cells, offset) -> relocated sys clauses; cf. _placed_sys
+
+    def check(self, W, restrict_radius=None, var_prefix=None,
+              env_prefix=None, encoding=None):
+        """Raise ValueError unless this session is for world W and the
+        given settings; those that are None are not compared.
+        """
+        if not np.array_equal(world_matrix(W), self.W):
+            raise ValueError("world differs from that of the session.")
+        for (name, value) in [("restrict_radius", restrict_radius),
+                              ("var_prefix", var_prefix),
+                              ("env_prefix", env_prefix),
+                              ("encoding", encoding)]:
+            if (value is not None) and value != getattr(self, name):
+                raise ValueError(name+" differs from that of the session.")
+
+    def set_cell(self, loc, value):
+        """Set cell loc of the world to value (1 is blocked, 0 is open)."""
+        loc = (int(loc[0]), int(loc[1]))
+        if self.W[loc[0]][loc[1]] == value:
+            return
+        self.W[loc[0]][loc[1]] = value
+        # A reachable set can only change if loc is a source, or it
+        # contains loc or a neighbor of it, or it contains "nowhere"
+        # and loc is in the restricted region.  Fragments depend only
+        # on their cells.
+        nbhd = set([loc, (loc[0]-1, loc[1]), (loc[0], loc[1]-1),
+                    (loc[0]+1, loc[1]), (loc[0], loc[1]+1)])
+        for key in self._reach.keys():
+            (sources, center_loc) = key
+            if (loc in sources or not nbhd.isdisjoint(self._reach[key])
+                or ((-1, -1) in self._reach[key]
+                    and _in_window(self.W, loc, center_loc, self.restrict_radius))):
+                del self._reach[key]
+        for key in self._frags.keys():
+            if loc in key[1]:
+                del self._frags[key]
+        for key in self._placed.keys():
+            if loc in key[0]:
+                del self._placed[key]
+
+    def _reachable(self, sources, center_loc):
+        key = (tuple(sources), center_loc)
+        if not self._reach.has_key(key):
+            self._reach[key] = frozenset(reachable_cells(self.W, sources,
+                                                         center_loc=center_loc,
+                                                         restrict_radius=self.restrict_radius))
+        return self._reach[key]
+
+    def _fragment(self, center_loc, cells):
+        """Motion clauses over cells, with variables numbered from 0.
+
+        Return (positions, index, safety), where positions is the
+        sorted list of cells (thus "nowhere" first, then row-major),
+        index maps each position to its number, and safety is a tuple
+        of clauses as returned by world_clauses.
+        """
+        key = (center_loc, cells)
+        if not self._frags.has_key(key):
+            positions = sorted(cells)
+            index = dict([(positions[k], k) for k in range(len(positions))])
+            (safety, group) = world_clauses(self.W, lambda i, j: index[(i, j)],
+                                            center_loc=center_loc,
+                                            restrict_radius=self.restrict_radius,
+                                            cells=cells)
+            self._frags[key] = (positions, index, tuple(safety))
+        return self._frags[key]
+
+    def _varnames(self, prefix, center_loc, cells):
+        """Names of variables of positions in cells, and of all others.
+
+        Return (names, hidden), where names is ordered as positions of
+        _fragment and hidden lists positions of the region (the
+        restricted region of center_loc, or all of W) not in cells.
+        """
+        key = (prefix, center_loc, cells)
+        if not self._names.has_key(key):
+            if center_loc is None:
+                (row_low, row_high, col_low, col_high) = (0, self.W.shape[0]-1,
+                                                          0, self.W.shape[1]-1)
+                nowhere = [False, False, False, False]
+            else:
+                (row_low, row_high, col_low, col_high, nowhere) = obs_window(self.W, center_loc,
+                                                                             self.restrict_radius)
+            region = list(itertools.product(range(row_low, row_high+1),
+                                            range(col_low, col_high+1)))
+            if nowhere[0] or nowhere[1] or nowhere[2] or nowhere[3]:
+                region.insert(0, (-1, -1))
+            names = []
+            hidden = []
+            for loc in region:
+                if loc == (-1, -1):
+                    name = prefix+"_n_n"
+                else:
+                    name = prefix+"_"+str(loc[0])+"_"+str(loc[1])
+                if loc in cells:
+                    names.append(name)
+                else:
+                    hidden.append(name)
+            self._names[key] = (tuple(names), tuple(hidden))
+        return self._names[key]
+
+    def _placed_sys(self, cells, offset):
+        """Motion clauses of sys over cells, starting at index offset.
+
+        offset is the number of obstacle variables, so it changes
+        with the obstacle regions of each query, and each entry is as
+        large as the sys fragment.  Thus at most MAX_PLACED entries
+        are kept, and all are dropped when that is exceeded.
+        """
+        key = (cells, offset)
+        if not self._placed.has_key(key):
+            if len(self._placed) >= MAX_PLACED:
+                self._placed.clear()
+            self._placed[key] = _shift_clauses(self._fragment(None, cells)[2], offset)
+        return self._placed[key]
+
+    def spec(self, init_list, goal_list, env_init_list=[],
+             env_goal_list=None, goals_disjunct=None):
+        """Build GridSpec as navobs_spec would for the current world.
+
+        Raise ValueError if the initial position of an obstacle is
+        outside its restricted region and the region is not clipped
+        (so that "nowhere" is not a position of the obstacle).
+        """
+        W = self.W
+        num_obs = len(env_init_list)
+        if env_goal_list is None:
+            env_goal_list = env_init_list
+        if goals_disjunct is None:
+            goals_disjunct = []
+        hidden_vars = []
+
+        ########################################
+        # Environment
+        env_vars = []
+        env_safety = []
+        env_init = []
+        env_prog = []
+        obs_index = []  # Variable index of each position, per obstacle
+        for k in range(num_obs):
+            center_loc = (int(env_goal_list[k][0]), int(env_goal_list[k][1]))
+            (row_low, row_high, col_low, col_high, nowhere) = obs_window(W, center_loc,
+                                                                        self.restrict_radius)
+            def in_window(loc):
+                return (loc[0] >= row_low and loc[0] <= row_high
+                        and loc[1] >= col_low and loc[1] <= col_high)
+            # Initial and goal positions, or "nowhere" if outside region
+            init_loc = tuple(env_init_list[k])
+            goal_loc = tuple(env_goal_list[k])
+            if not (in_window(init_loc) and in_window(goal_loc)):
+                if not (nowhere[0] or nowhere[1] or nowhere[2] or nowhere[3]):
+                    raise ValueError("obstacle "+str(k)+" starts or ends outside its restricted region, which has no \"nowhere\".")
+                if not in_window(init_loc):
+                    init_loc = (-1, -1)
+                if not in_window(goal_loc):
+                    goal_loc = (-1, -1)
+
+            cells = self._reachable([init_loc], center_loc)|frozenset([init_loc, goal_loc])
+            (positions, index, safety) = self._fragment(center_loc, cells)
+            (names, hidden) = self._varnames(self.env_prefix+"_"+str(k), center_loc, cells)
+            offset = len(env_vars)
+            obs_index.append(dict([(loc, ind+offset) for (loc, ind) in index.items()]))
+            env_vars.extend(names)
+            hidden_vars.extend(hidden)
+            env_safety.extend(_shift_clauses(safety, offset))
+
+            all_obs_vars = tuple(range(offset, offset+len(positions)))
+            env_init.append(("onehot", all_obs_vars, (obs_index[k][init_loc],)))
+
+            # Progress: always eventually obstacle returns to goal position.
+            env_prog.append((obs_index[k][goal_loc],))
+
+        ########################################
+        # System
+        num_env = len(env_vars)
+        cells = (self._reachable([tuple(loc) for loc in init_list], None)
+                 | frozenset([tuple(loc) for loc in init_list+goal_list+goals_disjunct]))
+        (positions, index, safety) = self._fragment(None, cells)
+        (sys_vars, hidden) = self._varnames(self.var_prefix, None, cells)
+        hidden_vars.extend(hidden)
+        def sys_index(i, j):
+            return index[(i, j)]+num_env
+        sys_safety = list(self._placed_sys(cells, num_env))
+        all_sys_vars = tuple(range(num_env, num_env+len(sys_vars)))
+        sys_init = [("onehot", all_sys_vars,
+                     tuple([sys_index(loc[0], loc[1]) for loc in init_list]))]
+        sys_prog = [(sys_index(loc[0], loc[1]),) for loc in goal_list]
+        if len(goals_disjunct) > 0:
+            sys_prog.append(tuple([sys_index(loc[0], loc[1]) for loc in goals_disjunct]))
+
+        int_vars = []
+        if self.encoding == "int":
+            for k in range(num_obs):
+                members = tuple(sorted([(ind, cell_code(W.shape, loc))
+                                        for (loc, ind) in obs_index[k].items()]))
+                int_vars.append((self.env_prefix+"_"+str(k), W.shape[0]*W.shape[1], members))
+            members = tuple([(num_env+ind, cell_code(W.shape, positions[ind]))
+                             for ind in range(len(positions))])
+            int_vars.append((self.var_prefix, W.shape[0]*W.shape[1]-1, members))
+
+        ########################################
+        # Interaction: avoid collisions
+        for k in range(num_obs):
+            for (loc, ind) in sorted(obs_index[k].items()):
+                if index.has_key(loc):
+                    sys_safety.append(("notboth", sys_index(loc[0], loc[1]), ind))
+
+        return GridSpec(env_vars=env_vars, sys_vars=sys_vars,
+                        env_init=env_init, env_safety=env_safety, env_prog=env_prog,
+                        sys_init=sys_init, sys_safety=sys_safety, sys_prog=sys_prog,
+                        int_vars=int_vars, hidden_vars=hidden_vars)
+
+
+def _in_window(W, loc, center_loc, restrict_radius):
+    (row_low, row_high, col_low, col_high, nowhere) = obs_window(W, center_loc,
+                                                                 restrict_radius)
+    return (loc[0] >= row_low and loc[0] <= row_high
+            and loc[1] >= col_low and loc[1] <= col_high)
+
+def _shift_clauses(clauses, offset):
+    """Return clauses with offset added to every variable index."""
+    if offset == 0:
+        return tuple(clauses)
+    shifted = []
+    for clause in clauses:
+        if clause[0] == "trans":
+            shifted.append(("trans", clause[1]+offset,
+                            tuple([k+offset for k in clause[2]])))
+        elif clause[0] == "forbid":
+            shifted.append(("forbid", clause[1]+offset))
+        elif clause[0] == "exactlyone":
+            shifted.append(("exactlyone", tuple([k+offset for k in clause[1]])))
+        elif clause[0] == "notboth":
+            shifted.append(("notboth", clause[1]+offset, clause[2]+offset))
+        elif clause[0] == "onehot":
+            shifted.append(("onehot", tuple([k+offset for k in clause[1]]),
+                            tuple([k+offset for k in clause[2]])))
+        else:
+            raise ValueError("unrecognized clause \""+str(clause[0])+"\"")
+    return tuple(shifted)
+
+
+def _gr1c_start(spec, args):
+    """Start a gr1c process with spec streamed to its stdin.
+
+    Return (p, errf), where p is the subprocess.Popen object, with
+    stdout piped, and errf is a temporary file receiving stderr.
+    """
+    f = tempfile.TemporaryFile()
+    spec.dump_gr1c(f)
+    f.seek(0)
+    errf = tempfile.TemporaryFile()
+    bin_prefix = getattr(tulip.gr1cint, "GR1C_BIN_PREFIX", "")
+    p = subprocess.Popen([bin_prefix+"gr1c"]+args, stdin=f,
+                         stdout=subprocess.PIPE, stderr=errf)
+    f.close()
+    return p, errf
+
+def _gr1c_errors(errf):
+    errf.seek(0)
+    stderrdata = errf.read()
+    errf.close()
+    return stderrdata
+
+def _gr1c_run(spec, args):
+    """Stream spec to a gr1c process.
+
+    Return (returncode, output, errors), where output and errors are
+    what gr1c wrote to stdout and stderr.
+    """
+    (p, errf) = _gr1c_start(spec, args)
+    stdoutdata = p.communicate()[0]
+    return p.returncode, stdoutdata, _gr1c_errors(errf)
+
+def check_realizable(spec, verbose=0):
+    """Decide realizability of given GridSpec using gr1c.
+
+    Return True if realizable, False if not, or an error occurs.
+    """
+    (returncode, stdoutdata, stderrdata) = _gr1c_run(spec, ["-r"])
+    if verbose > 0:
+        print stdoutdata+stderrdata
+    return returncode == 0
+
+def synthesize(spec, verbose=0):
+    """Synthesize strategy for given GridSpec using gr1c.
+
+    Return instance of btsynth.automaton.BTAutomaton, or None if not
+    realizable or an error occurs.  Node valuations are in terms of
+    the variable table of spec; cf. GridSpec.decode_state.
+
+    The output of gr1c is parsed as it is produced (cf.
+    btsynth.automaton.read_gr1c_aut), rather than being collected
+    first.
+    """
+    (p, errf) = _gr1c_start(spec, ["-t", "tulip"])
+    try:
+        aut = read_gr1c_aut(p.stdout, decode=spec.decode_state)
+    except SyntaxError:
+        aut = None  # E.g., no output because not realizable
+    finally:
+        p.stdout.close()
+        p.wait()
+    stderrdata = _gr1c_errors(errf)
+    if verbose > 0:
+        print stderrdata
+    if p.returncode != 0:
+        return None
+    return aut
@@ -24,53 +24,92 @@ def errmsg(m):
 
 def dump_world(W, goal_list=[], init_list=[], env_list=[]):
     """Inverse of read_world.  Returns a string."""
-    output = str(W.shape[0])+" "+str(W.shape[1])+"\n"
-    for i in range(W.shape[0]):
-        if np.any(W[i][:] != 0):
-            for j in range(W.shape[1]):
-                if W[i][j] != 0:
-                    output += str(j) + " "
-            output += "\n"
+    W = world_matrix(W)
+    lines = [str(W.shape[0])+" "+str(W.shape[1])]
+    for row in (W != 0):
+        cols = np.flatnonzero(row)
+        if len(cols) > 0:
+            lines.append("".join([str(j)+" " for j in cols]))
         else:
-            output += "-\n"
-    output += "\n".join(["G "+str(i)+" "+str(j) for (i, j) in goal_list]) + "\n"
-    output += "\n".join(["I "+str(i)+" "+str(j) for (i, j) in init_list]) + "\n"
-    output += "\n".join(["E "+str(i)+" "+str(j) for (i, j) in env_list]) + "\n"
-    return output
+            lines.append("-")
+    lines.append("\n".join(["G "+str(i)+" "+str(j) for (i, j) in goal_list]))
+    lines.append("\n".join(["I "+str(i)+" "+str(j) for (i, j) in init_list]))
+    lines.append("\n".join(["E "+str(i)+" "+str(j) for (i, j) in env_list]))
+    return "\n".join(lines)+"\n"
+
+
+def _rng(seed):
+    """Random number generator for seed, which is None (use the global
+    state of numpy.random), an int, or a generator instance."""
+    if seed is None:
+        return np.random
+    if hasattr(seed, "permutation"):
+        return seed
+    if hasattr(np.random, "default_rng"):
+        return np.random.default_rng(seed)
+    return np.random.RandomState(seed)
 
 
-def random_world(size, wall_density=.2, num_goals=2, num_env=0):
+def random_world(size, wall_density=.2, num_goals=2, num_env=0, seed=None):
     """Randomly generated problem world. Same return value as read_world.
     
     size is a pair, indicating number of rows and columns.
     wall_density is the ratio of walls to total number of cells.
+
+    All placements are made at once from a random permutation of the
+    cells: first walls, then goals, obstacles and the initial
+    location, so these are distinct.  seed is None (default; use the
+    global state of numpy.random), an int, or an instance of
+    numpy.random.Generator or RandomState.  Worlds are reproducible
+    for a given int seed.
     """
     num_cells = size[0]*size[1]
-    goal_list = []
-    env_list = []
-    W = np.zeros(num_cells, dtype=np.uint8)
     num_blocks = int(np.round(wall_density*num_cells))
-    for i in range(num_blocks):
-        avail_inds = np.array(range(num_cells))[W==0]
-        W[avail_inds[np.random.randint(low=0, high=len(avail_inds))]] = 1
-    for i in range(num_goals):
-        avail_inds = np.array(range(num_cells))[W==0]
-        avail_inds = [k for k in avail_inds if k not in goal_list]
-        goal_list.append(avail_inds[np.random.randint(low=0, high=len(avail_inds))])
-    for i in range(num_env):
-        avail_inds = np.array(range(num_cells))[W==0]
-        avail_inds = [k for k in avail_inds if (k not in goal_list) and (k not in env_list)]
-        env_list.append(avail_inds[np.random.randint(low=0, high=len(avail_inds))])
-    avail_inds = np.array(range(num_cells))[W==0]
-    avail_inds = [k for k in avail_inds if (k not in goal_list) and (k not in env_list)]
-    init_list = [avail_inds[np.random.randint(low=0, high=len(avail_inds))]]
+    if num_blocks+num_goals+num_env+1 > num_cells:
+        raise ValueError("too few cells for the requested walls and positions.")
+    perm = _rng(seed).permutation(num_cells)
+    W = np.zeros(num_cells, dtype=np.uint8)
+    W[perm[:num_blocks]] = 1
     W = W.reshape(size)
-    goal_list = [(k/size[1], k%size[1]) for k in goal_list]
-    env_list = [(k/size[1], k%size[1]) for k in env_list]
-    init_list = [(k/size[1], k%size[1]) for k in init_list]
+    cells = [(int(k/size[1]), int(k%size[1]))
+             for k in perm[num_blocks:num_blocks+num_goals+num_env+1]]
+    goal_list = cells[:num_goals]
+    env_list = cells[num_goals:num_goals+num_env]
+    init_list = cells[num_goals+num_env:]
     return (W, goal_list, init_list, env_list)
 
 
+def random_worlds(num_worlds, size, wall_density=.2, num_goals=2, num_env=0,
+                  seed=None):
+    """Batch of num_worlds worlds as from random_world, in stacked arrays.
+
+    Arguments are as in random_world, and the batch is reproducible
+    for a given int seed.  Return (W, goals, inits, envs), where W is
+    a uint8 array of shape (num_worlds, rows, columns), and goals,
+    inits and envs are int arrays of (row, column) pairs with shapes
+    (num_worlds, num_goals, 2), (num_worlds, 1, 2) and (num_worlds,
+    num_env, 2).
+    """
+    num_cells = size[0]*size[1]
+    num_blocks = int(np.round(wall_density*num_cells))
+    num_placed = num_goals+num_env+1
+    if num_blocks+num_placed > num_cells:
+        raise ValueError("too few cells for the requested walls and positions.")
+    rng = _rng(seed)
+    if hasattr(rng, "random"):
+        keys = rng.random((num_worlds, num_cells))
+    else:
+        keys = rng.random_sample((num_worlds, num_cells))
+    perm = np.argsort(keys, axis=1)
+    W = np.zeros((num_worlds, num_cells), dtype=np.uint8)
+    W[np.arange(num_worlds)[:, np.newaxis], perm[:, :num_blocks]] = 1
+    W = W.reshape((num_worlds, size[0], size[1]))
+    placed = perm[:, num_blocks:num_blocks+num_placed]
+    coords = np.dstack((placed/size[1], placed%size[1]))
+    return (W, coords[:, :num_goals], coords[:, num_goals+num_env:],
+            coords[:, num_goals:num_goals+num_env])
+
+
 def read_world(world_str):
     """Process string as World, return matrix, and goal, init lists for sys and env.
 
@@ -181,11 +220,65 @@ def read_world(world_str):
 
 def read_worldf(fname):
     """File wrapper for read_world function."""
-    wstr_list = []
     with open(fname, "r") as f:
-        for line in f:
-            wstr_list.append(line)
-    return read_world("\n".join(wstr_list))
+        return read_world(f.read())
+
+
+WORLDB_MAGIC = "BTWORLD\0"
+WORLDB_VERSION = 1
+_WORLDB_HEADER = 8+6*8  # Magic, then int64 version, shape and list lengths
+
+def write_worldb(fname, W, goal_list=[], init_list=[], env_list=[]):
+    """Save world in binary form, for reading with read_worldb.
+
+    The file has an 8-byte magic string, then little-endian int64
+    version number, number of rows and columns, and lengths of goal,
+    init and env lists, then the cells of W (one byte each, in
+    row-major order) padded to a multiple of 8 bytes, and finally the
+    (row, column) pairs of goal, init and env lists as int64.
+    """
+    W = world_matrix(W)
+    lists = [goal_list, init_list, env_list]
+    header = np.array([WORLDB_VERSION, W.shape[0], W.shape[1]]
+                      + [len(l) for l in lists], dtype="<i8")
+    coords = np.array([loc for l in lists for loc in l], dtype="<i8").reshape((-1, 2))
+    with open(fname, "wb") as f:
+        f.write(WORLDB_MAGIC)
+        f.write(header.tostring())
+        f.write(np.ascontiguousarray(W, dtype=np.uint8).tostring())
+        f.write("\0"*(-W.size % 8))
+        f.write(coords.tostring())
+
+def read_worldb(fname, mmap=True):
+    """Read world saved by write_worldb; same return value as read_world.
+
+    If mmap is True (default), then the world matrix is a read-only
+    memory map of the file, so that processes reading the same file
+    share it without copying, and only the parts of it that are used
+    (e.g., by subworld, which returns views) are loaded.  Otherwise,
+    it is read into an array.
+    """
+    with open(fname, "rb") as f:
+        if f.read(len(WORLDB_MAGIC)) != WORLDB_MAGIC:
+            raise ValueError("not a binary world file: "+str(fname))
+        header = np.fromstring(f.read(_WORLDB_HEADER-len(WORLDB_MAGIC)), dtype="<i8")
+        if header[0] != WORLDB_VERSION:
+            raise ValueError("unsupported binary world version "+str(header[0]))
+        (num_rows, num_cols) = (int(header[1]), int(header[2]))
+        lengths = [int(n) for n in header[3:6]]
+        num_cells = num_rows*num_cols
+        if mmap:
+            W = np.memmap(fname, dtype=np.uint8, mode="r",
+                          offset=_WORLDB_HEADER, shape=(num_rows, num_cols))
+        else:
+            W = np.fromstring(f.read(num_cells), dtype=np.uint8).reshape((num_rows, num_cols))
+        f.seek(_WORLDB_HEADER+num_cells+(-num_cells % 8))
+        coords = np.fromstring(f.read(16*sum(lengths)), dtype="<i8").reshape((-1, 2))
+    coords = [(int(i), int(j)) for (i, j) in coords]
+    goal_list = coords[:lengths[0]]
+    init_list = coords[lengths[0]:lengths[0]+lengths[1]]
+    env_list = coords[lengths[0]+lengths[1]:]
+    return W, goal_list, init_list, env_list
 
 def image_world(W, goal_list=[], init_list=[], env_init_list=[],
                 show_grid=False, grid_width=2):
@@ -311,8 +404,243 @@ def pretty_world(W, goal_list=[], init_list=[], env_init_list=[],
     return out_str
 
 
+def obs_window(W, center_loc, restrict_radius=1):
+    """Bounds of the restricted region of an obstacle, as in LTL_world.
+
+    Return (row_low, row_high, col_low, col_high, nowhere), where
+    nowhere is a list of four flags indicating whether the region is
+    clipped at row_low, row_high, col_low, col_high, respectively.
+    The region may be empty (e.g., if center_loc is far outside W),
+    in which case only "nowhere" is available.
+    """
+    nowhere = [False,  # corresponds to row_low
+               False,  # row_high
+               False,  # col_low
+               False]  # col_high
+    row_low = center_loc[0]-restrict_radius
+    if row_low < 0:
+        row_low = 0
+        nowhere[0] = True
+    row_high = center_loc[0]+restrict_radius
+    if row_high > W.shape[0]-1:
+        row_high = W.shape[0]-1
+        nowhere[1] = True
+    col_low = center_loc[1]-restrict_radius
+    if col_low < 0:
+        col_low = 0
+        nowhere[2] = True
+    col_high = center_loc[1]+restrict_radius
+    if col_high > W.shape[1]-1:
+        col_high = W.shape[1]-1
+        nowhere[3] = True
+    return (row_low, row_high, col_low, col_high, nowhere)
+
+
+def cell_code(shape, loc):
+    """Integer code of position loc in a world matrix of given shape.
+
+    Cells are numbered in row-major order, i.e., (row, column) has
+    code row*shape[1]+column, and "nowhere" (-1, -1) has code
+    shape[0]*shape[1].  Used for compact position encodings.
+    """
+    if loc[0] == -1 and loc[1] == -1:
+        return shape[0]*shape[1]
+    return loc[0]*shape[1] + loc[1]
+
+def decode_cell(shape, code):
+    """Inverse of cell_code."""
+    if code == shape[0]*shape[1]:
+        return (-1, -1)
+    return (code/shape[1], code%shape[1])
+
+
+# Memoized results of LTL_world and LTL_world_JTLV; cf. _world_key.
+_LTL_world_cache = dict()
+_LTL_WORLD_CACHE_SIZE = 256
+
+def _world_key(W):
+    """Key identifying the contents of world matrix W, for memoization."""
+    return (W.shape, W.dtype.str, W.tostring())
+
+def _window(W, center_loc, restrict_radius):
+    """Restricted region as used by LTL_world.
+
+    Return (row_low, row_high, col_low, col_high, nowhere,
+    always_nowhere_flag); cf. obs_window.
+    """
+    if center_loc is None:
+        return (0, W.shape[0]-1, 0, W.shape[1]-1,
+                [False, False, False, False], False)
+    (row_low, row_high, col_low, col_high, nowhere) = obs_window(W, center_loc,
+                                                                 restrict_radius)
+    always_nowhere_flag = (row_low > W.shape[0]-1 or row_high < 0
+                           or col_low > W.shape[1]-1 or col_high < 0)
+    return (row_low, row_high, col_low, col_high, nowhere, always_nowhere_flag)
+
+def window_masks(open_cells, nowhere):
+    """Neighbor masks for a (window of a) world, computed by shifts.
+
+    open_cells is a boolean array indicating cells into which motion
+    is possible.  nowhere is as returned by obs_window.
+
+    Return (up, left, down, right, edge), boolean arrays of the same
+    shape as open_cells, where e.g. up[i][j] is True if cell (i-1, j)
+    is in the window and open, and edge[i][j] is True if cell (i, j)
+    is along a side of the window at which "nowhere" is reachable.
+    """
+    up = np.zeros(open_cells.shape, dtype=bool)
+    left = np.zeros(open_cells.shape, dtype=bool)
+    down = np.zeros(open_cells.shape, dtype=bool)
+    right = np.zeros(open_cells.shape, dtype=bool)
+    edge = np.zeros(open_cells.shape, dtype=bool)
+    up[1:, :] = open_cells[:-1, :]
+    left[:, 1:] = open_cells[:, :-1]
+    down[:-1, :] = open_cells[1:, :]
+    right[:, :-1] = open_cells[:, 1:]
+    if edge.size > 0:
+        if nowhere[0]:
+            edge[0, :] = True
+        if nowhere[1]:
+            edge[-1, :] = True
+        if nowhere[2]:
+            edge[:, 0] = True
+        if nowhere[3]:
+            edge[:, -1] = True
+    return up, left, down, right, edge
+
+def _window_moves(W, row_low, row_high, col_low, col_high, nowhere, start_cells):
+    """Successors of each cell in the window, as offsets into it.
+
+    start_cells is a function of the window submatrix, returning a
+    boolean array indicating from which cells to list moves.
+
+    Return (sub, moves), where sub is the window submatrix of W and
+    moves is a list of ((i, j), succs, to_nowhere), with (i, j) in
+    window coordinates, in row-major order.  succs begins with (i, j)
+    and then lists open neighbors up, left, down, right.
+    """
+    if row_low > row_high or col_low > col_high:
+        sub = np.zeros((0, 0), dtype=W.dtype)
+    else:
+        sub = W[row_low:row_high+1, col_low:col_high+1]
+    (up, left, down, right, edge) = window_masks(sub == 0, nowhere)
+    moves = []
+    for (i, j) in np.argwhere(start_cells(sub)):
+        succs = [(i, j)]
+        if up[i, j]:
+            succs.append((i-1, j))
+        if left[i, j]:
+            succs.append((i, j-1))
+        if down[i, j]:
+            succs.append((i+1, j))
+        if right[i, j]:
+            succs.append((i, j+1))
+        moves.append(((i, j), succs, edge[i, j]))
+    return sub, moves
+
+def _memoized_LTL_world(builder, syntax, W, var_prefix, center_loc,
+                        restrict_radius, encoding):
+    if center_loc is not None:
+        center_loc = (int(center_loc[0]), int(center_loc[1]))
+    key = (syntax, _world_key(W), var_prefix, center_loc, restrict_radius, encoding)
+    if _LTL_world_cache.has_key(key):
+        return _LTL_world_cache[key]
+    result = builder(W, var_prefix, center_loc, restrict_radius,
+                     jtlv=(syntax == "jtlv"))
+    if len(_LTL_world_cache) >= _LTL_WORLD_CACHE_SIZE:
+        _LTL_world_cache.clear()
+    _LTL_world_cache[key] = result
+    return result
+
+
+def _LTL_world_int(W, var_prefix, center_loc, restrict_radius, jtlv):
+    """LTL_world and LTL_world_JTLV with the "int" encoding.
+
+    The formula is that of the "int" encoding of
+    gridspec.navobs_spec; cf. gridspec.int_world_formula.
+    """
+    import gridspec  # Not at top, since gridspec imports this module
+    return gridspec.int_world_formula(W, var_prefix, center_loc=center_loc,
+                                      restrict_radius=restrict_radius, jtlv=jtlv)
+
+
+def _LTL_world_onehot(W, var_prefix, center_loc, restrict_radius, jtlv):
+    """Body of LTL_world and LTL_world_JTLV for the "onehot" encoding.
+
+    Return tuple of transition rules (gr1c syntax) or formula string
+    (JTLV syntax).
+    """
+    (row_low, row_high, col_low, col_high,
+     nowhere, always_nowhere_flag) = _window(W, center_loc, restrict_radius)
+    has_nowhere = nowhere[0] or nowhere[1] or nowhere[2] or nowhere[3]
+    (sub, moves) = _window_moves(W, row_low, row_high, col_low, col_high, nowhere,
+                                 lambda sub: sub != 1)
+    # Variable names, indexed by window coordinates
+    row_names = [var_prefix+"_"+str(i)+"_" for i in range(row_low, row_high+1)]
+    col_names = [str(j) for j in range(col_low, col_high+1)]
+    names = [[r+c for c in col_names] for r in row_names]
+    nowhere_name = var_prefix+"_n_n"
+    if jtlv:
+        nxt = ""
+    else:
+        nxt = "'"
+
+    # Safety, transitions
+    out_trans = []
+    for ((i, j), succs, to_nowhere) in moves:
+        succ_names = [names[a][b]+nxt for (a, b) in succs]
+        if to_nowhere:
+            succ_names.append(nowhere_name+nxt)
+        if jtlv:
+            out_trans.append("[]("+names[i][j]+" -> next("+" | ".join(succ_names)+"))")
+        else:
+            out_trans.append(names[i][j]+" -> ("+" | ".join(succ_names)+")")
+    if has_nowhere:
+        # Add transitions from "nowhere"
+        succ_names = [nowhere_name+nxt]
+        if not always_nowhere_flag:
+            last_row = len(row_names)-1
+            last_col = len(col_names)-1
+            if nowhere[0]:
+                succ_names.extend([names[0][b]+nxt for b in range(len(col_names))])
+            if nowhere[1]:
+                succ_names.extend([names[last_row][b]+nxt for b in range(len(col_names))])
+            if nowhere[2]:
+                succ_names.extend([names[a][0]+nxt for a in range(len(row_names))])
+            if nowhere[3]:
+                succ_names.extend([names[a][last_col]+nxt for a in range(len(row_names))])
+        if jtlv:
+            out_trans.append("[]("+nowhere_name+" -> next("+" | ".join(succ_names)+"))")
+        else:
+            out_trans.append(nowhere_name+" -> ("+" | ".join(succ_names)+")")
+
+    # Safety, static
+    for (i, j) in np.argwhere(sub == 1):
+        if jtlv:
+            out_trans.append("[](!(" + names[i][j] + "))")
+        else:
+            out_trans.append("!(" + names[i][j]+nxt + ")")
+
+    # Safety, mutex; each term is built by removing one piece from
+    # the conjunction of all negations.
+    pos_names = [names[i][j]+nxt for (i, j) in np.argwhere(sub != 1)]
+    if has_nowhere:
+        pos_names.append(nowhere_name+nxt)
+    negated = [" & (!" + name + ")" for name in pos_names]
+    all_negated = "".join(negated)
+    offsets = [0]
+    for piece in negated:
+        offsets.append(offsets[-1]+len(piece))
+    terms = ["(" + pos_names[k] + all_negated[:offsets[k]] + all_negated[offsets[k+1]:] + ")"
+             for k in range(len(pos_names))]
+    if jtlv:
+        return " &\n\t".join(out_trans) + "\n& []("+" | ".join(terms)+")"
+    out_trans.append("\n| ".join(terms))
+    return tuple(out_trans)
+
+
 def LTL_world(W, var_prefix="obs",
-              center_loc=None, restrict_radius=1):
+              center_loc=None, restrict_radius=1, encoding="onehot"):
     """Convert world matrix W into an LTL formula describing transitions.
     
     Syntax is that of gr1c; in particular, "next" variables are
@@ -339,121 +667,31 @@ def LTL_world(W, var_prefix="obs",
 
     "nowhere" has the position (-1, -1).
 
+    If encoding is "int", then instead of one Boolean variable per
+    cell, the position is a single integer variable named var_prefix
+    with values given by cell_code, so that no mutex formula is
+    needed.  The default is "onehot".
+
+    Results are memoized, keyed by the contents of W and the other
+    arguments, so repeated calls (e.g., once per obstacle) are cheap.
+
     Return the formula as a list of transition rules, which can be
     used directly in building a specification in a GRSpec object
     (defined in spec module of TuLiP).  Return None if failure.
     """
-    always_nowhere_flag = False
-    nowhere = [False,  # corresponds to row_low
-               False,  # row_high
-               False,  # col_low
-               False]  # col_high
-    if center_loc is not None:
-        row_low = center_loc[0]-restrict_radius
-        if row_low < 0:
-            row_low = 0
-            nowhere[0] = True
-        row_high = center_loc[0]+restrict_radius
-        if row_high > W.shape[0]-1:
-            row_high = W.shape[0]-1
-            nowhere[1] = True
-        col_low = center_loc[1]-restrict_radius
-        if col_low < 0:
-            col_low = 0
-            nowhere[2] = True
-        col_high = center_loc[1]+restrict_radius
-        if col_high > W.shape[1]-1:
-            col_high = W.shape[1]-1
-            nowhere[3] = True
-        # Special case:
-        if (row_low > W.shape[0]-1 or row_high < 0
-            or col_low > W.shape[1]-1 or col_high < 0):
-            always_nowhere_flag = True
+    W = world_matrix(W)
+    if encoding == "int":
+        builder = _LTL_world_int
+    elif encoding == "onehot":
+        builder = _LTL_world_onehot
     else:
-        row_low = 0
-        row_high = W.shape[0]-1
-        col_low = 0
-        col_high = W.shape[1]-1
-    out_trans = []
-    # Safety, transitions
-    for i in range(row_low, row_high+1):
-        for j in range(col_low, col_high+1):
-            if W[i][j] == 1:
-                continue  # Cannot start from an occupied cell.
-            out_trans.append(var_prefix+"_"+str(i)+"_"+str(j)+" -> (")
-            # Normal transitions:
-            out_trans[-1] += var_prefix+"_"+str(i)+"_"+str(j)+"'"
-            if i > row_low and W[i-1][j] == 0:
-                out_trans[-1] += " | " + var_prefix+"_"+str(i-1)+"_"+str(j)+"'"
-            if j > col_low and W[i][j-1] == 0:
-                out_trans[-1] += " | " + var_prefix+"_"+str(i)+"_"+str(j-1)+"'"
-            if i < row_high and W[i+1][j] == 0:
-                out_trans[-1] += " | " + var_prefix+"_"+str(i+1)+"_"+str(j)+"'"
-            if j < col_high and W[i][j+1] == 0:
-                out_trans[-1] += " | " + var_prefix+"_"+str(i)+"_"+str(j+1)+"'"
-            # Transitions to "nowhere":
-            if ((i == row_low and nowhere[0])
-                or (i == row_high and nowhere[1])
-                or (j == col_low and nowhere[2])
-                or (j == col_high and nowhere[3])):
-                out_trans[-1] += " | " + var_prefix+"_n_n'"
-            out_trans[-1] += ")"
-    if nowhere[0] or nowhere[1] or nowhere[2] or nowhere[3]:
-        # Add transitions from "nowhere"
-        out_trans.append(var_prefix+"_n_n"+" -> (")
-        out_trans[-1] += var_prefix+"_n_n'"
-        if not always_nowhere_flag:
-            if nowhere[0]:
-                for j in range(col_low, col_high+1):
-                    out_trans[-1] += " | " + var_prefix+"_"+str(row_low)+"_"+str(j)+"'"
-            if nowhere[1]:
-                for j in range(col_low, col_high+1):
-                    out_trans[-1] += " | " + var_prefix+"_"+str(row_high)+"_"+str(j)+"'"
-            if nowhere[2]:
-                for i in range(row_low, row_high+1):
-                    out_trans[-1] += " | " + var_prefix+"_"+str(i)+"_"+str(col_low)+"'"
-            if nowhere[3]:
-                for i in range(row_low, row_high+1):
-                    out_trans[-1] += " | " + var_prefix+"_"+str(i)+"_"+str(col_high)+"'"
-        out_trans[-1] += ")"
-    
-    # Safety, static
-    for i in range(row_low, row_high+1):
-        for j in range(col_low, col_high+1):
-            if W[i][j] == 1:
-                out_trans.append("!(" + var_prefix+"_"+str(i)+"_"+str(j)+"'" + ")")
-
-    # Safety, mutex
-    first_subformula = True
-    out_trans.append("")
-    pos_indices = [k for k in itertools.product(range(row_low, row_high+1), range(col_low, col_high+1))]
-    if nowhere[0] or nowhere[1] or nowhere[2] or nowhere[3]:
-        pos_indices.append((-1, -1))
-    for outer_ind in pos_indices:
-        if outer_ind != (-1, -1) and W[outer_ind[0]][outer_ind[1]] == 1:
-            continue
-        if not first_subformula:
-            out_trans[-1] += "\n| "
-        if outer_ind == (-1, -1):
-            out_trans[-1] += "(" + var_prefix+"_n_n'"
-        else:
-            out_trans[-1] += "(" + var_prefix+"_"+str(outer_ind[0])+"_"+str(outer_ind[1])+"'"
-        for inner_ind in pos_indices:
-            if ((inner_ind != (-1, -1) and W[inner_ind[0]][inner_ind[1]] == 1)
-                or outer_ind == inner_ind):
-                continue
-            if inner_ind == (-1, -1):
-                out_trans[-1] += " & (!" + var_prefix+"_n_n')"
-            else:
-                out_trans[-1] += " & (!" + var_prefix+"_"+str(inner_ind[0])+"_"+str(inner_ind[1])+"'" + ")"
-        out_trans[-1] += ")"
-        first_subformula = False
-
-    return out_trans
+        raise ValueError("unrecognized encoding \""+str(encoding)+"\"")
+    return list(_memoized_LTL_world(builder, "gr1c", W, var_prefix, center_loc,
+                                    restrict_radius, encoding))
 
 
 def LTL_world_JTLV(W, var_prefix="obs",
-                   center_loc=None, restrict_radius=1):
+                   center_loc=None, restrict_radius=1, encoding="onehot"):
     """Convert world matrix W into an LTL formula describing transitions.
 
     Use JTLV syntax in the returned formula.
@@ -478,135 +716,32 @@ def LTL_world_JTLV(W, var_prefix="obs",
 
     "nowhere" has the position (-1, -1).
 
+    encoding and memoization are as in LTL_world.
+
     Return the formula string on success; None if failure.
     """
-    always_nowhere_flag = False
-    nowhere = [False,  # corresponds to row_low
-               False,  # row_high
-               False,  # col_low
-               False]  # col_high
-    if center_loc is not None:
-        row_low = center_loc[0]-restrict_radius
-        if row_low < 0:
-            row_low = 0
-            nowhere[0] = True
-        row_high = center_loc[0]+restrict_radius
-        if row_high > W.shape[0]-1:
-            row_high = W.shape[0]-1
-            nowhere[1] = True
-        col_low = center_loc[1]-restrict_radius
-        if col_low < 0:
-            col_low = 0
-            nowhere[2] = True
-        col_high = center_loc[1]+restrict_radius
-        if col_high > W.shape[1]-1:
-            col_high = W.shape[1]-1
-            nowhere[3] = True
-        # Special case:
-        if (row_low > W.shape[0]-1 or row_high < 0
-            or col_low > W.shape[1]-1 or col_high < 0):
-            always_nowhere_flag = True
+    W = world_matrix(W)
+    if encoding == "int":
+        builder = _LTL_world_int
+    elif encoding == "onehot":
+        builder = _LTL_world_onehot
     else:
-        row_low = 0
-        row_high = W.shape[0]-1
-        col_low = 0
-        col_high = W.shape[1]-1
-    out_str = ""
-    first_subformula = True
-    # Safety, transitions
-    for i in range(row_low, row_high+1):
-        for j in range(col_low, col_high+1):
-            if W[i][j] == 1:
-                continue  # Cannot start from an occupied cell.
-            if not first_subformula:
-                out_str += " &\n\t"
-            out_str += "[]("+var_prefix+"_"+str(i)+"_"+str(j)+" -> next("
-            # Normal transitions:
-            out_str += var_prefix+"_"+str(i)+"_"+str(j)
-            if i > row_low and W[i-1][j] == 0:
-                out_str += " | " + var_prefix+"_"+str(i-1)+"_"+str(j)
-            if j > col_low and W[i][j-1] == 0:
-                out_str += " | " + var_prefix+"_"+str(i)+"_"+str(j-1)
-            if i < row_high and W[i+1][j] == 0:
-                out_str += " | " + var_prefix+"_"+str(i+1)+"_"+str(j)
-            if j < col_high and W[i][j+1] == 0:
-                out_str += " | " + var_prefix+"_"+str(i)+"_"+str(j+1)
-            # Transitions to "nowhere":
-            if ((i == row_low and nowhere[0])
-                or (i == row_high and nowhere[1])
-                or (j == col_low and nowhere[2])
-                or (j == col_high and nowhere[3])):
-                out_str += " | " + var_prefix+"_n_n"
-            out_str += "))"
-            first_subformula = False
-    if nowhere[0] or nowhere[1] or nowhere[2] or nowhere[3]:
-        # Add transitions from "nowhere"
-        if not first_subformula:
-            out_str += " &\n\t"
-        out_str += "[]("+var_prefix+"_n_n"+" -> next("
-        out_str += var_prefix+"_n_n"
-        if not always_nowhere_flag:
-            if nowhere[0]:
-                for j in range(col_low, col_high+1):
-                    out_str += " | " + var_prefix+"_"+str(row_low)+"_"+str(j)
-            if nowhere[1]:
-                for j in range(col_low, col_high+1):
-                    out_str += " | " + var_prefix+"_"+str(row_high)+"_"+str(j)
-            if nowhere[2]:
-                for i in range(row_low, row_high+1):
-                    out_str += " | " + var_prefix+"_"+str(i)+"_"+str(col_low)
-            if nowhere[3]:
-                for i in range(row_low, row_high+1):
-                    out_str += " | " + var_prefix+"_"+str(i)+"_"+str(col_high)
-        out_str += "))"
-        first_subformula = False
-    
-    # Safety, static
-    for i in range(row_low, row_high+1):
-        for j in range(col_low, col_high+1):
-            if W[i][j] == 1:
-                if not first_subformula:
-                    out_str += " &\n\t"
-                out_str += "[](!(" + var_prefix+"_"+str(i)+"_"+str(j) + "))"
-                first_subformula = False
-
-    # Safety, mutex
-    first_subformula = True
-    out_str += "\n& []("
-    pos_indices = [k for k in itertools.product(range(row_low, row_high+1), range(col_low, col_high+1))]
-    if nowhere[0] or nowhere[1] or nowhere[2] or nowhere[3]:
-        pos_indices.append((-1, -1))
-    for outer_ind in pos_indices:
-        if outer_ind != (-1, -1) and W[outer_ind[0]][outer_ind[1]] == 1:
-            continue
-        if not first_subformula:
-            out_str += " | "
-        if outer_ind == (-1, -1):
-            out_str += "(" + var_prefix+"_n_n"
-        else:
-            out_str += "(" + var_prefix+"_"+str(outer_ind[0])+"_"+str(outer_ind[1])
-        for inner_ind in pos_indices:
-            if ((inner_ind != (-1, -1) and W[inner_ind[0]][inner_ind[1]] == 1)
-                or outer_ind == inner_ind):
-                continue
-            if inner_ind == (-1, -1):
-                out_str += " & (!" + var_prefix+"_n_n)"
-            else:
-                out_str += " & (!" + var_prefix+"_"+str(inner_ind[0])+"_"+str(inner_ind[1]) + ")"
-        out_str += ")"
-        first_subformula = False
-    out_str += ")"
-            
-    return out_str
+        raise ValueError("unrecognized encoding \""+str(encoding)+"\"")
+    return _memoized_LTL_world(builder, "jtlv", W, var_prefix, center_loc,
+                               restrict_radius, encoding)
 
 
-def subworld(W, subregion):
+def subworld(W, subregion, mask=False):
     """Return submatrix of W based on given subregion, and its offset.
 
     subregion should be a list of locations, preferably contiguous.
     The bounding rectangle of subregion is used to determine
-    submatrix.
+    submatrix.  The submatrix is a view of W (e.g., of a memory map
+    from read_worldb), not a copy, unless mask is True, in which case
+    a copy is returned in which cells of the rectangle that are not
+    in subregion are blocked.
     """
+    W = world_matrix(W)
     min_r = W.shape[0]
     max_r = -1
     min_c = W.shape[1]
@@ -620,10 +755,403 @@ def subworld(W, subregion):
             min_c = k[1]
         if k[1] > max_c:
             max_c = k[1]
-    return W[min_r:(max_r+1), min_c:(max_c+1)], (min_r, min_c)
+    W_sub = W[min_r:(max_r+1), min_c:(max_c+1)]
+    if mask:
+        keep = np.zeros(W_sub.shape, dtype=bool)
+        for k in subregion:
+            keep[k[0]-min_r, k[1]-min_c] = True
+        W_sub = W_sub.copy()
+        W_sub[~keep] = 1
+    return W_sub, (min_r, min_c)
+
+
+def dist_field(W, sources):
+    """Breadth-first distances from sources over open cells of W.
+
+    sources is a list of (row, column) pairs; blocked or out-of-range
+    sources are ignored.  Movement is as in LTL_world, i.e., by one
+    step along a row or column.
+
+    Return int array with the shape of W, having entry -1 for cells
+    not reachable from any source (including all walls).  If W is an
+    instance of World, its cached field is returned, which must not
+    be modified.
+    """
+    if isinstance(W, World):
+        return W.dist_field(sources)
+    dist = -np.ones(W.shape, dtype=np.int32)
+    free = (W == 0)
+    frontier = np.zeros(W.shape, dtype=bool)
+    for loc in sources:
+        if (loc[0] >= 0 and loc[0] < W.shape[0]
+            and loc[1] >= 0 and loc[1] < W.shape[1]
+            and free[loc[0], loc[1]]):
+            frontier[loc[0], loc[1]] = True
+    dist[frontier] = 0
+    d = 0
+    while np.any(frontier):
+        d += 1
+        next_frontier = np.zeros(W.shape, dtype=bool)
+        next_frontier[1:, :] |= frontier[:-1, :]
+        next_frontier[:-1, :] |= frontier[1:, :]
+        next_frontier[:, 1:] |= frontier[:, :-1]
+        next_frontier[:, :-1] |= frontier[:, 1:]
+        next_frontier &= free & (dist < 0)
+        dist[next_frontier] = d
+        frontier = next_frontier
+    return dist
+
+def grid_path(W, start, goal, dist=None):
+    """Shortest path from start to goal through open cells of W.
+
+    If dist is not None, it should be the result of dist_field(W,
+    [goal]), which can be reused for several queries with the same
+    goal.  More generally, if dist is from several sources, then the
+    path leads to the nearest of them (and goal is ignored).
+
+    Return list of (row, column) pairs, beginning with start and
+    ending with goal; None if goal is not reachable from start.
+    """
+    if dist is None:
+        dist = dist_field(W, [goal])
+    W = world_matrix(W)
+    if (start[0] < 0 or start[0] >= W.shape[0]
+        or start[1] < 0 or start[1] >= W.shape[1]
+        or dist[start[0]][start[1]] < 0):
+        return None
+    path = [tuple(start)]
+    (i, j) = start
+    while dist[i][j] > 0:
+        for (ni, nj) in [(i-1, j), (i, j-1), (i+1, j), (i, j+1)]:
+            if (ni >= 0 and ni < W.shape[0] and nj >= 0 and nj < W.shape[1]
+                and dist[ni][nj] == dist[i][j]-1):
+                (i, j) = (ni, nj)
+                break
+        path.append((i, j))
+    return path
+
+
+def patch_region(W, center_loc, radius, shape="square", route=None):
+    """Cells of the neighborhood of center_loc used for patching.
 
+    shape is one of
+      "square" -- cells within Chebyshev distance radius (default);
+      "manhattan" -- cells within Manhattan distance radius;
+      "flood" -- center_loc and cells reachable from it in at most
+          radius steps through open cells of W;
+      "corridor" -- cells of the square within Manhattan distance
+          (radius+1)/2 of some cell of route, which is a list of
+          cells, e.g., a route broken at center_loc.
+    Each is contained in the square of the same radius.
 
-def extract_autcoord(aut_node, var_prefix="Y"):
+    Return list of (row, column) pairs in row-major order.
+    """
+    W = world_matrix(W)
+    (rows, cols) = np.ogrid[0:W.shape[0], 0:W.shape[1]]
+    drow = np.abs(rows-center_loc[0])
+    dcol = np.abs(cols-center_loc[1])
+    inside = np.maximum(drow, dcol) <= radius
+    if shape == "square":
+        pass
+    elif shape == "manhattan":
+        inside &= drow+dcol <= radius
+    elif shape == "flood":
+        nbrs = [(center_loc[0]-1, center_loc[1]), (center_loc[0], center_loc[1]-1),
+                (center_loc[0]+1, center_loc[1]), (center_loc[0], center_loc[1]+1)]
+        dist = dist_field(W, nbrs)
+        inside &= (dist >= 0) & (dist < radius)
+        inside[center_loc[0], center_loc[1]] = True
+    elif shape == "corridor":
+        if route is None or len(route) == 0:
+            raise ValueError("corridor region requires a route.")
+        near = np.zeros(W.shape, dtype=bool)
+        width = (radius+1)/2
+        for loc in route:
+            near |= np.abs(rows-loc[0])+np.abs(cols-loc[1]) <= width
+        inside &= near
+    else:
+        raise ValueError("unrecognized region shape \""+str(shape)+"\"")
+    return [(int(i), int(j)) for (i, j) in np.argwhere(inside)]
+
+
+def max_patch_radius(W):
+    """Radius beyond which no region given by patch_region on W grows.
+
+    E.g., flood regions are no larger than the reachable cells,
+    which are at distance less than W.size, and corridors of radius
+    2*(rows+columns) are at least as wide as the world.
+    """
+    W = world_matrix(W)
+    return max(W.size, 2*(W.shape[0]+W.shape[1]))
+
+
+def patch_radius(W, fail_loc, entry_loc, exit_locs):
+    """Smallest square neighborhood of fail_loc that reconnects a route.
+
+    A route through the blocked cell fail_loc arrives at it from
+    entry_loc and continues to one of exit_locs (a list of cells).
+    Return the least radius r >= 1 such that entry_loc is connected
+    to some cell of exit_locs through open cells of W within the
+    square region of radius r centered at fail_loc (i.e., the
+    neighborhoods used for patching in btsim_d and btsim_navobs).
+    Return None if they are not connected even in all of W.
+    """
+    W = world_matrix(W)
+    exit_locs = [tuple(loc) for loc in exit_locs]
+    reached = dist_field(W, [entry_loc])
+    if not any([reached[loc[0]][loc[1]] >= 0 for loc in exit_locs]):
+        return None
+    cheb = lambda loc: max(abs(loc[0]-fail_loc[0]), abs(loc[1]-fail_loc[1]))
+    radius = max(1, cheb(entry_loc), min([cheb(loc) for loc in exit_locs]))
+    while True:
+        (row_low, row_high, col_low, col_high, nowhere) = obs_window(W, fail_loc,
+                                                                     radius)
+        W_win = np.ones(W.shape, dtype=W.dtype)
+        W_win[row_low:row_high+1, col_low:col_high+1] = W[row_low:row_high+1,
+                                                          col_low:col_high+1]
+        reached = dist_field(W_win, [entry_loc])
+        if any([reached[loc[0]][loc[1]] >= 0 for loc in exit_locs]):
+            return radius
+        radius += 1
+
+
+class World:
+    """Gridworld matrix together with its goal, init and env lists.
+
+    W is wrapped, not copied, and thereafter should be changed only
+    through set_cell.  Derived structures are computed on first use
+    and kept: indices of open cells, their adjacency in compressed
+    sparse row (CSR) form, connected components, and distance fields
+    (cf. dist_field).  Changing a cell discards only those that can
+    depend on it.
+
+    Routines in this module and in btsynth that take a world matrix
+    also accept an instance of World, using its cached structures
+    where they can.
+    """
+    def __init__(self, W, goal_list=[], init_list=[], env_init_list=[]):
+        self.W = np.asarray(W)
+        self.goal_list = list(goal_list)
+        self.init_list = list(init_list)
+        self.env_init_list = list(env_init_list)
+        self._free = None
+        self._adj = None
+        self._comp = None
+        self._dists = dict()  # sorted sources -> distance field
+
+    @property
+    def shape(self):
+        return self.W.shape
+
+    def copy(self):
+        """Return World with copy of the matrix and lists, but no caches."""
+        return World(self.W.copy(), self.goal_list, self.init_list,
+                     self.env_init_list)
+
+    def free_cells(self):
+        """Return flat indices (as in W.flatten()) of open cells, ascending."""
+        if self._free is None:
+            self._free = np.flatnonzero(self.W == 0)
+        return self._free
+
+    def free_list(self):
+        """Return list of (row, column) of open cells, in row-major order."""
+        cols = self.W.shape[1]
+        return [(k/cols, k%cols) for k in self.free_cells()]
+
+    def adjacency(self):
+        """Adjacency of open cells in CSR form.
+
+        Open cells are numbered by their position in free_cells().
+        Return (indptr, indices) such that the neighbors of cell k
+        are indices[indptr[k]:indptr[k+1]], in the order up, left,
+        down, right.  Movement is as in LTL_world.
+        """
+        if self._adj is not None:
+            return self._adj
+        free = self.free_cells()
+        num_rows, cols = self.W.shape
+        number = -np.ones(self.W.size, dtype=np.int32)
+        number[free] = np.arange(len(free), dtype=np.int32)
+        rows = free/cols
+        srcs = []
+        dsts = []
+        for (shift, valid) in [(-cols, rows > 0), (-1, free%cols > 0),
+                               (cols, rows < num_rows-1),
+                               (1, free%cols < cols-1)]:
+            src = np.flatnonzero(valid)
+            dst = number[free[src]+shift]
+            keep = dst >= 0
+            srcs.append(src[keep])
+            dsts.append(dst[keep])
+        srcs = np.concatenate(srcs)
+        dsts = np.concatenate(dsts)
+        order = np.argsort(srcs, kind="mergesort")
+        indptr = np.zeros(len(free)+1, dtype=np.int32)
+        np.cumsum(np.bincount(srcs, minlength=len(free)), out=indptr[1:])
+        self._adj = (indptr, dsts[order].astype(np.int32))
+        return self._adj
+
+    def components(self):
+        """Connected components of open cells.
+
+        Return int array with the shape of W, having entry -1 at
+        walls, and equal nonnegative entries at two open cells if and
+        only if they are connected.  Labels need not be consecutive.
+        """
+        if self._comp is not None:
+            return self._comp
+        (indptr, indices) = self.adjacency()
+        free = self.free_cells()
+        label = -np.ones(len(free), dtype=np.int32)
+        for k in range(len(free)):
+            if label[k] >= 0:
+                continue
+            label[k] = k
+            stack = [k]
+            while len(stack) > 0:
+                u = stack.pop()
+                for v in indices[indptr[u]:indptr[u+1]]:
+                    if label[v] < 0:
+                        label[v] = k
+                        stack.append(v)
+        comp = -np.ones(self.W.size, dtype=np.int32)
+        comp[free] = label
+        self._comp = comp.reshape(self.W.shape)
+        return self._comp
+
+    def precheck(self, goals_disjunct=None, restrict_radius=1):
+        """Apply precheck to the world and its goal, init and env lists."""
+        return precheck(self, self.init_list, self.goal_list,
+                        env_init_list=self.env_init_list,
+                        goals_disjunct=goals_disjunct,
+                        restrict_radius=restrict_radius)
+
+    def dist_field(self, sources):
+        """Cached dist_field of the world from sources.
+
+        The returned array is shared and must not be modified.
+        """
+        key = tuple(sorted(set([(int(loc[0]), int(loc[1])) for loc in sources])))
+        if not self._dists.has_key(key):
+            dist = dist_field(self.W, key)
+            dist.setflags(write=False)
+            self._dists[key] = dist
+        return self._dists[key]
+
+    def set_cell(self, loc, value):
+        """Set cell loc of the world to value (1 is blocked, 0 is open)."""
+        (i, j) = (int(loc[0]), int(loc[1]))
+        if (self.W[i][j] == 0) == (value == 0):
+            self.W[i][j] = value
+            return
+        self.W[i][j] = value
+        self._free = None
+        self._adj = None
+        nbrs = [(ni, nj) for (ni, nj) in [(i-1, j), (i, j-1), (i+1, j), (i, j+1)]
+                if (ni >= 0 and ni < self.W.shape[0]
+                    and nj >= 0 and nj < self.W.shape[1])]
+        if self._comp is not None:
+            if value == 0:
+                # Opening a cell merges the components around it.
+                labels = set([self._comp[v] for v in nbrs if self._comp[v] >= 0])
+                if len(labels) == 0:
+                    self._comp[i][j] = self._comp.max()+1
+                else:
+                    merged = min(labels)
+                    self._comp[np.in1d(self._comp, list(labels)).reshape(self.W.shape)] = merged
+                    self._comp[i][j] = merged
+            elif len([v for v in nbrs if self.W[v] == 0]) > 0:
+                self._comp = None
+            else:
+                self._comp[i][j] = -1
+        for (key, dist) in self._dists.items():
+            if value == 0:
+                if (i, j) in key or len([v for v in nbrs if dist[v] >= 0]) > 0:
+                    del self._dists[key]
+            elif dist[i][j] >= 0:
+                del self._dists[key]
+
+
+def precheck(W, init_list, goal_list, env_init_list=[], env_goal_list=None,
+             goals_disjunct=None, restrict_radius=1):
+    """Look for obvious reasons that a navigation problem is unrealizable.
+
+    Arguments are as in gen_navobs_soln (with one obstacle per entry
+    of env_init_list), and W may be an instance of World.  Only
+    connectivity of open cells is considered, so this is cheap; it
+    is meant for rejecting problems before building a specification.
+    The problem is unrealizable if
+      - W has no open cells;
+      - from every initial location, some goal (or every location of
+        goals_disjunct, if given) is unreachable;
+      - some obstacle can reach its goal position and remain there,
+        while that cell separates the goals from each other (or from
+        every location of goals_disjunct).
+
+    Return a string describing the reason if one is found; otherwise
+    None, which does not imply realizability.
+    """
+    if isinstance(W, World):
+        comp = W.components()
+        W = W.W
+    else:
+        comp = World(W).components()
+    if env_goal_list is None:
+        env_goal_list = env_init_list
+    if goals_disjunct is None:
+        goals_disjunct = []
+    if not np.any(comp >= 0):
+        return "world has no open cells"
+    if len(init_list) == 0:
+        return "no initial locations"
+
+    def label(comp, loc):
+        if (loc[0] < 0 or loc[0] >= W.shape[0]
+            or loc[1] < 0 or loc[1] >= W.shape[1]):
+            return -1
+        return comp[loc[0]][loc[1]]
+    def goals_connected(comp, labels):
+        """Component labels (among given) containing all goals."""
+        labels = set([c for c in labels if c >= 0])
+        for loc in goal_list:
+            labels &= set([label(comp, loc)])
+        if len(goals_disjunct) > 0:
+            labels &= set([label(comp, loc) for loc in goals_disjunct])
+        return labels
+
+    if len(goals_connected(comp, [label(comp, loc) for loc in init_list])) == 0:
+        return "goals not reachable from any initial location"
+
+    for k in range(len(env_init_list)):
+        camp = tuple(env_goal_list[k])
+        init_loc = tuple(env_init_list[k])
+        if label(comp, camp) < 0 or label(comp, init_loc) < 0:
+            continue
+        (row_low, row_high, col_low, col_high, nowhere) = obs_window(W, camp,
+                                                                     restrict_radius)
+        W_win = np.ones(W.shape, dtype=W.dtype)
+        W_win[row_low:row_high+1, col_low:col_high+1] = W[row_low:row_high+1,
+                                                          col_low:col_high+1]
+        if dist_field(W_win, [init_loc])[camp[0]][camp[1]] < 0:
+            continue
+        W_camp = W.copy()
+        W_camp[camp[0]][camp[1]] = 1
+        comp_camp = World(W_camp).components()
+        if len(goals_connected(comp_camp, np.unique(comp_camp))) == 0:
+            return ("obstacle "+str(k)+" can remain at "+str(camp)
+                    +", which separates the goals")
+    return None
+
+
+def world_matrix(W):
+    """Return world matrix of W, which is an array or instance of World."""
+    if isinstance(W, World):
+        return W.W
+    return W
+
+
+def extract_autcoord(aut_node, var_prefix="Y", shape=None):
     """Pick out first true variable with name matching prefix_R_C format.
 
     aut_node should be an instance of class BTAutomatonNode.
@@ -631,7 +1159,13 @@ def extract_autcoord(aut_node, var_prefix="Y"):
     Return coordinate as given by extract_coord.  If more than one
     true variable has a matching prefix, return the corresponding list
     of coordinates.  If no matches found, return None.
+
+    If shape is not None and the valuation has a variable named
+    var_prefix, then it is regarded as position in the "int" encoding
+    (cf. LTL_world) for a world matrix of that shape, and decoded.
     """
+    if shape is not None and aut_node.state.has_key(var_prefix):
+        return [decode_cell(shape, aut_node.state[var_prefix])]
     coords = []
     for (k, v) in aut_node.state.items():
         if v != 1:  # We are only interested in True variables
@@ -6,7 +6,6 @@ SCL; Aug, Sep 2011; Feb 2012.
 """
 
 import tulip
-import tulip.congexf as cg
 import sys
 
 from btsynth import *
@@ -30,7 +29,7 @@ if __name__ == "__main__":
                        env_init_list=env_init_list)
 
     if len(sys.argv) >= 4:
-        aut = BTAutomaton(sys.argv[3])
+        aut = read_jtlv_aut(sys.argv[3])
         print "Loaded (nominal) solution automaton M has %d nodes." % aut.size()
         # aut.trimDeadStates()
         # print "After trimming dead nodes, M has size %d" % aut.size()
@@ -54,8 +53,7 @@ if __name__ == "__main__":
             print str(goal)+" -> "+str(len([x for x in history if x == goal]))
     
     aut.writeDotFileCoord("tempsyn-ORIG.dot")
-    with open("tempsyn-ORIG.gexf", "w") as f:
-        f.write(cg.dumpGexf(aut, use_viz=True, use_clusters=True))
+    aut.writeGexf("tempsyn-ORIG.gexf")
 
     # sim_history = grsim([aut], num_it=20, deterministic_env=False)
     # for step in sim_history:
@@ -75,8 +73,7 @@ if __name__ == "__main__":
         print "Global problem recovered while attempting to patch."
     else:
         aut_patched.writeDotFileCoord("tempsyn-PATCHED.dot")
-        with open("tempsyn-PATCHED.gexf", "w") as f:
-            f.write(cg.dumpGexf(aut_patched, use_viz=True, use_clusters=True))
+        aut_patched.writeGexf("tempsyn-PATCHED.gexf")
         print "Size after patching (in nodes):", aut_patched.size()
 
         history, intent, obs_poses = navobs_sim(init_list[0], aut_patched, W_actual,
@@ -3,21 +3,48 @@
 Gather performance statistics from solving and patching in random
 gridworlds.
 
+Results are written to FILE as a world archive (cf. btsynth.archive),
+with one record per trial: the nominal world, and data consisting of
+nominal, global and patching times, and the blocked cell.
+
 SCL; Feb 2012.
 """
 
 import tulip
-import tulip.congexf as cg
 import sys
-import pickle
+import multiprocessing
 
 from btsynth import *
 from btsynth.automaton import BTAutomaton
+from btsynth.gridspec import WorldSession
+from btsynth.archive import WorldArchiveWriter
 
 # Profiling
 from cProfile import Profile
 
 
+def screened_worlds(pool, batch_size, height, width, bdensity, num_env):
+    """Generate random worlds, screened for realizability in batches.
+
+    Worlds rejected by precheck are dropped before screening.
+    """
+    while True:
+        batch = []
+        while len(batch) < batch_size:
+            (W, goal_list, init_list, env_init_list) = random_world(size=(height, width),
+                                                                    wall_density=bdensity,
+                                                                    num_goals=2,
+                                                                    num_env=num_env)
+            if precheck(W, init_list, goal_list, env_init_list=env_init_list,
+                        restrict_radius=1) is None:
+                batch.append((W, goal_list, init_list, env_init_list))
+        (mask, screen_times) = screen_realizability(batch, pool=pool,
+                                                    restrict_radius=1)
+        print "Screened %d worlds in %.3f s (total over workers); %d realizable." % (len(batch), screen_times.sum(), mask.sum())
+        for k in np.flatnonzero(mask):
+            yield batch[k]
+
+
 USAGE = "Usage: %s FILE N H W DENSITY NUMENV" % sys.argv[0]
 if __name__ == "__main__":
     if len(sys.argv) != 7:
@@ -37,14 +64,12 @@ if __name__ == "__main__":
         exit(1)
 
     times = []
-    worlds_data = []
+    archive = WorldArchiveWriter(sys.argv[1])
     game_count = 0
-    while game_count < num_games:
-        (W, goal_list, init_list, env_init_list) = random_world(size=(height, width),
-                                                                wall_density=bdensity,
-                                                                num_goals=2,
-                                                                num_env=num_env)
-
+    pool = multiprocessing.Pool()
+    for (W, goal_list, init_list, env_init_list) in screened_worlds(pool, 2*num_games,
+                                                                     height, width,
+                                                                     bdensity, num_env):
         print "Nominal world:"
         print pretty_world(W, goal_list=goal_list, init_list=init_list,
                            env_init_list=env_init_list)
@@ -67,23 +92,23 @@ if __name__ == "__main__":
         nom_time = nsprof.getstats()[ind].totaltime
 
         aut.writeDotFileCoord("tempsyn-ORIG.dot")
-        with open("tempsyn-ORIG.gexf", "w") as f:
-            f.write(cg.dumpGexf(aut, use_viz=True, use_clusters=True))
+        aut.writeGexf("tempsyn-ORIG.gexf")
 
         # Place block randomly in way of nominal plan (so that
         # patching is indeed necessary).
+        world = World(W, goal_list, init_list, env_init_list)
+        avail_ind = [k for k in world.free_list() if (k not in init_list) and (k not in env_init_list) and (k not in goal_list)]
         W_actual = W.copy()
+        session = WorldSession(W_actual, restrict_radius=1)
         block_try_count = 0
         while True:
             block_try_count += 1
             if block_try_count > max_blocking_tries:
                 break
             
-            avail_ind = np.array(range(W.shape[0]*W.shape[1]))[(W==0).flatten()]
-            avail_ind = [(k/W.shape[1], k%W.shape[1]) for k in avail_ind]
-            avail_ind = [k for k in avail_ind if (k not in init_list) and (k not in env_init_list) and (k not in goal_list)]
             block_ind = avail_ind[np.random.randint(low=0, high=len(avail_ind))]
             W_actual[block_ind[0]][block_ind[1]] = 1
+            session.set_cell(block_ind, 1)
             (history, intent, obs_poses) = navobs_sim(init_list[0], aut,
                                                       W_actual,
                                                       num_obs=len(env_init_list),
@@ -92,12 +117,14 @@ if __name__ == "__main__":
                                                       num_it=1000)
             if intent is True:
                 W_actual[block_ind[0]][block_ind[1]] = 0
+                session.set_cell(block_ind, 0)
                 continue
 
             globalprof = Profile()
-            globalprof.run("aut_global = gen_navobs_soln(init_list=init_list, goal_list=goal_list, W=W_actual, num_obs=len(env_init_list), env_init_list=env_init_list, restrict_radius=1)")
+            globalprof.run("aut_global = gen_navobs_soln(init_list=init_list, goal_list=goal_list, W=W_actual, num_obs=len(env_init_list), env_init_list=env_init_list, restrict_radius=1, session=session)")
             if aut_global is None:
                 W_actual[block_ind[0]][block_ind[1]] = 0
+                session.set_cell(block_ind, 0)
                 continue
             else:
                 print "resulting solution automaton m has %d nodes." % aut_global.size()
@@ -110,9 +137,7 @@ if __name__ == "__main__":
                 global_time = globalprof.getstats()[ind].totaltime
 
                 aut_global.writeDotFileCoord("tempsyn-global.dot")
-                with open("tempsyn-global.gexf", "w") as f:
-                    f.write(cg.dumpGexf(aut_global,
-                                        use_viz=True, use_clusters=True))
+                aut_global.writeGexf("tempsyn-global.gexf")
                 break
 
         if block_try_count > max_blocking_tries:
@@ -132,7 +157,8 @@ if __name__ == "__main__":
             print "Error: exception caught during call to btsim_navobs;"
             print "dropping this trial, and inserting marked copy into results list."
             times.append((-1, -1, -1))
-            worlds_data.append((dump_world(W, goal_list, init_list, env_init_list), block_ind))
+            archive.append(W, goal_list, init_list, env_init_list,
+                           data=times[-1]+tuple(block_ind))
             continue
         if aut_patched is None:
             patch_time = -1  # -1 time indicates global problem recovered
@@ -143,18 +169,17 @@ if __name__ == "__main__":
             patch_time = btprof.getstats()[ind].totaltime
 
             aut_patched.writeDotFileCoord("tempsyn-PATCHED.dot")
-            with open("tempsyn-PATCHED.gexf", "w") as f:
-                f.write(cg.dumpGexf(aut_patched,
-                                    use_viz=True, use_clusters=True))
+            aut_patched.writeGexf("tempsyn-PATCHED.gexf")
             print "Size after patching (in nodes):", aut_patched.size()
 
         game_count += 1
         times.append((nom_time, global_time, patch_time))
-        worlds_data.append((dump_world(W, goal_list, init_list, env_init_list), block_ind))
-        print "Backing up progress..."
-        with open(sys.argv[1], "w") as f:
-            pickle.dump((times, worlds_data), f)
+        archive.append(W, goal_list, init_list, env_init_list,
+                       data=times[-1]+tuple(block_ind))
+        if game_count == num_games:
+            break
 
+    pool.close()
+    pool.join()
     print "\n".join([str(nom_time)+", "+str(global_time)+", "+str(patch_time) for (nom_time, global_time, patch_time) in times])
-    with open(sys.argv[1], "w") as f:
-        pickle.dump((times, worlds_data), f)
+    archive.close()
@@ -0,0 +1,199 @@
+"""
+Tests for BTAutomaton and related routines.
+
+SCL; 2012.
+"""
+
+import os
+import shutil
+import tempfile
+from btsynth.btsynth import *
+
+
+def example_aut():
+    """Three-node automaton with memory, conditionals, rules and tags."""
+    aut = BTAutomaton()
+    aut.addAutNode(BTAutomatonNode(id=0, state={"Y_0_0": 1, "Y_0_1": 0},
+                                   transition=[1, 5], cond=[cond_anynot, cond_all]))
+    aut.addAutNode(BTAutomatonNode(id=1, state={"Y_0_0": 0, "Y_0_1": 1},
+                                   transition=[0], rule=rule_setmatch,
+                                   tags={"color": (1, 2, 3, 0.5), "cluster_id": 0}))
+    aut.addAutNode(BTAutomatonNode(id=5, state={"Y_0_0": 1},
+                                   transition=[], rule=rule_clearall))
+    aut.memInit(["Y_0_1"])
+    aut.memSet("Y_0_1", 1)
+    return aut
+
+def autb_test():
+    aut = example_aut()
+    dirname = tempfile.mkdtemp()
+    try:
+        write_autb(aut, os.path.join(dirname, "a"))
+        for mmap in [True, False]:
+            aut_b = read_autb(os.path.join(dirname, "a"), mmap=mmap)
+            assert aut_b.memory == aut.memory
+            for (node, node_b) in zip(aut.states, aut_b.states):
+                assert (node.id, node.state, node.transition, node.cond, node.rule, node.tags) \
+                    == (node_b.id, node_b.state, node_b.transition, node_b.cond, node_b.rule, node_b.tags)
+        arrays = AutomatonArrays(os.path.join(dirname, "a"))
+        assert arrays.size() == 3 and arrays.getAutState(3) == -1
+        assert arrays.getAutState(5).state == {"Y_0_0": 1}
+        # A cond list shorter than transition is read back padded
+        # with None, without shifting the guards of later nodes.
+        aut.states[0].cond = [cond_all]
+        aut.states[1].cond = [cond_anynot]
+        write_autb(aut, os.path.join(dirname, "a"))
+        aut_b = read_autb(os.path.join(dirname, "a"))
+        assert [node.cond for node in aut_b.states] == [[cond_all, None], [cond_anynot], []]
+        aut.states[0].cond = [cond_anynot, cond_all]
+        aut.states[0].cond[0] = lambda memory: True
+        try:
+            write_autb(aut, os.path.join(dirname, "a"))
+            assert False
+        except ValueError:
+            pass
+    finally:
+        shutil.rmtree(dirname)
+
+def read_jtlv_aut_test():
+    from StringIO import StringIO
+    aut = read_jtlv_aut(StringIO("State 0 with rank 0 -> <e.X_0_0_1:0, s.Y_0_0:1>\n"
+                                 "	With successors : 1, 0\n"
+                                 "State 1 with rank 1 -> <e.X_0_0_1:true, s.Y_0_0:0>\n"
+                                 "	With no successors.\n"))
+    assert [(node.id, node.state, node.transition, node.cond) for node in aut.states] \
+        == [(0, {"X_0_0_1": 0, "Y_0_0": 1}, [1, 0], [None, None]),
+            (1, {"X_0_0_1": 1, "Y_0_0": 0}, [], [])]
+
+def read_gr1c_aut_test():
+    from StringIO import StringIO
+    header = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+              '<tulipcon xmlns="http://tulip-control.sourceforge.net/ns/0" version="0">\n'
+              '  <env_vars><item key="x" value="boolean" /></env_vars>\n'
+              '  <sys_vars><item key="y" value="boolean" /><item key="z" value="boolean" /></sys_vars>\n'
+              '  <aut type="basic">\n')
+    for (state0, state1) in [(" 0 1 0", " 1 0 1"), ("010", "101")]:
+        aut = read_gr1c_aut(StringIO(header
+                                     +'    <node><id>0</id><anno>0 0</anno><child_list> 1</child_list>'
+                                     +'<state>'+state0+'</state></node>\n'
+                                     +'    <node><id>1</id><anno>0 1</anno><child_list> 0 1</child_list>'
+                                     +'<state>'+state1+'</state></node>\n'
+                                     +'  </aut>\n</tulipcon>\n'),
+                            decode=lambda state: dict(state.items()+[("w", 0)]))
+        assert [(node.id, node.state, node.transition) for node in aut.states] \
+            == [(0, {"x": 0, "y": 1, "z": 0, "w": 0}, [1]),
+                (1, {"x": 1, "y": 0, "z": 1, "w": 0}, [0, 1])]
+
+def export_test():
+    import xml.etree.cElementTree as ET
+    aut = example_aut()
+    aut.importChildAut(example_aut(), tags={"cluster_id": 7, "color": (0, 0, 255)})
+    (fd, fname) = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        assert aut.writeDotFileCoord(fname, collapseClusters=True)
+        with open(fname, "r") as f:
+            dot = f.read()
+        # Edges within cluster 7 are dropped, and it has no others
+        assert dot.count("cluster 0;\\n 1 nodes") == 2 and dot.count("cluster 7") == 0
+        assert aut.writeGexf(fname, collapseClusters=True)
+        gexf = ET.parse(fname).getroot()
+        node_ids = [node.get("id") for node in gexf.iter("{http://www.gexf.net/1.2draft}node")]
+        assert node_ids == ["0", "c0", "5", "c7"]
+        assert len(list(gexf.iter("{http://www.gexf.net/1.2draft}edge"))) == 3
+        assert aut.writeGexf(fname)
+        gexf = ET.parse(fname).getroot()
+        assert len(list(gexf.iter("{http://www.gexf.net/1.2draft}edge"))) == 6
+    finally:
+        os.remove(fname)
+
+def minimize_test():
+    aut = BTAutomaton()
+    # 0 is initial; 1 -> 2 -> 1 and 3 -> 4 -> 3 are copies of a cycle,
+    # but 5 differs from 1 by the conditional on its transition.
+    for (node_id, y, transition, cond) in [(0, 0, [1, 3, 5], [None, None, cond_all]),
+                                           (1, 1, [2], [None]), (2, 0, [1], [None]),
+                                           (3, 1, [4], [None]), (4, 0, [3], [None]),
+                                           (5, 1, [2], [cond_all])]:
+        aut.addAutNode(BTAutomatonNode(id=node_id, state={"Y_0_0": y},
+                                       transition=transition, cond=cond))
+    id_map = aut.minimize()
+    assert id_map == {0: 0, 1: 1, 2: 2, 3: 1, 4: 2, 5: 5}
+    assert [(node.id, node.transition) for node in aut.states] \
+        == [(0, [1, 1, 5]), (1, [2]), (2, [1]), (5, [2])]
+    assert aut.states[3].cond == [cond_all]
+
+def trim_unconnected_test():
+    aut = example_aut()
+    # 6 <-> 7 is a cycle unreachable from the initial node 0.
+    aut.addAutNode(BTAutomatonNode(id=6, state={"Y_0_0": 0}, transition=[7, 0]))
+    aut.addAutNode(BTAutomatonNode(id=7, state={"Y_0_0": 0}, transition=[6]))
+    assert aut.trimUnconnectedStates([aut.states[0]]) == 2
+    assert [node.id for node in aut.states] == [0, 1, 5]
+    # Node 0 is on the cycle 0 <-> 1, so getAutInit() finds nothing;
+    # an empty S0 must not remove everything.
+    assert aut.trimUnconnectedStates() == 0
+    assert aut.trimUnconnectedStates([]) == 0
+    assert [node.id for node in aut.states] == [0, 1, 5]
+
+def rollback_test():
+    aut = example_aut()
+    dump = lambda aut: ([(node.id, dict(node.state), node.transition[:], len(node.cond), node.rule)
+                         for node in aut.states], dict(aut.getMem()))
+    orig = dump(aut)
+    orig_nodes = list(aut.states)
+    snap = aut.snapshot()
+    aut.removeNode(1)
+    aut.memSet("Y_0_1", 0)
+    aut.addAutNode(BTAutomatonNode(id=9, state={"Y_0_0": 1}, transition=[0]))
+    inner = aut.snapshot()
+    aut.packIDs()
+    aut.editNode(0).transition.append(0)
+    aut.rollback(inner)
+    assert [node.id for node in aut.states] == [0, 5, 9]
+    aut.allRule(rule_clearall)
+    aut.rollback(snap)
+    assert dump(aut) == orig
+    assert all([a is b for (a, b) in zip(aut.states, orig_nodes)])
+
+def journal_test():
+    dump = lambda aut: ([(node.id, node.state, node.transition, node.cond, node.rule, node.tags)
+                         for node in aut.states], aut.getMem())
+    tmpdir = tempfile.mkdtemp()
+    try:
+        dirname = os.path.join(tmpdir, "aut")
+        aut = example_aut()
+        aut.openJournal(dirname, compact_ratio=None)
+        id_map = aut.importChildAut(example_aut(), tags={"cluster_id": 1})
+        node = aut.editNode(id_map[5])
+        node.transition.append(0)
+        node.cond.append(cond_anynot)
+        aut.removeNode(1)
+        aut.packIDs()
+        aut.memInit(["Y_0_0"])
+        aut.flushJournal()
+        assert dump(read_autb(dirname)) == dump(aut)
+
+        # Changes undone before being written are dropped from journal
+        snap = aut.snapshot()
+        aut.editNode(0).transition = []
+        aut.minimize()
+        aut.rollback(snap)
+        aut.trimUnconnectedStates([aut.states[0]])
+        aut.flushJournal()
+        assert dump(read_autb(dirname)) == dump(aut)
+        assert len(read_journal(dirname)) > 0
+
+        aut.compactJournal()
+        assert len(read_journal(dirname)) == 0
+        assert dump(read_autb(dirname)) == dump(aut)
+        aut.closeJournal()
+
+        # Continue journal of a loaded automaton
+        aut = read_autb(dirname)
+        aut.openJournal(dirname, append=True)
+        aut.allRule(rule_clearall)
+        aut.closeJournal()
+        assert dump(read_autb(dirname)) == dump(aut)
+    finally:
+        shutil.rmtree(tmpdir)
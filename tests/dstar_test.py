@@ -0,0 +1,22 @@
+"""
+Tests for incremental planning on gridworlds.
+
+SCL; 2012.
+"""
+
+import numpy as np
+from btsynth.gridworld import grid_path
+from btsynth.dstar import DStarLite
+
+
+def block_replan_test():
+    W = np.zeros((3, 4), dtype=np.uint8)
+    W[1][1] = 1
+    planner = DStarLite(W, (2, 3))
+    assert len(planner.plan((0, 0))) == 6
+    planner.block((0, 1))
+    path = planner.plan((1, 0))
+    assert len(path) == len(grid_path(planner.W, (1, 0), (2, 3)))
+    assert (0, 1) not in path
+    planner.block((2, 0))
+    assert planner.plan((1, 0)) is None
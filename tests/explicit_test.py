@@ -0,0 +1,27 @@
+"""
+Tests for the explicit-state GR(1) solver.
+
+SCL; 2012.
+"""
+
+import numpy as np
+from btsynth.explicit import *
+
+
+def corridor_test():
+    W = np.zeros((1, 5), dtype=np.uint8)
+    # Obstacle can camp in the middle of the corridor.
+    assert not synthesize([(0, 0)], [(0, 4), (0, 0)], W, env_init_list=[(0, 2)],
+                          only_realizability=True)
+    assert synthesize([(0, 0)], [(0, 1)], W, env_init_list=[(0, 3)],
+                      only_realizability=True)
+    assert synthesize([(0, 0)], [(0, 4)], W, only_realizability=True)
+
+def nocollision_test():
+    W = np.zeros((3, 3), dtype=np.uint8)
+    aut = synthesize([(0, 0)], [(2, 2), (0, 0)], W, env_init_list=[(1, 1)])
+    assert aut is not None
+    for node in aut.states:
+        for (i, j) in [(i, j) for i in range(3) for j in range(3)]:
+            assert not (node.state["Y_"+str(i)+"_"+str(j)]
+                        and node.state["X_0_"+str(i)+"_"+str(j)])
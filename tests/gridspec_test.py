@@ -0,0 +1,89 @@
+"""
+Tests for structured gridworld specifications.
+
+SCL; 2012.
+"""
+
+import StringIO
+import numpy as np
+from btsynth.gridspec import *
+
+
+def navobs_spec_test():
+    W = np.array([[1, 0, 1],
+                  [0, 0, 0]], dtype=np.uint8)
+    spec = navobs_spec([(1, 0)], [(1, 2)], W, env_init_list=[(0, 1)])
+    assert spec == navobs_spec([(1, 0)], [(1, 2)], W, env_init_list=[(0, 1)])
+    assert len(set([spec, navobs_spec([(1, 0)], [(1, 2)], W, env_init_list=[(0, 1)])])) == 1
+    assert spec != navobs_spec([(1, 0)], [(0, 1)], W, env_init_list=[(0, 1)])
+    assert "X_0_n_n" in spec.env_vars
+    assert len(spec.sys_vars) == 4
+    assert "Y_0_0" in spec.hidden_vars and "X_0_0_2" in spec.hidden_vars
+    f = StringIO.StringIO()
+    spec.dump_gr1c(f)
+    out = f.getvalue()
+    assert "[](Y_1_0 -> (Y_1_0' | Y_1_1'))" in out
+    assert "Y_0_0" not in out
+    assert "[](!(Y_0_1' & X_0_0_1'))" in out
+    assert "SYSGOAL:\n[]<>(Y_1_2);" in out
+
+def int_encoding_test():
+    W = np.array([[1, 0, 1],
+                  [0, 0, 0]], dtype=np.uint8)
+    spec = navobs_spec([(1, 0)], [(1, 2)], W, env_init_list=[(0, 1)],
+                       encoding="int")
+    f = StringIO.StringIO()
+    spec.dump_gr1c(f)
+    out = f.getvalue()
+    assert "SYS: Y [0,5];" in out
+    assert "X_0_0_1" not in out
+    assert "[]((Y = 3) -> ((Y' = 3) | (Y' = 4)))" in out
+    state = spec.decode_state({"Y": 4, "X_0": 6})
+    assert state["Y_1_1"] == 1 and state["X_0_n_n"] == 1
+    assert sum(state.values()) == 2
+    assert len(state) == len(spec.env_vars)+len(spec.sys_vars)+len(spec.hidden_vars)
+
+
+def unreachable_test():
+    W = np.array([[0, 0, 1, 0],
+                  [1, 0, 1, 0],
+                  [0, 0, 0, 1]], dtype=np.uint8)
+    assert reachable_cells(W, [(0, 0)]) == set([(0, 0), (0, 1), (1, 1), (2, 0),
+                                                (2, 1), (2, 2)])
+    spec = navobs_spec([(0, 0)], [(2, 2)], W, env_init_list=[(0, 3)])
+    assert "Y_0_3" in spec.hidden_vars and "Y_1_3" in spec.hidden_vars
+    assert "X_0_1_3" in spec.env_vars and "X_0_n_n" in spec.env_vars
+    assert "Y_0_3" not in spec.sys_vars
+
+def session_test():
+    W = np.array([[0, 0, 0, 0],
+                  [0, 1, 1, 0],
+                  [0, 0, 0, 0]], dtype=np.uint8)
+    session = WorldSession(W)
+    for goal in [(2, 3), (0, 3), (1, 0)]:
+        assert session.spec([(0, 0)], [goal], env_init_list=[(2, 1)]) == navobs_spec([(0, 0)], [goal], W, env_init_list=[(2, 1)])
+    session.set_cell((0, 2), 1)
+    W[0][2] = 1
+    assert session.spec([(0, 0)], [(2, 3)], env_init_list=[(2, 1)]) == navobs_spec([(0, 0)], [(2, 3)], W, env_init_list=[(2, 1)])
+    session.set_cell((2, 2), 1)
+    W[2][2] = 1
+    spec = session.spec([(0, 0)], [(0, 1)])
+    assert spec == navobs_spec([(0, 0)], [(0, 1)], W)
+    assert "Y_2_3" in spec.hidden_vars
+    try:
+        session.check(np.zeros(W.shape, dtype=np.uint8))
+        assert False
+    except ValueError:
+        pass
+    session.check(W, var_prefix="Y")
+
+def obs_outside_window_test():
+    # The restricted region of the obstacle (rows and columns 1-3) is
+    # not clipped, so there is no "nowhere" to start it at.
+    W = np.zeros((5, 5), dtype=np.uint8)
+    try:
+        navobs_spec([(4, 4)], [(4, 0)], W, env_init_list=[(0, 0)],
+                    env_goal_list=[(2, 2)])
+        assert False
+    except ValueError:
+        pass
@@ -29,3 +29,145 @@ E 0 6
     assert goal_list == dgoal_list
     assert init_list == dinit_list
     assert env_list == denv_list
+
+def grid_path_test():
+    W = np.array([[0, 0, 0],
+                  [1, 1, 0],
+                  [0, 0, 0]], dtype=np.uint8)
+    dist = dist_field(W, [(2, 0)])
+    assert dist[0][0] == 6
+    assert dist[1][0] == -1
+    path = grid_path(W, (0, 0), (2, 0))
+    assert len(path) == 7
+    assert path[0] == (0, 0) and path[-1] == (2, 0)
+    W[1][2] = 1
+    assert grid_path(W, (0, 0), (2, 0)) is None
+
+def LTL_world_test():
+    W = np.array([[0, 0, 0],
+                  [0, 1, 0]], dtype=np.uint8)
+    trans = LTL_world(W, var_prefix="Y")
+    assert "Y_0_1 -> (Y_0_1' | Y_0_0' | Y_0_2')" in trans
+    assert "!(Y_1_1')" in trans
+    assert trans[-1].startswith("(Y_0_0' & (!Y_0_1') & (!Y_0_2') & (!Y_1_0') & (!Y_1_2'))")
+    # Memoized result is not affected by changes to the returned list
+    trans.append("foo")
+    assert LTL_world(W, var_prefix="Y") == trans[:-1]
+    W[0][1] = 1
+    assert "!(Y_0_1')" in LTL_world(W, var_prefix="Y")
+    assert "[](X_n_n -> next(X_n_n | X_0_0 | X_0_1 | X_0_2))" in LTL_world_JTLV(W, var_prefix="X", center_loc=(0, 1))
+    trans = LTL_world(W, var_prefix="X", center_loc=(0, 1), encoding="int")
+    assert "(X = 6) -> ((X' = 6) | (X' = 0) | (X' = 2))" in trans
+    assert "!((X' = 1))" in trans
+
+def world_test():
+    W = np.array([[0, 0, 1, 0],
+                  [0, 1, 1, 0],
+                  [0, 0, 1, 0]], dtype=np.uint8)
+    world = World(W, goal_list=[(2, 3)], init_list=[(0, 0)])
+    (indptr, indices) = world.adjacency()
+    assert len(indptr) == len(world.free_cells())+1
+    assert list(indices[indptr[0]:indptr[1]]) == [3, 1]  # (1,0) and (0,1)
+    comp = world.components()
+    assert comp[0][0] == comp[2][1] and comp[0][0] != comp[0][3]
+    dist = dist_field(world, [(2, 3)])
+    assert dist[0][3] == 2 and dist[0][0] == -1
+    world.set_cell((0, 0), 1)  # Not reachable from (2, 3)
+    assert dist_field(world, [(2, 3)]) is dist
+    world.set_cell((2, 2), 0)
+    assert np.all(dist_field(world, [(2, 3)]) == dist_field(W.copy(), [(2, 3)]))
+    assert world.components()[2][1] == world.components()[0][3]
+    assert grid_path(world, (1, 0), (2, 3)) == [(1, 0), (2, 0), (2, 1), (2, 2), (2, 3)]
+
+def patch_radius_test():
+    W = np.zeros((7, 9), dtype=np.uint8)
+    W[2, 1:8] = 1
+    W[4, 1:8] = 1
+    W[3, 4] = 1  # Blocks corridor; detour is around the wall ends
+    assert patch_radius(W, (3, 4), (3, 3), [(3, 5)]) == 4
+    assert patch_radius(W, (3, 4), (3, 3), [(3, 3)]) == 1
+    W[:, 0] = 1
+    W[:, 8] = 1
+    assert patch_radius(W, (3, 4), (3, 3), [(3, 5)]) is None
+
+def patch_region_test():
+    W = np.zeros((5, 5), dtype=np.uint8)
+    W[1, 1:4] = 1
+    assert len(patch_region(W, (2, 2), 1)) == 9
+    assert patch_region(W, (2, 2), 1, shape="manhattan") == [(1, 2), (2, 1), (2, 2), (2, 3), (3, 2)]
+    assert patch_region(W, (0, 2), 1, shape="flood") == [(0, 1), (0, 2), (0, 3)]
+    assert (2, 0) not in patch_region(W, (2, 2), 2, shape="corridor", route=[(2, 3), (2, 4)])
+    (W_patch, offset) = subworld(W, patch_region(W, (2, 2), 1, shape="manhattan"), mask=True)
+    assert offset == (1, 1) and W_patch[0][0] == 1 and W_patch[2][1] == 0
+    r = max_patch_radius(W)
+    for shape in ["square", "manhattan", "flood", "corridor"]:
+        assert (patch_region(W, (0, 2), r, shape=shape, route=[(0, 2)])
+                == patch_region(W, (0, 2), 10*r, shape=shape, route=[(0, 2)]))
+
+def precheck_test():
+    W = np.array([[0, 0, 0, 0, 0],
+                  [1, 1, 0, 1, 1],
+                  [0, 0, 0, 0, 0]], dtype=np.uint8)
+    assert precheck(W, [(0, 0)], [(2, 4)]) is None
+    assert precheck(np.ones((2, 2), dtype=np.uint8), [(0, 0)], [(1, 1)]) is not None
+    W_cut = W.copy()
+    W_cut[1][2] = 1
+    assert precheck(W_cut, [(0, 0)], [(2, 4)]).startswith("goals")
+    assert precheck(W_cut, [(0, 0), (2, 0)], [(2, 4)]) is None
+    # Obstacle can remain in the only passage between goals
+    assert precheck(W, [(0, 0)], [(0, 0), (2, 4)], env_init_list=[(1, 2)]).startswith("obstacle")
+    assert precheck(W, [(0, 0)], [(2, 0), (2, 4)], env_init_list=[(1, 2)]) is None
+
+def random_world_test():
+    (W, goal_list, init_list, env_list) = random_world((6, 8), wall_density=.25,
+                                                       num_goals=2, num_env=2, seed=4)
+    assert W.shape == (6, 8) and W.sum() == 12
+    cells = goal_list+init_list+env_list
+    assert len(set(cells)) == 5 and all([W[i][j] == 0 for (i, j) in cells])
+    assert random_world((6, 8), .25, 2, 2, seed=4)[1] == goal_list
+    (Ws, goals, inits, envs) = random_worlds(3, (6, 8), .25, 2, 2, seed=4)
+    assert Ws.shape == (3, 6, 8) and goals.shape == (3, 2, 2) and envs.shape == (3, 2, 2)
+    assert np.all(random_worlds(3, (6, 8), .25, 2, 2, seed=4)[0] == Ws)
+
+def worldb_test():
+    import os, tempfile
+    (W, goal_list, init_list, env_list) = random_world((7, 5), num_goals=2, num_env=1, seed=1)
+    (fd, fname) = tempfile.mkstemp(suffix=".bw")
+    os.close(fd)
+    try:
+        write_worldb(fname, W, goal_list, init_list, env_list)
+        for mmap in [False, True]:
+            (bW, bgoal_list, binit_list, benv_list) = read_worldb(fname, mmap=mmap)
+            assert np.all(bW == W) and bW.shape == W.shape
+            assert (bgoal_list, binit_list, benv_list) == (goal_list, init_list, env_list)
+        (W_patch, offset) = subworld(bW, [(1, 1), (3, 2)])
+        assert W_patch.base is not None and np.all(W_patch == W[1:4, 1:3])
+    finally:
+        os.remove(fname)
+
+def archive_test():
+    import os, tempfile
+    from btsynth.archive import WorldArchiveWriter, WorldArchiveReader
+    (fd, fname) = tempfile.mkstemp(suffix=".bwa")
+    os.close(fd)
+    worlds = [random_world((3+k, 4+2*k), num_goals=2, num_env=k%2, seed=k) for k in range(5)]
+    try:
+        writer = WorldArchiveWriter(fname)
+        for k in range(3):
+            writer.append(*worlds[k], data=[k, .5])
+        # Not closed, so reader must rebuild the index by scanning
+        assert len(WorldArchiveReader(fname)) == 3
+        writer.close()
+        with WorldArchiveWriter(fname, append=True) as writer:
+            for k in range(3, 5):
+                writer.append(*worlds[k], data=[k, .5])
+        reader = WorldArchiveReader(fname)
+        assert len(reader) == 5
+        for k in [4, 0, 2, -2]:
+            (W, goal_list, init_list, env_list, data) = reader[k]
+            assert np.all(W == worlds[k][0]) and W.shape == worlds[k][0].shape
+            assert (goal_list, init_list, env_list) == worlds[k][1:]
+            assert list(data) == [k % 5, .5] and list(reader.data(k)) == list(data)
+        reader.close()
+    finally:
+        os.remove(fname)
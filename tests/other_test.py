@@ -4,8 +4,89 @@ Tests for functions not otherwise specified.
 SCL; 2011.
 """
 
+import numpy as np
 from btsynth.btsynth import *
 
 
 def prefix_filt_test():
     assert prefix_filt({"Y_0_0": 0, "Y_0_1": 1, "X_0_1_0": 1}, "Y") == {"Y_0_0": 0, "Y_0_1": 1}
+
+def screen_realizability_test():
+    W = np.zeros((1, 5), dtype=np.uint8)
+    worlds = [(W, [(0, 4), (0, 0)], [(0, 0)], [(0, 2)]),  # Obstacle can camp
+              (W, [(0, 1)], [(0, 0)], [(0, 3)]),
+              World(W, goal_list=[(0, 4)], init_list=[(0, 0)])]
+    for num_workers in [1, 2]:
+        (mask, times) = screen_realizability(iter(worlds), num_workers=num_workers,
+                                             backend="explicit")
+        assert list(mask) == [False, True, True]
+        assert len(times) == 3 and np.all(times >= 0)
+
+def btsim_d_init_on_cycle_test():
+    # The init cell is also a goal, so the initial node is on a cycle.
+    W = np.zeros((3, 7), dtype=np.uint8)
+    goal_list = [(1, 0), (1, 6)]
+    aut = gen_dsoln([(1, 0)], goal_list, W, backend="graph")
+    W_actual = W.copy()
+    W_actual[1][3] = 1
+    (aut, W_known) = btsim_d((1, 0), goal_list, aut, W_actual, num_steps=30,
+                             backend="graph")
+    assert aut is not None and aut.size() > 0
+    assert len(aut.findAllAutPartState({"Y_1_0": 1})) > 0
+
+def btsim_d_init_in_region_test():
+    # The initial node is on a cycle (not a goal), and lies in the
+    # region patched around (2, 2), so it needs a local problem.
+    W = np.array([[0, 0, 1, 0, 0, 0],
+                  [0, 0, 1, 0, 0, 0],
+                  [0, 0, 0, 0, 0, 0],
+                  [0, 0, 0, 0, 0, 1],
+                  [1, 0, 0, 0, 0, 0]], dtype=np.uint8)
+    goal_list = [(1, 1), (4, 3)]
+    aut = gen_dsoln([(2, 3)], goal_list, W, backend="explicit")
+    W_actual = W.copy()
+    W_actual[1][0] = 1
+    W_actual[2][2] = 1
+    (aut, W_known) = btsim_d((2, 3), goal_list, aut, W_actual, num_steps=60,
+                             backend="explicit")
+    assert aut is not None
+    assert len(aut.findAllAutPartState({"Y_2_3": 1})) > 0
+
+def btsim_d_flood_exhausted_test():
+    # The flood region fills its component, which does not reach the
+    # nodes on (1, 1), so larger radii give no new region.
+    W = np.zeros((3, 7), dtype=np.uint8)
+    W[2][:] = 1
+    W[2][4] = 0
+    goal_list = [(2, 4), (1, 0)]
+    aut = gen_dsoln([(1, 3)], goal_list, W, backend="explicit")
+    W_actual = W.copy()
+    W_actual[1][4] = 1
+    W_actual[1][1] = 1
+    assert btsim_d((1, 3), goal_list, aut, W_actual, num_steps=30,
+                   backend="explicit", region="flood") == (None, None)
+
+def checkpoint_test():
+    import tempfile, shutil, os
+    W = np.zeros((5, 5), dtype=np.uint8)
+    W[4][1:3] = 1
+    goal_list = [(0, 0), (0, 3)]
+    aut = gen_dsoln([(2, 2)], goal_list, W, backend="explicit")
+    W_actual = W.copy()
+    W_actual[0][1] = 1
+    tmpdir = tempfile.mkdtemp()
+    try:
+        dirname = os.path.join(tmpdir, "ckpt")
+        result = btsim_d((2, 2), goal_list, aut, W_actual, num_steps=20,
+                         backend="explicit", checkpoint=dirname)
+        assert os.path.exists(os.path.join(dirname, "state"))
+        # The last checkpoint is at the start of the last step, so
+        # resuming it repeats that step and ends the same way.
+        resumed = resume_btsim(dirname)
+        assert (resumed[0] is None) == (result[0] is None)
+        if result[0] is not None:
+            assert [(node.id, node.state, node.transition) for node in resumed[0].states] \
+                == [(node.id, node.state, node.transition) for node in result[0].states]
+        assert np.all(resumed[1] == result[1])
+    finally:
+        shutil.rmtree(tmpdir)
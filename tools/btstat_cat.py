@@ -2,26 +2,40 @@
 """
 Concatenate files containing trial data.
 
+The output is a world archive (cf. btsynth.archive); inputs may be
+archives or pickles from earlier versions of gridworld_stats.py.
+
 SCL; Feb 2012.
 """
 
 import sys
 import pickle
 
+from btsynth import read_world
+from btsynth.archive import ARCHIVE_MAGIC, WorldArchiveReader, WorldArchiveWriter
+
 
 if __name__ == "__main__":
     if len(sys.argv) < 3:
         print "Usage: %s FILE1 [...] OUTPUT" % sys.argv[0]
         exit(1)
 
-    times = []
-    world_data = []
+    print "Writing combined set to %s..." % sys.argv[-1]
+    archive = WorldArchiveWriter(sys.argv[-1])
     for file_index in range(len(sys.argv)-2):
         print "Reading %s..." % sys.argv[file_index+1]
-        with open(sys.argv[file_index+1], "r") as f:
-            (this_times, this_world_data) = pickle.load(f)
-        times.extend(this_times)
-        world_data.extend(this_world_data)
-    print "Writing combined set to %s..." % sys.argv[-1]
-    with open(sys.argv[-1], "w") as f:
-        pickle.dump((times, world_data), f)
+        with open(sys.argv[file_index+1], "rb") as f:
+            is_archive = (f.read(len(ARCHIVE_MAGIC)) == ARCHIVE_MAGIC)
+        if is_archive:
+            reader = WorldArchiveReader(sys.argv[file_index+1])
+            for (W, goal_list, init_list, env_init_list, data) in reader:
+                archive.append(W, goal_list, init_list, env_init_list, data=data)
+            reader.close()
+        else:
+            with open(sys.argv[file_index+1], "r") as f:
+                (times, world_data) = pickle.load(f)
+            for k in range(len(world_data)):
+                (W, goal_list, init_list, env_init_list) = read_world(world_data[k][0])
+                archive.append(W, goal_list, init_list, env_init_list,
+                               data=tuple(times[k])+tuple(world_data[k][1]))
+    archive.close()
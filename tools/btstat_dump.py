@@ -8,6 +8,32 @@ import pickle
 import numpy as np
 
 from btsynth import pretty_world, read_world, dump_world
+from btsynth.archive import ARCHIVE_MAGIC, WorldArchiveReader
+
+
+def open_trials(fname):
+    """Return (times, get_trial) for trial data in file fname.
+
+    get_trial(k) returns (W, goal_list, init_list, env_init_list,
+    block_ind) for trial k, reading only that trial from a world
+    archive.  Pickles from earlier versions of gridworld_stats.py are
+    also accepted.
+    """
+    with open(fname, "rb") as f:
+        is_archive = (f.read(len(ARCHIVE_MAGIC)) == ARCHIVE_MAGIC)
+    if is_archive:
+        reader = WorldArchiveReader(fname)
+        times = [tuple(reader.data(k)[:3]) for k in range(len(reader))]
+        def get_trial(k):
+            (W, goal_list, init_list, env_init_list, data) = reader[k]
+            return (W, goal_list, init_list, env_init_list,
+                    (int(data[3]), int(data[4])))
+        return times, get_trial
+    with open(fname, "r") as f:
+        (times, world_data) = pickle.load(f)
+    def get_trial(k):
+        return read_world(world_data[k][0])+(world_data[k][1],)
+    return times, get_trial
 
 
 USAGE = "Usage: %s FILE [n]" % sys.argv[0]
@@ -15,13 +41,12 @@ if __name__ == "__main__":
     if len(sys.argv) < 2:
         print USAGE
         exit(1)
-    with open(sys.argv[1], "r") as f:
-        (times, world_data) = pickle.load(f)
+    (times, get_trial) = open_trials(sys.argv[1])
 
     # Mark failures (caught exception during execution) to avoid
     # counting them as valid trial data.
     valid_trials = []
-    for trial in range(len(world_data)):
+    for trial in range(len(times)):
         if times[trial][0] >= 0:
             valid_trials.append(trial)
 
@@ -39,15 +64,16 @@ if __name__ == "__main__":
         req_trial = None  # Indicate we are interested in all trials
 
     if req_trial is not None:
-        (W, goal_list, init_list, env_init_list) = read_world(world_data[req_trial][0])
+        (W, goal_list, init_list, env_init_list, block_ind) = get_trial(req_trial)
         print "Trial "+str(req_trial)
         print "Nominal: %.4f; Global %.4f; Patching %.4f" % times[req_trial]
         print pretty_world(W, goal_list, init_list, env_init_list, show_grid=True)
-        W[world_data[req_trial][1][0]][world_data[req_trial][1][1]] = 1
+        nominal_dump = dump_world(W, goal_list, init_list, env_init_list)
+        W[block_ind[0]][block_ind[1]] = 1
         print pretty_world(W, goal_list, init_list, env_init_list, show_grid=True)
         print "#"*60
         print "# NOMINAL"
-        print world_data[req_trial][0]
+        print nominal_dump
 
         print "#"*60
         print "# ACTUAL"
@@ -61,11 +87,11 @@ if __name__ == "__main__":
         # if times[trial][2] > times[trial][1]:
         #     patho_trials.append(trial)
 
-        (W, goal_list, init_list, env_init_list) = read_world(world_data[trial][0])
+        (W, goal_list, init_list, env_init_list, block_ind) = get_trial(trial)
         print "Trial "+str(trial)
         print "Nominal: %.4f; Global %.4f; Patching %.4f" % times[trial]
         print pretty_world(W, goal_list, init_list, env_init_list, show_grid=True)
-        W[world_data[trial][1][0]][world_data[trial][1][1]] = 1
+        W[block_ind[0]][block_ind[1]] = 1
         print pretty_world(W, goal_list, init_list, env_init_list, show_grid=True)
         print "#"*60+"\n"
 
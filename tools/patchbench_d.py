@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+"""
+Compare patch latency of repair engines for btsim_d, on the same
+deterministic problem.
+
+SCL; 2012.
+"""
+
+import sys
+import time
+import copy
+
+from btsynth import *
+
+
+USAGE = "Usage: %s FILE-NOM FILE-REAL [backend]" % sys.argv[0]
+if __name__ == "__main__":
+    if len(sys.argv) != 3 and len(sys.argv) != 4:
+        print USAGE
+        exit(1)
+    if len(sys.argv) == 4:
+        backend = sys.argv[3]
+    else:
+        backend = "gr1c"
+
+    (W, goal_list, init_list, env_init_list) = read_worldf(sys.argv[1])
+    (W_actual, goal_list_actual, init_list_actual, env_init_list_actual) = read_worldf(sys.argv[2])
+
+    aut = gen_dsoln(init_list=init_list, goal_list=goal_list, W=W,
+                    backend=backend)
+    if aut is None:
+        print "Nominal spec not feasible."
+        exit(1)
+    aut.trimDeadStates()
+    print "Nominal solution automaton M has %d nodes." % aut.size()
+
+    for engine in ["patch", "dstar"]:
+        aut_copy = copy.deepcopy(aut)
+        start_time = time.time()
+        (aut_patched, W_known) = btsim_d(init_list[0], goal_list, aut_copy,
+                                         W_actual, num_steps=100,
+                                         backend=backend, engine=engine, W=W)
+        elapsed = time.time()-start_time
+        if aut_patched is None:
+            print "%s: failed to patch (%.4f s)" % (engine, elapsed)
+        else:
+            print "%s: %.4f s; size after patching (in nodes): %d" % (engine, elapsed,
+                                                                     aut_patched.size())